@@ -1,75 +1,339 @@
-from openai import OpenAI
+from openai import OpenAI, DefaultHttpxClient, RateLimitError
 import os
+import time
 from profile_manager import ProfileManager
 from summary_manager import SummaryManager
-from PyPDF2 import PdfReader
-import mimetypes
+from document_manager import DocumentManager, ExtractionCancelled
+from extractors import UnsupportedFormat
+from model_router import ModelRouter
+from usage_ledger import UsageLedger, BudgetExceeded, DEFAULT_COMPLETION_TOKENS
+from structured_store import StructuredSummaryStore, LIST_FIELDS
+from citation_graph import CitationGraph
+from cassette import create_transport
+from rate_limiter import RateLimiter
+from revision_store import RevisionStore, diff_sections
+import logging
+import threading
+import re
+import json
 from dotenv import load_dotenv
 
 load_dotenv();
 
+# Set SCISIFT_CASSETTE_MODE to record model calls or replay them without the network
+cassette_transport = create_transport()
+replay_only = cassette_transport is not None and cassette_transport.mode == "replay"
+
 client = OpenAI(
   base_url=os.getenv("OPENROUTER_API_URL"),
-  api_key=os.getenv("OPENROUTER_API_KEY"),
+  # Replayed requests never reach the API, so they need no key
+  api_key=os.getenv("OPENROUTER_API_KEY") or ("replay" if replay_only else None),
+  http_client=DefaultHttpxClient(transport=cassette_transport) if cassette_transport else None,
 )
 
 profile_manager = ProfileManager()
-summary_manager = SummaryManager()
+cache_settings = profile_manager.get_setting("summaryCache", {})
+summary_manager = SummaryManager(
+    ttl=cache_settings.get("ttlSeconds"),
+    max_bytes=cache_settings.get("maxBytes")
+)
+document_manager = DocumentManager(
+    max_rss_mb=profile_manager.get_setting("extraction", {}).get("maxRssMb")
+)
+model_router = ModelRouter(profile_manager.get_setting("routing"))
+usage_ledger = UsageLedger(
+    pricing=profile_manager.get_setting("pricing"),
+    budgets=profile_manager.get_setting("budgets")
+)
+structured_store = StructuredSummaryStore()
+# Shared with every SciSift process using the same key; batch commands lower its priority
+rate_settings = profile_manager.get_setting("rateLimits", {})
+rate_limiter = RateLimiter(
+    rate_settings.get("dbFile", "rate_limits.db"),
+    limits=rate_settings.get("key"),
+    models=rate_settings.get("models"),
+    api_key=os.getenv("OPENROUTER_API_KEY"),
+    interactive_reserve=rate_settings.get("interactiveReserve", 0.2)
+)
+citation_graph = CitationGraph()
+citation_settings = profile_manager.get_setting("citations", {})
+# Answers to repeated chat questions; same store format as the summary cache
+answer_settings = profile_manager.get_setting("answerCache", {})
+answer_cache = SummaryManager(
+    answer_settings.get("dbFile", "chat_answers.db"),
+    ttl=answer_settings.get("ttlSeconds"),
+    max_bytes=answer_settings.get("maxBytes"),
+    legacy_file="chat_answers.json"
+)
+progressive_settings = profile_manager.get_setting("progressive", {})
+revision_settings = profile_manager.get_setting("revisions", {})
+revision_store = RevisionStore(
+    revision_settings.get("dbFile", "revisions.db"),
+    max_revisions=revision_settings.get("maxRevisions", 10)
+)
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the prompts sent for paper analysis change, so cached
+# summaries produced by older prompts are no longer served
+PROMPT_TEMPLATE_VERSION = 1
+
+STRUCTURED_INSTRUCTIONS = """Respond with only a JSON object and no other text, using exactly these fields:
+{
+  "summary": "the explanation of the paper, written according to the profile above",
+  "findings": ["key finding", ...],
+  "methods": ["method or technique used", ...],
+  "sample_size": total number of subjects or samples as an integer, or null if not applicable,
+  "limitations": ["limitation", ...],
+  "future_work": ["future work direction", ...]
+}"""
+
+# Packed requests ask for one answer per document, keyed by its id
+PACK_INSTRUCTIONS = """Each document above starts with a <<<DOCUMENT id>>> line and ends with an <<<END id>>> line.
+Explain every document separately, as if it were the only one, following the profile above.
+Respond with only a JSON object and no other text, mapping each document id to its explanation, e.g. {"P1": "...", "P2": "..."}"""
+PACK_STRUCTURED_INSTRUCTIONS = ("Respond with only a JSON object and no other text, mapping each document id "
+                                "to an object with exactly these fields:\n"
+                                + STRUCTURED_INSTRUCTIONS[STRUCTURED_INSTRUCTIONS.index("{"):])
+
+# Sections a progressive draft is written from, and its prompt
+DRAFT_SECTIONS = ["abstract", "discussion"]
+DRAFT_INSTRUCTIONS = ("Below are the title, abstract and conclusions of a paper. Give a brief preliminary "
+                      "explanation of it in at most 150 words; a full analysis will follow.")
+
+# Expected output of one packed request; limits how many papers share it
+PACK_COMPLETION_TOKENS = 8000
+
+class RequestCancelled(Exception):
+    """Raised when a streamed request is aborted through its cancel event"""
 
-def _get_profile_context():
-    active_profile = profile_manager.get_active_profile()
+def get_profile(profile_name=None):
+    """Get a profile by name, or the active profile if no name is given"""
+    if profile_name:
+        return profile_manager.get_profile_by_name(profile_name)
+    return profile_manager.get_active_profile()
+
+def _is_further_readings(constraint):
+    return re.search(r"further readings?", constraint, re.IGNORECASE) is not None
+
+def _get_profile_context(profile_name=None, skip_further_readings=False):
+    active_profile = get_profile(profile_name)
     if not active_profile:
         return ""
     
+    # Further readings answered from the citation graph are left out of the prompt
+    constraints = [c for c in active_profile['constraints'] if not (skip_further_readings and _is_further_readings(c))]
     context = f"""Please provide your response according to the following profile:
                 Name: {active_profile['name']}
                 Description: {active_profile['description']}
                 Constraints:
-                {chr(10).join('- ' + c for c in active_profile['constraints'])}
+                {chr(10).join('- ' + c for c in constraints)}
                 Output Style:
                 {chr(10).join('- ' + k + ': ' + str(v) for k, v in active_profile['outputStyle'].items())}
 
                 """
     return context
 
-def _read_file_content(file_path):
-    """Read and return file content based on file type"""
-    mime_type, _ = mimetypes.guess_type(file_path)
-    
+def _index_citations(file_path, document):
+    """Add a paper's references to the citation graph unless this version is indexed"""
+    path = os.path.abspath(file_path)
+    if citation_graph.is_current(path, document["fingerprint"]):
+        return
     try:
-        # Handle PDF files
-        if mime_type == 'application/pdf':
-            reader = PdfReader(file_path)
-            content = ""
-            for page in reader.pages:
-                content += page.extract_text() + "\n"
-            return content
-        
-        # Handle text files
-        elif mime_type and mime_type.startswith('text/'):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        
-        # Try reading as text if mime type is unknown
-        else:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-                
-    except UnicodeDecodeError:
-        return "Error: File format not supported. Please provide a text or PDF file."
+        front_text = next(document_manager.iter_page_texts(document), "")[:3000]
+        references = document_manager.get_section_text(document, "references")
+        citation_graph.add_paper(path, document["fingerprint"], front_text, references)
+    except Exception as e:
+        # The graph is an index; a failure must not stop the analysis
+        logger.warning("Could not index citations of %s: %s", file_path, e)
+
+def _read_document(file_path):
+    """Read and return the structured document for a file"""
+    try:
+        return document_manager.load(file_path)
+    except (UnicodeDecodeError, UnsupportedFormat):
+        return "Error: File format not supported. Please provide a PDF, LaTeX source, HTML or text file (optionally in a gzip, zip or tar archive)."
     except Exception as e:
         return f"Error: Failed to read file: {str(e)}"
 
-def chat_with_ai(message, file_path=None, model="google/gemini-2.0-flash-001", use_profile=False, conversation_history=None):
-    # Handle file content
-    file_content = ""
+def index_paper_citations(file_path):
+    """Read a paper and add its references to the citation graph; returns an error message or None"""
+    document = _read_document(file_path)
+    if isinstance(document, str):
+        return document
+    _index_citations(file_path, document)
+    return None
+
+def _read_file_content(file_path, sections=None):
+    """Read and return file content, limited to the given sections if any"""
+    document = _read_document(file_path)
+    if isinstance(document, str):
+        return document
+    try:
+        return document_manager.get_text(document, sections)
+    except MemoryError as e:
+        return f"Error: Failed to read file: {str(e)}"
+
+def _route_tokens(tokens, profile=None):
+    """Pick a model for a request from its token count and the profile's technical level"""
+    technical_level = profile.get('outputStyle', {}).get('technicalLevel') if profile else None
+    return model_router.route(tokens, technical_level)
+
+def route_model(text, profile=None):
+    """Pick a model for a request from its size and the profile's technical level"""
+    return _route_tokens(model_router.estimate_tokens(text), profile)
+
+def _summary_key(document_hash, model, profile, structured=False, local_readings=False):
+    """Build the summary cache key for a document, model and profile"""
+    # Structured summaries and prompts without further readings differ, so they are keyed apart
+    template_version = f"{PROMPT_TEMPLATE_VERSION}-structured" if structured else PROMPT_TEMPLATE_VERSION
+    if local_readings:
+        template_version = f"{template_version}-local-readings"
+    return summary_manager.generate_key(
+        document_hash, model,
+        summary_manager.hash_profile(profile, template_version)
+    )
+
+def _revision_context(model, profile, structured=False, local_readings=False):
+    """Summary key without the document hash: every version of a paper summarized the same way shares it"""
+    return _summary_key("", model, profile, structured, local_readings)
+
+def _normalize_question(message):
+    """Fold case, whitespace and trailing punctuation so trivially different questions share an answer"""
+    return " ".join(message.casefold().split()).rstrip("?!. ")
+
+def _answer_key(message, model, profile, file_path=None, paper=None, sections=None, conversation_history=None,
+                skip_further_readings=False):
+    """Answer cache key: question, document, sections, requested model, profile and the conversation before the question.
+
+    Without a requested model the answer is keyed on routing, whichever model it picks.
+    """
     if file_path:
-        file_content = _read_file_content(file_path)
+        document_hash = summary_manager.hash_file(file_path)
+    else:
+        document_hash = summary_manager.hash_text(paper or "")
+    template_version = f"{PROMPT_TEMPLATE_VERSION}-chat"
+    if skip_further_readings:
+        template_version = f"{template_version}-local-readings"
+    history = json.dumps([[m["role"], m["content"]] for m in (conversation_history or [])[:-1]])
+    context = json.dumps([_normalize_question(message), sorted(sections or []), history])
+    return (f"{summary_manager.generate_key(document_hash, model, summary_manager.hash_profile(profile, template_version))}"
+            f":{summary_manager.hash_text(context)}")
+
+def _create_completion(model, messages, cancel_event=None, on_progress=None):
+    """Send the request and return its text and token usage.
+
+    With a cancel event the request is streamed so it can be aborted between chunks.
+    """
+    if cancel_event is None:
+        completion = client.chat.completions.create(
+            model=model,
+            messages=messages
+        )
+        return completion.choices[0].message.content, completion.usage
+
+    if cancel_event.is_set():
+        raise RequestCancelled()
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    parts = []
+    received = 0
+    usage = None
+    try:
+        for chunk in stream:
+            if cancel_event.is_set():
+                raise RequestCancelled()
+            # Usage arrives on the final chunk, which has no choices
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                received += len(parts[-1])
+                if on_progress:
+                    # The response length is unknown, so progress is only indicative
+                    on_progress(f"Receiving response ({received} characters)", min(0.95, 0.3 + received / 8000))
+    finally:
+        # Closing the stream drops the HTTP connection of a cancelled request
+        stream.close()
+    return "".join(parts), usage
+
+def _offline():
+    """Whether this thread's last model call was served from a cassette"""
+    return cassette_transport is not None and cassette_transport.offline()
+
+def _split_tokens(tokens, weights):
+    """Whole-token shares of `tokens` in proportion to weights, adding up to `tokens`"""
+    total = sum(weights)
+    if not total:
+        weights, total = [1] * len(weights), len(weights)
+    shares, cumulative, given = [], 0, 0
+    for weight in weights:
+        cumulative += weight
+        share = round(tokens * cumulative / total) - given
+        shares.append(share)
+        given += share
+    return shares
+
+def _record_usage(model, usage, latency, profile, paper):
+    """Write a request's token usage and estimated cost to the ledger.
+
+    `paper` may map several papers to weights, such as their tokens in a packed
+    request; the usage is then split between them in proportion, one record each.
+    """
+    if not usage:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details else 0
+    papers = paper if isinstance(paper, dict) else {paper: 1}
+    weights = list(papers.values())
+    for name, prompt_tokens, completion_tokens, cached in zip(
+        papers, _split_tokens(usage.prompt_tokens or 0, weights),
+        _split_tokens(usage.completion_tokens or 0, weights), _split_tokens(cached_tokens, weights)
+    ):
+        usage_ledger.record(
+            model,
+            prompt_tokens,
+            completion_tokens,
+            cached_tokens=cached,
+            latency=latency,
+            profile=profile,
+            paper=name
+        )
+
+def chat_with_ai(message, file_path=None, model=None, use_profile=False, conversation_history=None, sections=None, cancel_event=None, on_progress=None, paper=None, profile_name=None, skip_further_readings=False, cache=True):
+    """Send a message, with an optional file and profile, and return the model's answer.
+
+    Answers are cached (see answerCache in settings.json) unless `cache` is
+    False; callers that cache their results elsewhere opt out. An uncached
+    request for several papers can pass `paper` as {paper: weight} to split its
+    usage between them in the ledger.
+    """
+    profile = get_profile(profile_name) if use_profile else None
+    answer_key = None
+    if cache and answer_settings.get("enabled", True):
+        # Keyed on the file hash and the requested model, so a hit reads no text and routes nothing
+        try:
+            answer_key = _answer_key(message, model, profile, file_path, paper, sections, conversation_history,
+                                     skip_further_readings)
+        except OSError:
+            pass
+        answer = answer_cache.get_summary(answer_key) if answer_key else None
+        if answer is not None:
+            return answer
+
+    # The file content is sent as its own part so the (possibly very large)
+    # text is never copied into a combined prompt string
+    parts = [_get_profile_context(profile_name, skip_further_readings)] if use_profile else []
+    if file_path:
+        file_content = _read_file_content(file_path, sections)
         if file_content.startswith("Error:"):
             return file_content
-        message = f"Here is the content of the file:\n\n{file_content}\n\n{message}"
-
-    full_message = (_get_profile_context() + message) if use_profile else message
+        parts += ["Here is the content of the file:\n\n", file_content, "\n\n"]
+    parts.append(message)
 
     # Build messages list with conversation history
     messages = []
@@ -88,49 +352,532 @@ def chat_with_ai(message, file_path=None, model="google/gemini-2.0-flash-001", u
         "content": [
             {
                 "type": "text",
-                "text": full_message
+                "text": part
             }
+            for part in parts if part
         ]
     })
 
-    completion = client.chat.completions.create(
-        model=model,
-        messages=messages
+    text_length = sum(len(msg["content"]) for msg in conversation_history or []) + sum(len(p) for p in parts)
+    if not model:
+        model = _route_tokens(text_length // 4 + 1, profile)
+
+    profile_name = profile['name'] if profile else None
+
+    try:
+        if not usage_ledger.check_budget(profile_name, cancel_event):
+            raise RequestCancelled()
+    except BudgetExceeded as e:
+        return f"Error: {str(e)}"
+
+    # Replayed requests never reach the API, so they are not rate limited
+    estimated_tokens = text_length // 4 + 1 + _expected_completion_tokens(profile)
+    limited = rate_limiter.enabled and not replay_only
+    if limited:
+        if on_progress:
+            on_progress("Waiting for rate limit", 0.25)
+        if rate_limiter.acquire(model, estimated_tokens, cancel_event=cancel_event) is None:
+            raise RequestCancelled()
+
+    if on_progress:
+        on_progress(f"Waiting for {model}", 0.3)
+    start = time.monotonic()
+    try:
+        response, usage = _create_completion(model, messages, cancel_event, on_progress)
+    except Exception as e:
+        if limited and isinstance(e, RateLimitError):
+            # The API disagrees with our limits; make every process back off
+            rate_limiter.drain(model)
+        # A cancelled or replayed request says nothing about the model's health
+        if not (cancel_event and cancel_event.is_set()) and not _offline():
+            model_router.record(model, time.monotonic() - start, error=True)
+        raise
+    latency = time.monotonic() - start
+    if limited and usage:
+        rate_limiter.settle(model, estimated_tokens, (usage.prompt_tokens or 0) + (usage.completion_tokens or 0))
+    # Replayed responses cost nothing and their timing is not the model's
+    if not _offline():
+        model_router.record(model, latency)
+        _record_usage(model, usage, latency, profile_name, paper or file_path)
+    if answer_key and response:
+        answer_cache.save_summary(answer_key, response, profile_name, model, source=paper or file_path)
+    return response
+
+def _local_readings(profile):
+    """Whether a profile's further readings come from the citation graph instead of the model"""
+    return (citation_settings.get("localFurtherReadings", True)
+            and any(_is_further_readings(c) for c in (profile or {}).get('constraints', [])))
+
+def _further_readings(paper_path, profile):
+    """Reading suggestions from the citation graph, if the profile asks for them and the graph has any"""
+    if not _local_readings(profile):
+        return []
+    return citation_graph.further_readings(os.path.abspath(paper_path), citation_settings.get("maxReadings", 5))
+
+def _render_further_readings(readings):
+    lines = ["Suggested further readings (from citations across your papers):"]
+    for reading in readings:
+        where = f" [{os.path.basename(reading['path'])}]" if reading.get('path') else ""
+        lines.append(f"- {reading['title']}{where} (cited by {reading['citations']} of your papers)")
+    return "\n".join(lines)
+
+def _prepare_paper(paper_path, model, profile, structured=False, index=True):
+    """Resolve a paper's model, summary cache key and graph readings without reading its text.
+
+    The paper's references are indexed first, unless `index` is False (estimates
+    and prefetching only read the graph). Its further readings come from the
+    graph only if the profile asks for them and the paper has indexed references
+    (a paper without a detected references section has none); otherwise the
+    model is asked for them as usual. Returns (document, model, key, readings);
+    on error the document is an error message and key is None.
+    """
+    document = _read_document(paper_path)
+    if isinstance(document, str):
+        return document, model, None, []
+
+    if index:
+        _index_citations(paper_path, document)
+    readings = _further_readings(paper_path, profile)
+    # The routed model is part of the cache key, so pick it first
+    sections = profile.get('sections') if profile else None
+    model = model or _route_tokens(document_manager.get_text_size(document, sections) // 4 + 1, profile)
+    key = _summary_key(summary_manager.hash_file(paper_path), model, profile, structured, bool(readings))
+    return document, model, key, readings
+
+def _readings_text(readings):
+    """Graph readings appended on every return rather than cached, so they follow the graph as papers are added"""
+    return f"\n\n{_render_further_readings(readings)}" if readings else ""
+
+def _expected_completion_tokens(profile):
+    """Estimate the response size from a profile's word limit, if it has one"""
+    for constraint in (profile or {}).get('constraints', []):
+        match = re.search(r"(\d+)\s+words", constraint)
+        if match:
+            # Roughly 1.4 tokens per English word
+            return int(int(match.group(1)) * 1.4)
+    return DEFAULT_COMPLETION_TOKENS
+
+def estimate_paper_cost(paper_path, model=None, profile_name=None):
+    """Estimate tokens and cost of explaining a paper before running it"""
+    active_profile = get_profile(profile_name)
+    document, model, key, readings = _prepare_paper(paper_path, model, active_profile, index=False)
+    if key is None:
+        return {"error": document}
+
+    sections = active_profile.get('sections') if active_profile else None
+    prompt_tokens = (model_router.estimate_tokens(_get_profile_context(profile_name, bool(readings)))
+                     + document_manager.get_text_size(document, sections) // 4)
+    completion_tokens = _expected_completion_tokens(active_profile)
+    return {
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost": usage_ledger.estimate_cost(model, prompt_tokens, completion_tokens),
+        "cached": summary_manager.has_summary(key),
+    }
+
+def prefetch_paper(paper_path, model=None, profile_name=None, structured=False, cancel_event=None):
+    """Extract, hash and probe the summary cache for a paper ahead of its analysis.
+
+    Warms the document cache and file hash so a later explain_paper starts
+    immediately. Does not touch cache statistics.
+    """
+    try:
+        document_manager.load(paper_path, cancel_event=cancel_event)
+    except ExtractionCancelled:
+        return {"cancelled": True}
+    except Exception as e:
+        return {"error": str(e)}
+
+    active_profile = get_profile(profile_name)
+    document, routed_model, key, _ = _prepare_paper(paper_path, model, active_profile, structured, index=False)
+    if key is None:
+        return {"error": document}
+    cached = summary_manager.has_summary(key) and (not structured or structured_store.get(key) is not None)
+    return {"model": routed_model, "key": key, "cached": cached}
+
+def _normalize_structured(data):
+    """Coerce parsed JSON into the structured summary fields"""
+    result = {"summary": str(data.get("summary") or "").strip()}
+    for field in LIST_FIELDS:
+        value = data.get(field) or []
+        if isinstance(value, str):
+            value = [value]
+        result[field] = [str(item).strip() for item in value if item]
+
+    sample_size = data.get("sample_size")
+    if isinstance(sample_size, str):
+        match = re.search(r"\d[\d,]*", sample_size)
+        sample_size = int(match.group().replace(",", "")) if match else None
+    elif isinstance(sample_size, float):
+        sample_size = int(sample_size)
+    elif not isinstance(sample_size, int) or isinstance(sample_size, bool):
+        sample_size = None
+    result["sample_size"] = sample_size
+    return result
+
+def _parse_structured(text):
+    """Parse a model's JSON answer, repairing common formatting problems"""
+    # Models often wrap JSON in code fences or add a sentence around it
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        return None
+    candidate = text[start:end + 1]
+    for attempt in (candidate, re.sub(r",\s*([}\]])", r"\1", candidate)):
+        try:
+            data = json.loads(attempt)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(data, dict):
+            return _normalize_structured(data)
+    return None
+
+def _render_structured(data, profile):
+    """Render structured fields as text when the model left the summary empty"""
+    bullets = (profile or {}).get('outputStyle', {}).get('structurePreference') == 'bullet-points'
+    parts = []
+    for field in LIST_FIELDS:
+        if not data[field]:
+            continue
+        title = field.replace('_', ' ').capitalize()
+        if bullets:
+            parts.append(title + ":\n" + "\n".join(f"- {item}" for item in data[field]))
+        else:
+            parts.append(f"{title}: " + " ".join(data[field]))
+    if data["sample_size"] is not None:
+        parts.insert(1, f"Sample size: {data['sample_size']}")
+    return "\n\n".join(parts)
+
+def _store_structured(key, response, paper, profile, model):
+    """Validate a structured response, asking the model to repair it once, and store its fields"""
+    data = _parse_structured(response)
+    if data is None:
+        repaired = chat_with_ai(
+            f"Convert the following into a single valid JSON object.\n{STRUCTURED_INSTRUCTIONS}\n\n{response}",
+            model=model, paper=paper, cache=False
+        )
+        data = _parse_structured(repaired)
+    if data is None:
+        return "Error: Model did not return valid structured output"
+
+    if not data["summary"]:
+        data["summary"] = _render_structured(data, profile)
+    structured_store.save(key, data, paper=paper, profile=profile['name'] if profile else None, model=model)
+    return data["summary"]
+
+def _update_summary(paper_path, document, section_hashes, previous, model, profile_name, sections,
+                    structured=False, skip_further_readings=False, cancel_event=None, on_progress=None):
+    """Update the summary of a paper's previous version from the sections that changed since.
+
+    Only the changed sections and the previous summary are sent. Returns the model's
+    answer and the names of the changed sections, or (None, None) when the paper
+    should be summarized in full.
+    """
+    diff = diff_sections(previous["sections"], section_hashes, sections)
+    # Without detected sections, or when most of the text changed, a full summary costs about the same
+    if len(section_hashes) < 2 or diff["changed_fraction"] > revision_settings.get("maxChangedFraction", 0.5):
+        return None, None
+    previous_summary = previous["summary"]
+    if structured:
+        data = structured_store.get(previous["summary_key"])
+        if data is None:
+            return None, None
+        previous_summary = json.dumps(data)
+    updated = diff["changed"] + diff["added"]
+    if not updated and not diff["removed"]:
+        # Only whitespace or sections the profile does not send changed
+        return previous_summary, []
+
+    if on_progress:
+        on_progress(f"Updating summary from {len(updated)} changed sections", 0.3)
+    parts = [f"The paper was revised. This is the summary of its previous version:\n\n{previous_summary}\n\n"]
+    for section in updated:
+        label = "New section" if section in diff["added"] else "Revised section"
+        title = section["title"] or section["name"].replace("_", " ")
+        parts.append(f"{label} \"{title}\":\n\n{document_manager.get_section_text(document, section['name'])}\n\n")
+    if diff["removed"]:
+        titles = ", ".join(s["title"] or s["name"].replace("_", " ") for s in diff["removed"])
+        parts.append(f"Sections removed in the revision: {titles}\n\n")
+    parts.append(
+        "The other sections are unchanged. Rewrite the summary so it describes the revised paper, "
+        "keeping everything the unchanged sections still support and following the same instructions."
+    )
+    if structured:
+        parts.append(f"\n{STRUCTURED_INSTRUCTIONS}")
+    summary = chat_with_ai(
+        "".join(parts), model=model, use_profile=True, cancel_event=cancel_event, on_progress=on_progress,
+        paper=paper_path, profile_name=profile_name, skip_further_readings=skip_further_readings, cache=False
     )
-    return completion.choices[0].message.content
+    return summary, [s["name"] for s in updated + diff["removed"]]
 
-def explain_paper(type, paper_path=None, url=None, model="google/gemini-2.0-flash-001"):
-    active_profile = profile_manager.get_active_profile()
+def _record_revision(paper_path, key, context, section_hashes, summary, changed, profile_name, model):
+    revision_store.add(
+        os.path.abspath(paper_path), context, summary_manager.hash_file(paper_path), key, section_hashes,
+        summary, changed=changed, profile=profile_name, model=model
+    )
+
+def _draft_text(document):
+    """Front matter, abstract and conclusion of a paper, cut to the draft input size"""
+    max_chars = progressive_settings.get("draftMaxChars", 12000)
+    parts, size = [], 0
+    # Without these sections the text starts from the beginning
+    for chunk in document_manager.iter_text(document, DRAFT_SECTIONS):
+        parts.append(chunk)
+        size += len(chunk)
+        if size >= max_chars:
+            break
+    return "".join(parts)[:max_chars]
+
+def _draft_summary(paper_path, document, key, profile, cancel_event=None):
+    """A short preliminary summary, stored as a draft under the final summary's key"""
+    draft = summary_manager.get_draft(key)
+    if draft:
+        return draft
+    text = _draft_text(document)
+    model = progressive_settings.get("draftModel") or _route_tokens(len(text) // 4 + 1, profile)
+    profile_name = profile['name'] if profile else None
+    draft = chat_with_ai(
+        f"{DRAFT_INSTRUCTIONS}\n\n{text}", model=model, use_profile=True, cancel_event=cancel_event,
+        paper=paper_path, profile_name=profile_name, skip_further_readings=True, cache=False
+    )
+    if draft and not draft.startswith("Error:"):
+        summary_manager.save_summary(key, draft, profile_name, model, source=paper_path, draft=True)
+    return draft
+
+def _deliver_draft(paper_path, document, key, profile, on_draft, final_done, cancel_event=None):
+    try:
+        draft = _draft_summary(paper_path, document, key, profile, cancel_event)
+    except Exception as e:
+        logger.warning("Draft summary of %s failed: %s", paper_path, e)
+        return
+    if draft and not draft.startswith("Error:") and not final_done.is_set():
+        on_draft(draft)
+
+def explain_paper(type, paper_path=None, url=None, model=None, cancel_event=None, on_progress=None, profile_name=None, structured=False, on_draft=None, on_key=None):
+    """Explain a paper file or URL according to a profile, from the summary cache when possible.
+
+    With `on_draft`, a file that is not cached also gets a quick draft from its
+    abstract and conclusion, passed to on_draft from another thread unless the
+    full summary is ready first. `on_key` is called with the summary cache key
+    the answer is stored under, e.g. to look up its structured fields.
+    """
+    active_profile = get_profile(profile_name)
+    if profile_name and not active_profile:
+        return f"Error: Profile '{profile_name}' not found"
     profile_name = active_profile['name'] if active_profile else None
+    # Profiles may restrict which detected sections are sent to the model
+    sections = active_profile.get('sections') if active_profile else None
 
     if type == "file":
         message = "Please analyze and explain the following paper:"
-        file_content = _read_file_content(paper_path)
-        if file_content.startswith("Error:") or not isinstance(file_content, str):
-            return file_content
+        if structured:
+            message = f"Please analyze the following paper.\n{STRUCTURED_INSTRUCTIONS}"
+        if on_progress:
+            on_progress("Reading paper", 0.1)
+        document, model, key, readings = _prepare_paper(paper_path, model, active_profile, structured)
+        if key is None:
+            return document
+        if on_key:
+            on_key(key)
+        local_readings = bool(readings)
+        readings_text = _readings_text(readings)
 
-        # Check for existing summary
-        existing_summary = summary_manager.get_summary(file_content, profile_name)
-        if existing_summary:
-            return existing_summary
+        # Check for existing summary; legacy keys hash the full text, so it is
+        # only read when old entries remain to be migrated
+        if on_progress:
+            on_progress("Checking summary cache", 0.2)
+        legacy_keys = None if structured or local_readings else lambda: summary_manager.legacy_keys(
+            document_manager.get_text(document, sections), profile_name, model
+        )
+        existing_summary = summary_manager.get_summary(key, legacy_keys)
+        # The last version summarized with this model and profile, to diff a replaced file against
+        track_revisions = revision_settings.get("enabled", True)
+        context = _revision_context(model, active_profile, structured, local_readings)
+        previous = revision_store.latest(os.path.abspath(paper_path), context) if track_revisions else None
+        if existing_summary and (not structured or structured_store.get(key)):
+            if track_revisions and (previous is None or previous["summary_key"] != key):
+                _record_revision(paper_path, key, context, document_manager.get_section_hashes(document),
+                                 existing_summary, None, profile_name, model)
+            return existing_summary + readings_text
 
-        # Generate new summary
-        summary = chat_with_ai(message, file_path=paper_path, model=model, use_profile=True)
-        if summary:
-            summary_manager.save_summary(file_content, summary, profile_name)
+        # Progressive mode: a quick draft from the abstract and conclusion while the full summary is computed
+        final_done = threading.Event()
+        if on_draft and progressive_settings.get("enabled", True):
+            threading.Thread(
+                target=_deliver_draft, name="scisift-draft", daemon=True,
+                args=(paper_path, document, key, active_profile, on_draft, final_done, cancel_event)
+            ).start()
+
+        try:
+            # A revised file only needs its changed sections sent
+            summary, changed = None, None
+            section_hashes = document_manager.get_section_hashes(document) if track_revisions else None
+            if previous:
+                summary, changed = _update_summary(
+                    paper_path, document, section_hashes, previous, model, profile_name, sections, structured,
+                    skip_further_readings=local_readings, cancel_event=cancel_event, on_progress=on_progress
+                )
+            if summary is None:
+                summary = chat_with_ai(
+                    message, file_path=paper_path, model=model, use_profile=True, sections=sections,
+                    cancel_event=cancel_event, on_progress=on_progress, profile_name=profile_name,
+                    skip_further_readings=local_readings, cache=False
+                )
+            if structured and summary and not summary.startswith("Error:"):
+                summary = _store_structured(key, summary, paper_path, active_profile, model)
+            if summary and not summary.startswith("Error:"):
+                summary_manager.save_summary(key, summary, profile_name, model, source=paper_path)
+                if track_revisions:
+                    _record_revision(paper_path, key, context, section_hashes, summary, changed, profile_name, model)
+                summary += readings_text
+        finally:
+            final_done.set()
         return summary
     else:
         if not url:
             return "Error: URL is required for URL-based paper analysis"
             
         message = f"Please analyze and explain the paper at this URL: {url}"
+        if structured:
+            message = f"Please analyze the paper at this URL: {url}\n{STRUCTURED_INSTRUCTIONS}"
+        model = model or route_model(message, active_profile)
         # For URLs, we'll use the URL itself as the content key
-        existing_summary = summary_manager.get_summary(url, profile_name)
-        if existing_summary:
+        key = _summary_key(summary_manager.hash_text(url), model, active_profile, structured)
+        if on_key:
+            on_key(key)
+        legacy_keys = None if structured else lambda: summary_manager.legacy_keys(url, profile_name, model)
+        existing_summary = summary_manager.get_summary(key, legacy_keys)
+        if existing_summary and (not structured or structured_store.get(key)):
             return existing_summary
 
         # Generate new summary
-        summary = chat_with_ai(message, model=model, use_profile=True)
-        if summary:
-            summary_manager.save_summary(url, summary, profile_name)
-        return summary
\ No newline at end of file
+        summary = chat_with_ai(
+            message, model=model, use_profile=True,
+            cancel_event=cancel_event, on_progress=on_progress, paper=url, profile_name=profile_name, cache=False
+        )
+        if structured and summary and not summary.startswith("Error:"):
+            summary = _store_structured(key, summary, url, active_profile, model)
+        if summary and not summary.startswith("Error:"):
+            summary_manager.save_summary(key, summary, profile_name, model, source=url)
+        return summary
+
+def _pack_papers(papers, budget, max_papers):
+    """Group papers in order into packs of at most `budget` tokens and `max_papers` papers.
+
+    A paper over half the budget gets a request of its own.
+    """
+    packs, current, used = [], [], 0
+    for paper in papers:
+        if paper["tokens"] > budget // 2:
+            packs.append([paper])
+            continue
+        if current and (used + paper["tokens"] > budget or len(current) >= max_papers):
+            packs.append(current)
+            current, used = [], 0
+        current.append(paper)
+        used += paper["tokens"]
+    if current:
+        packs.append(current)
+    return packs
+
+def _explain_pack(pack, model, profile, sections, structured, local_readings, cancel_event=None, on_progress=None):
+    """Explain several papers in one request; returns {path: summary} for the papers whose answer parsed"""
+    profile_name = profile['name'] if profile else None
+    ids = {f"P{i}": paper for i, paper in enumerate(pack, 1)}
+    parts = [f"<<<DOCUMENT {paper_id}>>>\n{document_manager.get_text(paper['document'], sections)}\n<<<END {paper_id}>>>\n\n"
+             for paper_id, paper in ids.items()]
+    parts.append(PACK_STRUCTURED_INSTRUCTIONS if structured else PACK_INSTRUCTIONS)
+    logger.info("Packed %d papers into one request to %s", len(pack), model)
+    response = chat_with_ai(
+        "".join(parts), model=model, use_profile=True, cancel_event=cancel_event, on_progress=on_progress,
+        paper={paper["path"]: paper["tokens"] for paper in pack}, profile_name=profile_name, skip_further_readings=local_readings,
+        cache=False
+    )
+    if response.startswith("Error:"):
+        return {paper["path"]: response for paper in pack}
+
+    start, end = response.find("{"), response.rfind("}")
+    try:
+        answers = json.loads(response[start:end + 1]) if start != -1 else None
+    except json.JSONDecodeError:
+        answers = None
+    if not isinstance(answers, dict):
+        logger.warning("Could not parse the packed answer for %d papers", len(pack))
+        return {}
+
+    results = {}
+    for paper_id, paper in ids.items():
+        answer = answers.get(paper_id)
+        if structured:
+            if not isinstance(answer, dict):
+                continue
+            summary = _store_structured(paper["key"], json.dumps(answer), paper["path"], profile, model)
+        elif isinstance(answer, str) and answer.strip():
+            summary = answer.strip()
+        else:
+            continue
+        if summary.startswith("Error:"):
+            continue
+        summary_manager.save_summary(paper["key"], summary, profile_name, model, source=paper["path"])
+        if revision_settings.get("enabled", True):
+            _record_revision(paper["path"], paper["key"], _revision_context(model, profile, structured, local_readings),
+                             document_manager.get_section_hashes(paper["document"]), summary, None, profile_name, model)
+        results[paper["path"]] = summary + paper["readings_text"]
+    return results
+
+def explain_papers_packed(paper_paths, pack_tokens, model=None, profile_name=None, structured=False,
+                          cancel_event=None, on_progress=None, on_key=None):
+    """Explain several paper files, bundling small ones into shared requests of up to `pack_tokens` tokens.
+
+    The profile preamble is sent once per pack, and each answer is cached under
+    its paper's own summary key. Papers missing from a packed answer, or whose
+    answer could not be parsed, or whose packed request failed, are explained
+    with single requests. `on_key` is
+    called with (path, summary key) for each paper that could be read. Returns
+    {path: summary or error message}.
+    """
+    active_profile = get_profile(profile_name)
+    if profile_name and not active_profile:
+        return {path: f"Error: Profile '{profile_name}' not found" for path in paper_paths}
+    profile_name = active_profile['name'] if active_profile else None
+    sections = active_profile.get('sections') if active_profile else None
+
+    results, groups = {}, {}
+    for path in paper_paths:
+        document, paper_model, key, readings = _prepare_paper(path, model, active_profile, structured)
+        if key is None:
+            results[path] = document
+            continue
+        if on_key:
+            on_key(path, key)
+        readings_text = _readings_text(readings)
+        existing_summary = summary_manager.get_summary(key)
+        if existing_summary and (not structured or structured_store.get(key)):
+            results[path] = existing_summary + readings_text
+            continue
+        # Papers are packed with others routed to the same model and sharing the same prompt
+        # (graph readings or not), so their keys match single requests
+        groups.setdefault((paper_model, bool(readings)), []).append({
+            "path": path, "document": document, "key": key, "readings_text": readings_text,
+            "tokens": document_manager.get_text_size(document, sections) // 4 + 1
+        })
+
+    max_papers = max(1, PACK_COMPLETION_TOKENS // _expected_completion_tokens(active_profile))
+    for (paper_model, local_readings), papers in groups.items():
+        preamble = model_router.estimate_tokens(_get_profile_context(profile_name, local_readings))
+        budget = min(pack_tokens, model_router.max_input_tokens(paper_model) or pack_tokens) - preamble
+        for pack in _pack_papers(papers, budget, max_papers):
+            if len(pack) > 1:
+                try:
+                    results.update(_explain_pack(pack, paper_model, active_profile, sections, structured,
+                                                 local_readings, cancel_event, on_progress))
+                except Exception as e:
+                    # Only this pack falls back; a cancelled job stops at its first single request
+                    logger.warning("Packed request for %d papers failed, explaining them singly: %s", len(pack), e)
+            for paper in pack:
+                if paper["path"] not in results:
+                    results[paper["path"]] = explain_paper(
+                        "file", paper_path=paper["path"], model=paper_model, cancel_event=cancel_event,
+                        on_progress=on_progress, profile_name=profile_name, structured=structured
+                    )
+    return {path: results[path] for path in paper_paths}
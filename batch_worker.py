@@ -0,0 +1,88 @@
+import os
+import time
+import socket
+import logging
+import threading
+from job_store import JobStore
+from ai_service import explain_paper, rate_limiter
+from rate_limiter import BATCH
+
+logger = logging.getLogger(__name__)
+
+
+def _heartbeat(store_file, job_id, worker_id, lease_seconds, stop_event, lost_event):
+    """Keep a lease alive until stopped; flags the job as lost if another worker took it"""
+    # SQLite connections cannot be shared between threads
+    store = JobStore(store_file)
+    try:
+        while not stop_event.wait(lease_seconds / 3):
+            if not store.heartbeat(job_id, worker_id, lease_seconds):
+                lost_event.set()
+                return
+    finally:
+        store.close()
+
+
+def _process(store, job, worker_id, lease_seconds):
+    stop_event = threading.Event()
+    lost_event = threading.Event()
+    heartbeat = threading.Thread(
+        target=_heartbeat,
+        args=(store.db_file, job["id"], worker_id, lease_seconds, stop_event, lost_event),
+        daemon=True
+    )
+    heartbeat.start()
+    try:
+        if job["kind"] == "file":
+            result = explain_paper("file", paper_path=job["paper"], model=job["model"],
+                                   profile_name=job["profile"], cancel_event=lost_event)
+        else:
+            result = explain_paper("url", url=job["paper"], model=job["model"],
+                                   profile_name=job["profile"], cancel_event=lost_event)
+    except Exception as e:
+        if lost_event.is_set():
+            logger.warning("Job %s: lease lost, abandoning", job["id"])
+        else:
+            store.fail(job["id"], worker_id, str(e))
+            logger.error("Job %s failed: %s", job["id"], e)
+        return
+    finally:
+        stop_event.set()
+        heartbeat.join()
+
+    if not result or result.startswith("Error:"):
+        store.fail(job["id"], worker_id, result or "empty result")
+        logger.error("Job %s failed: %s", job["id"], result)
+    elif store.complete(job["id"], worker_id, result):
+        logger.info("Job %s done", job["id"])
+    else:
+        logger.warning("Job %s: lease lost before completion, result discarded", job["id"])
+
+
+def run_worker(store_file, worker_id=None, lease_seconds=300, poll_interval=5, exit_when_empty=False):
+    """Lease and process jobs from a shared store until interrupted"""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    # Leave headroom in the shared rate limits for people using the GUI or CLI
+    rate_limiter.priority = BATCH
+    store = JobStore(store_file)
+    print(f"Worker {worker_id} processing jobs from {store_file}")
+    try:
+        while True:
+            job = store.lease(worker_id, lease_seconds)
+            if job is None:
+                if exit_when_empty:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            print(f"[{worker_id}] job {job['id']} (attempt {job['attempts']}): {job['paper']}")
+            try:
+                _process(store, job, worker_id, lease_seconds)
+            except KeyboardInterrupt:
+                # Hand the job back so another worker can pick it up
+                store.fail(job["id"], worker_id, "worker interrupted")
+                raise
+    except KeyboardInterrupt:
+        print(f"\nWorker {worker_id} stopped")
+    finally:
+        store.close()
@@ -0,0 +1,72 @@
+import os
+import time
+import tempfile
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+from document_manager import DocumentManager, memory_usage_mb
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident memory of this process in MB"""
+    try:
+        import resource
+    except ImportError:
+        return memory_usage_mb()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and KB elsewhere
+    return peak / (1 << 20) if peak > 1 << 32 else peak / 1024
+
+
+def _measure_extraction(file_path: str, max_rss_mb: Optional[float]) -> Dict:
+    """Extract one file into a fresh cache and stream its text back, measuring time and memory"""
+    baseline = memory_usage_mb()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        manager = DocumentManager(cache_dir, max_rss_mb=max_rss_mb)
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            document = manager.load(file_path)
+            extracted = time.perf_counter()
+            characters = sum(len(chunk) for chunk in manager.iter_text(document))
+        except MemoryError as e:
+            tracemalloc.stop()
+            return {"path": file_path, "error": str(e)}
+        end = time.perf_counter()
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "path": file_path,
+        "pages": document["page_count"],
+        "text_mb": document["text_bytes"] / (1 << 20),
+        "characters": characters,
+        "extract_seconds": extracted - start,
+        "read_seconds": end - extracted,
+        "python_peak_mb": traced_peak / (1 << 20),
+        "baseline_rss_mb": baseline,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run_extraction_benchmark(paths: List[str], max_rss_mb: Optional[float] = None) -> List[Dict]:
+    """Measure cold extraction of each file in its own process so peaks do not carry over"""
+    results = []
+    for path in paths:
+        if not os.path.isfile(path):
+            results.append({"path": path, "error": "not a file"})
+            continue
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results.append(executor.submit(_measure_extraction, path, max_rss_mb).result())
+    return results
+
+
+def print_benchmark(results: List[Dict]) -> None:
+    print(f"{'Pages':>6} {'Text MB':>8} {'Extract s':>10} {'Read s':>8} {'Py peak MB':>11} {'RSS peak MB':>12}  File")
+    for result in results:
+        name = os.path.basename(result["path"])
+        if "error" in result:
+            print(f"{'-':>6} {'-':>8} {'-':>10} {'-':>8} {'-':>11} {'-':>12}  {name}: {result['error']}")
+            continue
+        print(f"{result['pages']:>6} {result['text_mb']:>8.1f} {result['extract_seconds']:>10.2f} "
+              f"{result['read_seconds']:>8.2f} {result['python_peak_mb']:>11.1f} {result['peak_rss_mb']:>12.1f}  {name}")
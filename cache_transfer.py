@@ -0,0 +1,214 @@
+import os
+import gzip
+import json
+import time
+import zlib
+import logging
+import threading
+from typing import Dict, Iterator, Optional
+
+from summary_manager import SummaryManager
+from document_manager import DocumentManager
+
+logger = logging.getLogger(__name__)
+
+FORMAT = "scisift-cache"
+FORMAT_VERSION = 1
+
+# Summary entries merged into the store at a time while importing
+IMPORT_BATCH_SIZE = 1000
+
+# Errors of a shared file that is damaged, or still being written by another machine
+READ_ERRORS = (OSError, EOFError, ValueError, KeyError, zlib.error)
+
+# Entry fields that describe this machine's use of an entry rather than the entry
+_LOCAL_FIELDS = {"accessed"}
+
+
+def _summary_record(key: str, entry: Dict) -> Dict:
+    return {"type": "summary", "key": key, "entry": {k: v for k, v in entry.items() if k not in _LOCAL_FIELDS}}
+
+
+def _document_records(document_manager: DocumentManager, content_hash: str, document: Dict) -> Iterator[Dict]:
+    """A document index followed by its text in chunks, so neither side holds the whole text"""
+    yield {"type": "document", "content_hash": content_hash, "index": document}
+    for chunk in document_manager.iter_text(document):
+        yield {"type": "text", "data": chunk}
+    yield {"type": "document_end"}
+
+
+def _write_records(path: str, records) -> int:
+    """Write a gzip-compressed JSONL file atomically; returns the number of records"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    count = 0
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"type": FORMAT, "version": FORMAT_VERSION, "created": time.time()}) + "\n")
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+                count += 1
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return count
+
+
+def _read_records(path: str) -> Iterator[Dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("type") != FORMAT or header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a SciSift cache export")
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _localize(entry: Dict) -> Dict:
+    """Drop a source path that does not exist here, so `cache gc` keeps the entry"""
+    source = entry.get("source")
+    if source and "://" not in source and not os.path.exists(source):
+        return dict(entry, source=None)
+    return entry
+
+
+def _import_records(records: Iterator[Dict], summary_manager: SummaryManager,
+                    document_manager: Optional[DocumentManager]) -> Dict[str, int]:
+    stats = {"summaries": 0, "documents": 0}
+    batch = []
+
+    def merge():
+        stats["summaries"] += summary_manager.merge_entries(batch)
+        batch.clear()
+
+    def chunks():
+        for record in records:
+            if record["type"] == "document_end":
+                return
+            yield record["data"]
+
+    for record in records:
+        if record["type"] == "summary":
+            batch.append((record["key"], _localize(record["entry"])))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                merge()
+        elif record["type"] == "document":
+            if document_manager is None or document_manager.has_document(record["content_hash"]):
+                for _ in chunks():
+                    pass
+            elif document_manager.import_document(record["content_hash"], record["index"], chunks()):
+                stats["documents"] += 1
+    merge()
+    return stats
+
+
+def export_cache(path: str, summary_manager: SummaryManager,
+                 document_manager: Optional[DocumentManager] = None) -> Dict[str, int]:
+    """Write every live summary, and with a document manager every extracted text, to a .jsonl.gz file"""
+    stats = {"summaries": 0, "documents": 0}
+
+    def records():
+        for key, entry in summary_manager.iter_entries():
+            stats["summaries"] += 1
+            yield _summary_record(key, entry)
+        if document_manager is None:
+            return
+        exported = set()
+        for content_hash, document in document_manager.iter_documents():
+            # Copies of one file at several paths are exported once
+            if content_hash not in exported:
+                exported.add(content_hash)
+                stats["documents"] += 1
+                yield from _document_records(document_manager, content_hash, document)
+
+    _write_records(path, records())
+    return stats
+
+
+def import_cache(path: str, summary_manager: SummaryManager,
+                 document_manager: Optional[DocumentManager] = None) -> Dict[str, int]:
+    """Merge an export into the local caches, one record at a time; returns what was added"""
+    stats = _import_records(_read_records(path), summary_manager, document_manager)
+    summary_manager.flush()
+    return stats
+
+
+def _skip(path: str, error: Exception, stats: Dict[str, int]) -> None:
+    logger.warning("Skipped unreadable shared cache file %s: %s", path, error)
+    stats["skipped_files"] += 1
+
+
+def _read_summary_files(paths, stats: Dict[str, int]) -> Iterator[Dict]:
+    """Records of small summary files; each is read whole, so a damaged file adds nothing"""
+    for path in paths:
+        try:
+            records = list(_read_records(path))
+        except READ_ERRORS as e:
+            _skip(path, e, stats)
+            continue
+        yield from records
+
+
+def _list_shared(directory: str) -> Dict[str, str]:
+    """Entry name -> file path of the entries in one section of a sync directory"""
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.endswith(".jsonl.gz"):
+                files[name[:-len(".jsonl.gz")]] = os.path.join(root, name)
+    return files
+
+
+def _shared_path(directory: str, name: str) -> str:
+    return os.path.join(directory, name[:2], f"{name}.jsonl.gz")
+
+
+def sync_cache(directory: str, summary_manager: SummaryManager,
+               document_manager: Optional[DocumentManager] = None) -> Dict[str, int]:
+    """Exchange cache entries with a shared directory, copying only what each side is missing.
+
+    The directory holds one small export per summary (named after a hash of its
+    key) and per extracted document (named after its content hash), so several
+    machines can sync with it at once without coordinating.
+    """
+    stats = {"pushed_summaries": 0, "pulled_summaries": 0, "pushed_documents": 0, "pulled_documents": 0,
+             "skipped_files": 0}
+    try:
+        summaries_dir = os.path.join(directory, "summaries")
+        shared = _list_shared(summaries_dir)
+        local = set()
+        for key, entry in summary_manager.iter_entries():
+            name = SummaryManager.hash_text(key)
+            local.add(name)
+            if name not in shared:
+                _write_records(_shared_path(summaries_dir, name), [_summary_record(key, entry)])
+                stats["pushed_summaries"] += 1
+        missing = [path for name, path in shared.items() if name not in local]
+        stats["pulled_summaries"] = _import_records(_read_summary_files(missing, stats),
+                                                    summary_manager, None)["summaries"]
+
+        if document_manager is not None:
+            documents_dir = os.path.join(directory, "documents")
+            shared = _list_shared(documents_dir)
+            local = set()
+            for content_hash, document in document_manager.iter_documents():
+                if content_hash not in shared and content_hash not in local:
+                    _write_records(_shared_path(documents_dir, content_hash),
+                                   _document_records(document_manager, content_hash, document))
+                    stats["pushed_documents"] += 1
+                local.add(content_hash)
+            for content_hash, path in shared.items():
+                if content_hash in local:
+                    continue
+                # Documents are streamed; a damaged one is never stored, as its text is written atomically
+                try:
+                    stats["pulled_documents"] += _import_records(_read_records(path), summary_manager,
+                                                                 document_manager)["documents"]
+                except READ_ERRORS as e:
+                    _skip(path, e, stats)
+    finally:
+        summary_manager.flush()
+    return stats
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional
+import httpx
+
+logger = logging.getLogger(__name__)
+
+MODES = ("record", "replay", "auto")
+
+# Response headers that describe one particular exchange rather than the response
+VOLATILE_HEADERS = {"date", "set-cookie", "cf-ray", "x-request-id", "x-generation-id"}
+
+
+class CassetteMiss(Exception):
+    """Replay mode got a request that was never recorded"""
+
+
+def request_key(request: httpx.Request) -> str:
+    """Content address of a request: method, path and body, ignoring host, headers and JSON key order"""
+    body = request.read()
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode("utf-8")
+    except ValueError:
+        pass
+    digest = hashlib.sha256(f"{request.method} {request.url.raw_path.decode('ascii')}\n".encode("utf-8"))
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    """Passes response chunks through, noting each chunk and its delay; saves them once fully read"""
+
+    def __init__(self, stream: httpx.SyncByteStream, on_complete):
+        self._stream = stream
+        self._on_complete = on_complete
+        self._chunks: List[bytes] = []
+        self._delays: List[float] = []
+        self._complete = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        last = time.monotonic()
+        for chunk in self._stream:
+            now = time.monotonic()
+            self._chunks.append(chunk)
+            self._delays.append(round(now - last, 4))
+            last = now
+            yield chunk
+        self._complete = True
+
+    def close(self) -> None:
+        self._stream.close()
+        # A stream closed early (e.g. a cancelled request) is not a complete response
+        if self._complete:
+            self._on_complete(self._chunks, self._delays)
+            self._complete = False
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, chunks: List[bytes], delays: Optional[List[float]]):
+        self._chunks = chunks
+        self._delays = delays
+
+    def __iter__(self) -> Iterator[bytes]:
+        for i, chunk in enumerate(self._chunks):
+            if self._delays:
+                time.sleep(self._delays[i])
+            yield chunk
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """httpx transport that records model calls to, or replays them from, a cassette store.
+
+    Each successful response is stored as `<cassette_dir>/<key[:2]>/<key>.json`,
+    keyed by `request_key`, with its body split into the chunks it arrived in and
+    the delay before each, so streamed responses replay chunk by chunk.
+
+    Modes: "record" always calls the network and (over)writes cassettes,
+    "replay" serves only from cassettes and fails on a miss, and "auto" replays
+    when a cassette exists and records otherwise. With `realistic_latency` the
+    recorded time to first byte and chunk delays are reproduced; otherwise
+    replays are instant.
+    """
+
+    def __init__(self, mode: str, cassette_dir: str = "cassettes", realistic_latency: bool = False,
+                 transport: Optional[httpx.BaseTransport] = None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}'; expected one of {', '.join(MODES)}")
+        self.mode = mode
+        self.cassette_dir = cassette_dir
+        self.realistic_latency = realistic_latency
+        self._transport = transport or httpx.HTTPTransport()
+        self._local = threading.local()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cassette_dir, key[:2], f"{key}.json")
+
+    def offline(self) -> bool:
+        """Whether the last request on this thread was answered without the network"""
+        return getattr(self._local, "offline", False)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request)
+        self._local.offline = self.mode != "record"
+        if self.mode != "record":
+            cassette = self._load(key)
+            if cassette:
+                return self._replay(request, cassette)
+            if self.mode == "replay":
+                logger.warning("No cassette for %s %s (%s)", request.method, request.url.path, key)
+                raise CassetteMiss(f"No recorded response for this request (cassette {key})")
+        self._local.offline = False
+        return self._record(request, key)
+
+    def _load(self, key: str) -> Optional[Dict]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _replay(self, request: httpx.Request, cassette: Dict) -> httpx.Response:
+        body = cassette["body"]
+        body = base64.b64decode(body) if cassette.get("encoding") == "base64" else body.encode("utf-8")
+        chunks, position = [], 0
+        for size in cassette["chunks"]:
+            chunks.append(body[position:position + size])
+            position += size
+        if self.realistic_latency:
+            time.sleep(cassette.get("first_byte_seconds", 0))
+        return httpx.Response(
+            cassette["status"], headers=cassette["headers"], request=request,
+            stream=_ReplayStream(chunks, cassette["delays"] if self.realistic_latency else None)
+        )
+
+    def _record(self, request: httpx.Request, key: str) -> httpx.Response:
+        start = time.monotonic()
+        response = self._transport.handle_request(request)
+        first_byte = time.monotonic() - start
+        if not 200 <= response.status_code < 300:
+            # Failures are not worth replaying; a rerun should try them again
+            return response
+
+        def save(chunks: List[bytes], delays: List[float]) -> None:
+            body = b"".join(chunks)
+            try:
+                text, encoding = body.decode("utf-8"), "utf-8"
+            except UnicodeDecodeError:
+                text, encoding = base64.b64encode(body).decode("ascii"), "base64"
+            cassette = {
+                "request": {"method": request.method, "path": request.url.path},
+                "status": response.status_code,
+                "headers": [[k, v] for k, v in response.headers.multi_items() if k.lower() not in VOLATILE_HEADERS],
+                "first_byte_seconds": round(first_byte, 4),
+                "chunks": [len(chunk) for chunk in chunks],
+                "delays": delays,
+                "encoding": encoding,
+                "body": text
+            }
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(cassette, f)
+            os.replace(temp_path, path)
+
+        return httpx.Response(
+            response.status_code, headers=response.headers, request=request,
+            stream=_RecordingStream(response.stream, save), extensions=response.extensions
+        )
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+def create_transport() -> Optional[CassetteTransport]:
+    """Build a cassette transport from SCISIFT_CASSETTE_* environment variables, if a mode is set"""
+    mode = os.getenv("SCISIFT_CASSETTE_MODE", "").strip().lower()
+    if not mode or mode == "off":
+        return None
+    return CassetteTransport(
+        mode,
+        cassette_dir=os.getenv("SCISIFT_CASSETTE_DIR", "cassettes"),
+        realistic_latency=os.getenv("SCISIFT_CASSETTE_LATENCY", "zero").strip().lower() == "recorded"
+    )
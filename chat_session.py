@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+class ChatSession:
+    """One conversation as an append-only JSONL log.
+
+    Only the byte offset of each message is kept in memory; messages are
+    read from disk a page at a time when they are needed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.id = os.path.splitext(os.path.basename(path))[0]
+        self._lock = threading.Lock()
+        # A line cut short by a crash is skipped, and cut off before the next append
+        self._valid_end: Optional[int] = None
+        self.offsets: List[int] = self._index()
+
+    def _index(self) -> List[int]:
+        """Byte offsets of every complete line, found without parsing them"""
+        offsets = []
+        if not os.path.exists(self.path):
+            return offsets
+        position = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if line.endswith(b"\n"):
+                    offsets.append(position)
+                else:
+                    self._valid_end = position
+                position += len(line)
+        return offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def append(self, role: str, content: str) -> Dict:
+        """Add a message to the end of the log"""
+        message = {"role": role, "content": content, "time": datetime.now().isoformat(timespec="seconds")}
+        data = (json.dumps(message) + "\n").encode('utf-8')
+        with self._lock:
+            if self._valid_end is not None:
+                os.truncate(self.path, self._valid_end)
+                self._valid_end = None
+            with open(self.path, 'ab') as f:
+                self.offsets.append(f.tell())
+                f.write(data)
+        return message
+
+    def items(self, start: int, end: int) -> List[Tuple[int, Dict]]:
+        """(position, message) for messages start..end-1, read from disk; unreadable lines are skipped"""
+        items = []
+        with open(self.path, 'rb') as f:
+            for index in range(max(0, start), max(0, min(end, len(self.offsets)))):
+                f.seek(self.offsets[index])
+                try:
+                    items.append((index, json.loads(f.readline())))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+        return items
+
+    def read(self, start: int, end: int) -> List[Dict]:
+        """Messages start..end-1, read from disk; unreadable lines are skipped"""
+        return [message for _, message in self.items(start, end)]
+
+    def tail(self, count: int) -> List[Dict]:
+        """The last `count` messages"""
+        return self.read(len(self) - count, len(self))
+
+
+class ChatSessionStore:
+    """Directory of chat session logs, newest last"""
+
+    def __init__(self, sessions_dir: str = "chat_sessions"):
+        self.sessions_dir = sessions_dir
+        os.makedirs(sessions_dir, exist_ok=True)
+
+    def list_sessions(self) -> List[str]:
+        """Session ids, oldest first"""
+        return sorted(os.path.splitext(f)[0] for f in os.listdir(self.sessions_dir) if f.endswith(".jsonl"))
+
+    def open(self, session_id: str) -> ChatSession:
+        return ChatSession(os.path.join(self.sessions_dir, f"{session_id}.jsonl"))
+
+    def create(self) -> ChatSession:
+        """Start a new, empty session"""
+        base = datetime.now().strftime("%Y%m%d-%H%M%S")
+        session_id, suffix = base, 1
+        while os.path.exists(os.path.join(self.sessions_dir, f"{session_id}.jsonl")):
+            suffix += 1
+            session_id = f"{base}-{suffix}"
+        # Create the file so the session shows up in the list right away
+        open(os.path.join(self.sessions_dir, f"{session_id}.jsonl"), 'a').close()
+        return self.open(session_id)
+
+    def latest(self) -> Optional[ChatSession]:
+        """The most recent session, if any"""
+        sessions = self.list_sessions()
+        return self.open(sessions[-1]) if sessions else None
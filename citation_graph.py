@@ -0,0 +1,379 @@
+import re
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DOI_PATTERN = re.compile(r"\b(10\.\d{4,9}/[^\s\"<>]+)", re.IGNORECASE)
+
+# Starts of numbered reference entries: "[12] ...", "12. ...", "12 Smith, ..."
+_NUMBERED_ENTRY = re.compile(r"^\s*(?:\[\d{1,4}\]|\d{1,4}\.\s|\d{1,4}\s+[A-Z])")
+
+# Starts of author-year entries: "Smith, J." / "van der Berg, A."
+_AUTHOR_ENTRY = re.compile(r"^\s*(?:[a-z]+\s)*[A-Z][A-Za-z'\-]+,\s+[A-Z]")
+
+# Titles are compared on their first words, which survives most formatting differences
+TITLE_KEY_WORDS = 8
+
+# Shorter titles are too generic to be searched for inside reference text. Titles are
+# found there through an index of every run of this many words in each reference
+MIN_SEARCH_WORDS = 4
+
+
+def normalize(text: str) -> str:
+    """Lower-cased words of a text separated by single spaces"""
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def find_dois(text: str) -> List[str]:
+    """DOIs mentioned in a text, normalized to lower case without trailing punctuation"""
+    return [doi.rstrip(".,;:)]}").lower() for doi in DOI_PATTERN.findall(text)]
+
+
+def title_key(title: Optional[str]) -> Optional[str]:
+    """Comparable key of a title: its first lower-cased words"""
+    words = normalize(title or "").split()
+    return " ".join(words[:TITLE_KEY_WORDS]) if len(words) >= 3 else None
+
+
+def _word_hash(words: str) -> int:
+    """64-bit key of a run of words, to index reference text compactly"""
+    return int.from_bytes(hashlib.blake2b(words.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+def search_key(key: Optional[str]) -> Optional[int]:
+    """Index key of a title key long enough to be searched for: a hash of its first words"""
+    words = (key or "").split()
+    return _word_hash(" ".join(words[:MIN_SEARCH_WORDS])) if len(words) >= MIN_SEARCH_WORDS else None
+
+
+def word_runs(norm: str) -> List[int]:
+    """Index keys of every run of MIN_SEARCH_WORDS words in normalized text"""
+    words = norm.split()
+    return list({_word_hash(" ".join(words[i:i + MIN_SEARCH_WORDS]))
+                 for i in range(len(words) - MIN_SEARCH_WORDS + 1)})
+
+
+def parse_front_matter(text: str) -> Tuple[Optional[str], Optional[str]]:
+    """Guess a paper's title and DOI from the start of its text"""
+    title = None
+    for line in text.splitlines()[:8]:
+        line = line.strip()
+        if 3 <= len(line.split()) and len(line) <= 200 and not DOI_PATTERN.search(line):
+            title = line
+            break
+    dois = find_dois(text)
+    return title, dois[0] if dois else None
+
+
+def split_references(text: str) -> List[str]:
+    """Split a reference list into entries, joining wrapped lines"""
+    lines = [line for line in text.splitlines() if line.strip()]
+    numbered = sum(1 for line in lines if _NUMBERED_ENTRY.match(line))
+    starts = _NUMBERED_ENTRY if numbered >= 2 else _AUTHOR_ENTRY
+    entries: List[str] = []
+    for line in lines:
+        if starts.match(line) or not entries:
+            entries.append(line.strip())
+        else:
+            # Re-join words hyphenated across lines
+            entries[-1] = entries[-1][:-1] + line.strip() if entries[-1].endswith("-") \
+                else f"{entries[-1]} {line.strip()}"
+    return [entry for entry in entries if len(entry) > 20]
+
+
+# Leading author list: "Smith, J., Doe, A. B. and", "A. Vaswani, N. Shazeer," or "et al."
+_AUTHORS = re.compile(
+    r"^(?:(?:[A-Z][\w'\-]+,?\s+(?:[A-Z]\.\s?-?)+|(?:[A-Z]\.\s?-?)+\s*[A-Z][\w'\-]+)[,;.]?\s*(?:and\s+|&\s*)?)+"
+    r"(?:et al\.?,?\s*)?(?:\(?\d{4}[a-z]?\)?[.,]?\s*)?"
+)
+
+
+def reference_title(entry: str) -> Optional[str]:
+    """Guess the title inside a reference entry"""
+    quoted = re.search(r"[“\"]([^”\"]{10,})[”\"]", entry)
+    if quoted:
+        return quoted.group(1)
+    entry = re.sub(r"^\s*(?:\[\d+\]|\d+\.)\s*", "", entry)
+    stripped = _AUTHORS.sub("", entry, count=1)
+    if stripped != entry:
+        return re.split(r"(?<=[a-z0-9?!)])\.\s", stripped, maxsplit=1)[0].strip()
+    # Unknown layout: the title is the first segment after the authors that reads like a phrase
+    for segment in re.split(r"(?<=[a-z0-9)?])\.\s+", entry)[1:]:
+        if len(re.findall(r"\b[a-z]{3,}\b", segment)) >= 2:
+            return segment.strip()
+    return None
+
+
+class CitationGraph:
+    """Citations between the papers of a corpus and the works they reference, in SQLite.
+
+    Each indexed paper stores its reference entries; a reference is resolved
+    to a corpus paper when its DOI or title key matches, or the paper's title
+    appears in its text. Every match is an index lookup (titles are found
+    through the runs of words of each reference), so adding or updating a
+    paper only touches that paper's references and those pointing at it.
+    """
+
+    def __init__(self, db_file: str = "citation_graph.db"):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._create_schema()
+
+    def _create_schema(self) -> None:
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS papers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    path TEXT UNIQUE NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    title TEXT,
+                    title_key TEXT,
+                    search_key INTEGER,
+                    doi TEXT,
+                    updated REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS papers_doi ON papers(doi);
+                CREATE INDEX IF NOT EXISTS papers_title_key ON papers(title_key);
+                CREATE TABLE IF NOT EXISTS refs (
+                    paper_id INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    doi TEXT,
+                    title_key TEXT,
+                    norm TEXT NOT NULL,
+                    target TEXT NOT NULL,
+                    cited_id INTEGER,
+                    work_key TEXT
+                );
+                CREATE INDEX IF NOT EXISTS refs_paper ON refs(paper_id);
+                CREATE INDEX IF NOT EXISTS refs_doi ON refs(doi);
+                CREATE INDEX IF NOT EXISTS refs_title_key ON refs(title_key);
+                CREATE INDEX IF NOT EXISTS refs_target ON refs(target);
+                CREATE INDEX IF NOT EXISTS refs_cited ON refs(cited_id);
+                CREATE TABLE IF NOT EXISTS ref_words (
+                    run INTEGER NOT NULL,
+                    paper_id INTEGER NOT NULL,
+                    PRIMARY KEY (run, paper_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS ref_words_paper ON ref_words(paper_id);
+            """)
+            # The cited work: "paper:<id>" once resolved to a corpus paper, else the target
+            columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(refs)")]
+            if "work_key" not in columns:
+                self.conn.execute("ALTER TABLE refs ADD COLUMN work_key TEXT")
+            self.conn.execute("UPDATE refs SET work_key = COALESCE('paper:' || cited_id, target) WHERE work_key IS NULL")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS refs_work ON refs(work_key, paper_id)")
+            # Graphs built before titles were searched through an index
+            columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(papers)")]
+            if "search_key" not in columns:
+                self.conn.execute("ALTER TABLE papers ADD COLUMN search_key INTEGER")
+                self.conn.executemany("UPDATE papers SET search_key = ? WHERE id = ?", [
+                    (search_key(row["title_key"]), row["id"])
+                    for row in self.conn.execute("SELECT id, title_key FROM papers").fetchall()
+                ])
+                self.conn.executemany("INSERT OR IGNORE INTO ref_words (run, paper_id) VALUES (?, ?)", [
+                    (run, row["paper_id"])
+                    for row in self.conn.execute("SELECT paper_id, norm FROM refs").fetchall()
+                    for run in word_runs(row["norm"])
+                ])
+            self.conn.execute("CREATE INDEX IF NOT EXISTS papers_search_key ON papers(search_key)")
+
+    def _resolve(self, doi: Optional[str], key: Optional[str], norm: str, exclude: int) -> Optional[int]:
+        """Corpus paper matching a reference's DOI, title key, or title appearing in its text"""
+        if doi:
+            row = self.conn.execute("SELECT id FROM papers WHERE doi = ? AND id != ?", (doi, exclude)).fetchone()
+            if row:
+                return row["id"]
+        if key:
+            row = self.conn.execute("SELECT id FROM papers WHERE title_key = ? AND id != ?", (key, exclude)).fetchone()
+            if row:
+                return row["id"]
+        runs = word_runs(norm)
+        padded = f" {norm} "
+        for start in range(0, len(runs), 500):
+            batch = runs[start:start + 500]
+            for row in self.conn.execute(
+                f"SELECT id, title_key FROM papers WHERE search_key IN ({self._in(batch)}) AND id != ? ORDER BY id",
+                batch + [exclude]
+            ):
+                if f" {row['title_key']} " in padded:
+                    return row["id"]
+        return None
+
+    def is_current(self, path: str, fingerprint: str) -> bool:
+        """Whether a paper is indexed in this exact version"""
+        with self._lock:
+            row = self.conn.execute("SELECT fingerprint FROM papers WHERE path = ?", (path,)).fetchone()
+        return row is not None and row["fingerprint"] == fingerprint
+
+    def add_paper(self, path: str, fingerprint: str, front_text: str, references_text: str) -> int:
+        """Index a paper and its references, skipping it if this version is already indexed"""
+        title, doi = parse_front_matter(front_text)
+        key = title_key(title)
+        entries = split_references(references_text)
+        now = time.time()
+        with self._lock, self.conn:
+            row = self.conn.execute("SELECT id, fingerprint FROM papers WHERE path = ?", (path,)).fetchone()
+            if row and row["fingerprint"] == fingerprint:
+                return row["id"]
+            if row:
+                paper_id = row["id"]
+                self.conn.execute(
+                    "UPDATE papers SET fingerprint = ?, title = ?, title_key = ?, search_key = ?, doi = ?, "
+                    "updated = ? WHERE id = ?",
+                    (fingerprint, title, key, search_key(key), doi, now, paper_id)
+                )
+                self._delete_refs(paper_id)
+                self.conn.execute("UPDATE refs SET cited_id = NULL, work_key = target WHERE cited_id = ?", (paper_id,))
+            else:
+                paper_id = self.conn.execute(
+                    "INSERT INTO papers (path, fingerprint, title, title_key, search_key, doi, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (path, fingerprint, title, key, search_key(key), doi, now)
+                ).lastrowid
+
+            for entry in entries:
+                dois = find_dois(entry)
+                ref_doi = dois[0] if dois else None
+                ref_key = title_key(reference_title(entry))
+                norm = normalize(entry)
+                target = (f"doi:{ref_doi}" if ref_doi else f"title:{ref_key}" if ref_key
+                          else "text:" + hashlib.md5(norm.encode()).hexdigest())
+                cited_id = self._resolve(ref_doi, ref_key, norm, paper_id)
+                work_key = f"paper:{cited_id}" if cited_id is not None else target
+                self.conn.execute(
+                    "INSERT INTO refs (paper_id, text, doi, title_key, norm, target, cited_id, work_key) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (paper_id, entry, ref_doi, ref_key, norm, target, cited_id, work_key)
+                )
+                self.conn.executemany("INSERT OR IGNORE INTO ref_words (run, paper_id) VALUES (?, ?)",
+                                      [(run, paper_id) for run in word_runs(norm)])
+
+            # Earlier papers may already cite this one; only their unresolved references are looked at
+            work_key = f"paper:{paper_id}"
+            if doi:
+                self.conn.execute("UPDATE refs SET cited_id = ?, work_key = ? WHERE doi = ? AND cited_id IS NULL "
+                                  "AND paper_id != ?", (paper_id, work_key, doi, paper_id))
+            if key:
+                self.conn.execute("UPDATE refs SET cited_id = ?, work_key = ? WHERE title_key = ? "
+                                  "AND cited_id IS NULL AND paper_id != ?", (paper_id, work_key, key, paper_id))
+            if search_key(key) is not None:
+                padded = f" {key} "
+                # CROSS JOIN keeps SQLite from scanning every unresolved reference first
+                rows = self.conn.execute(
+                    "SELECT r.rowid, r.norm FROM ref_words w CROSS JOIN refs r ON r.paper_id = w.paper_id "
+                    "WHERE w.run = ? AND w.paper_id != ? AND r.cited_id IS NULL",
+                    (search_key(key), paper_id)
+                ).fetchall()
+                self.conn.executemany("UPDATE refs SET cited_id = ?, work_key = ? WHERE rowid = ?", [
+                    (paper_id, work_key, row["rowid"]) for row in rows if padded in f" {row['norm']} "
+                ])
+        return paper_id
+
+    def _delete_refs(self, paper_id: int) -> None:
+        self.conn.execute("DELETE FROM ref_words WHERE paper_id = ?", (paper_id,))
+        self.conn.execute("DELETE FROM refs WHERE paper_id = ?", (paper_id,))
+
+    def remove_missing(self, paths: Iterable[str]) -> int:
+        """Drop papers that are no longer in the corpus; returns how many were removed"""
+        keep = set(paths)
+        with self._lock, self.conn:
+            gone = [row["id"] for row in self.conn.execute("SELECT id, path FROM papers") if row["path"] not in keep]
+            for paper_id in gone:
+                self._delete_refs(paper_id)
+                self.conn.execute("UPDATE refs SET cited_id = NULL, work_key = target WHERE cited_id = ?", (paper_id,))
+                self.conn.execute("DELETE FROM papers WHERE id = ?", (paper_id,))
+        return len(gone)
+
+    def _match(self, query: str) -> Tuple[List[int], List[str]]:
+        """Corpus paper ids and external reference targets a query (path, DOI or title) refers to"""
+        dois = find_dois(query)
+        key = title_key(query)
+        with self._lock:
+            ids = [row["id"] for row in self.conn.execute(
+                "SELECT id FROM papers WHERE path = ? OR path LIKE ? OR doi = ? OR title_key = ?",
+                (query, f"%/{query}", dois[0] if dois else None, key)
+            )]
+        targets = [f"doi:{doi}" for doi in dois] + ([f"title:{key}"] if key else [])
+        return ids, targets
+
+    @staticmethod
+    def _in(values: List) -> str:
+        return ", ".join("?" * len(values)) or "NULL"
+
+    def citing(self, query: str) -> List[Dict]:
+        """Corpus papers that cite the paper a query refers to"""
+        ids, targets = self._match(query)
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT DISTINCT p.path, p.title FROM refs r JOIN papers p ON p.id = r.paper_id "
+                f"WHERE r.cited_id IN ({self._in(ids)}) OR r.target IN ({self._in(targets)}) ORDER BY p.path",
+                ids + targets
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def most_cited(self, limit: int = 10, external: bool = False) -> List[Dict]:
+        """Works cited by the most corpus papers: corpus papers, or works outside the corpus"""
+        with self._lock:
+            if external:
+                rows = self.conn.execute(
+                    "SELECT MIN(text) AS title, NULL AS path, COUNT(DISTINCT paper_id) AS citations FROM refs "
+                    "WHERE cited_id IS NULL GROUP BY target ORDER BY citations DESC, title LIMIT ?", (limit,)
+                ).fetchall()
+            else:
+                rows = self.conn.execute(
+                    "SELECT p.title, p.path, COUNT(DISTINCT r.paper_id) AS citations FROM refs r "
+                    "JOIN papers p ON p.id = r.cited_id GROUP BY r.cited_id ORDER BY citations DESC, p.path LIMIT ?",
+                    (limit,)
+                ).fetchall()
+        return [dict(row) for row in rows]
+
+    def co_cited(self, query: str, limit: int = 10) -> List[Dict]:
+        """Works most often cited together with the paper a query refers to"""
+        ids, targets = self._match(query)
+        this = f"(r.cited_id IN ({self._in(ids)}) OR r.target IN ({self._in(targets)}))"
+        with self._lock:
+            rows = self.conn.execute(
+                f"WITH citing AS (SELECT DISTINCT r.paper_id FROM refs r WHERE {this}) "
+                f"SELECT MIN(COALESCE(p.title, r.text)) AS title, p.path, COUNT(DISTINCT r.paper_id) AS citations "
+                f"FROM refs r JOIN citing c ON c.paper_id = r.paper_id LEFT JOIN papers p ON p.id = r.cited_id "
+                f"WHERE NOT {this} GROUP BY r.work_key "
+                f"ORDER BY citations DESC, title LIMIT ?",
+                ids + targets + ids + targets + [limit]
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def further_readings(self, path: str, limit: int = 5) -> List[Dict]:
+        """Reading suggestions for a corpus paper; empty only if it has no indexed references"""
+        with self._lock:
+            row = self.conn.execute("SELECT id FROM papers WHERE path = ?", (path,)).fetchone()
+            if not row:
+                return []
+            # How many corpus papers cite each of this paper's references
+            rows = self.conn.execute(
+                "SELECT MIN(COALESCE(p.title, mine.text)) AS title, p.path, COUNT(DISTINCT r.paper_id) AS citations "
+                "FROM refs mine JOIN refs r ON r.work_key = mine.work_key LEFT JOIN papers p ON p.id = mine.cited_id "
+                "WHERE mine.paper_id = ? GROUP BY mine.work_key "
+                "ORDER BY citations DESC, title LIMIT ?",
+                (row["id"], limit)
+            ).fetchall()
+        references = [dict(r) for r in rows]
+        # References shared with other papers first, then works co-cited with this
+        # paper, then the rest of its own references
+        readings = [r for r in references if r["citations"] > 1]
+        for candidate in self.co_cited(path, limit) + references:
+            if len(readings) >= limit:
+                break
+            if candidate["title"] not in {r["title"] for r in readings}:
+                readings.append(candidate)
+        return readings
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            papers = self.conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+            references = self.conn.execute("SELECT COUNT(*) FROM refs").fetchone()[0]
+            resolved = self.conn.execute("SELECT COUNT(*) FROM refs WHERE cited_id IS NOT NULL").fetchone()[0]
+        return {"papers": papers, "references": references, "resolved": resolved}
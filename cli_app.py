@@ -1,18 +1,69 @@
 from dotenv import load_dotenv
-from os.path import isfile, join
+from os.path import isfile, join, getmtime, abspath
 from os import listdir, makedirs
-from ai_service import chat_with_ai, explain_paper, profile_manager
+from ai_service import (
+    chat_with_ai, explain_paper, explain_papers_packed, estimate_paper_cost,
+    profile_manager, model_router, summary_manager, usage_ledger, structured_store,
+    citation_graph, index_paper_citations, rate_limiter, revision_store, answer_cache, document_manager
+)
+from rate_limiter import BATCH
+from document_manager import SECTION_NAMES
+from job_store import JobStore
+from synthesis import synthesize_papers
+from prefetch import create_prefetcher
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import difflib
+import json
+import sys
+import time
+import threading
 
 # Ensure papers directory exists
 papers_dir = "papers"
 makedirs(papers_dir, exist_ok=True)
 
+# Shown above a draft summary until the full summary replaces it
+DRAFT_LABEL = "[Draft from the abstract and conclusion]"
+
+# File inputs handed to one packed analysis with analyze --pack-tokens
+PACK_BATCH_SIZE = 32
+
+# Model chosen with --model; None lets the router pick per request
+selected_model = None
+
+# Prepares listed papers in the background while the user picks one
+prefetcher = create_prefetcher()
+
 def line_break(empty=False):
     if empty:
         print("\n")
     else:
         print("===================")
 
+def read_sections():
+    print(f"Sections to send ({', '.join(SECTION_NAMES)}; comma-separated, empty for whole paper):")
+    sections = [s.strip().lower() for s in input().split(',') if s.strip()]
+    return [s for s in sections if s in SECTION_NAMES]
+
+def print_draft(draft):
+    """Show a progressive draft while the full summary is computed"""
+    print(f"{DRAFT_LABEL}\n\n{draft}")
+    line_break(True)
+    print("Refining with the full paper...\n")
+
+def confirm_large_job(paper_path):
+    """Show a pre-flight estimate for large papers and ask to continue"""
+    estimate = estimate_paper_cost(paper_path, model=selected_model)
+    if "error" in estimate or estimate["cached"]:
+        return True
+    if estimate["prompt_tokens"] < (usage_ledger.budgets.get("preflightTokens") or 0):
+        return True
+    print(f"This paper is large: about {estimate['prompt_tokens']} input and "
+          f"{estimate['completion_tokens']} output tokens on {estimate['model']}, "
+          f"estimated cost ${estimate['cost']:.4f}.")
+    print("Continue? (yes/no):")
+    return input().strip().lower() == 'yes'
+
 def normal_chat():
     line_break(True)
     active_profile = profile_manager.get_active_profile()
@@ -39,7 +90,7 @@ def normal_chat():
             continue
             
         if message:
-            print("\nAI:", chat_with_ai(message, use_profile=use_profile))
+            print("\nAI:", chat_with_ai(message, model=selected_model, use_profile=use_profile))
         line_break(True)
         print("Enter your message (or 'exit' to return to main menu, 'profile' to toggle profile):")
 
@@ -70,23 +121,34 @@ def explain_paper_chat():
                 print(f"{i}. {paper}")
             print("\nEnter the number of the paper to analyze (or 0 to cancel):")
             
+            # Prepare the most recently added papers while the user chooses
+            paper_paths = [join(papers_dir, paper) for paper in papers]
+            prefetcher.prefetch(sorted(paper_paths, key=getmtime, reverse=True), model=selected_model)
+            
             try:
                 paper_index = int(input())
                 if paper_index == 0:
+                    prefetcher.cancel()
                     continue
                 if paper_index < 1 or paper_index > len(papers):
+                    prefetcher.cancel()
                     print("Invalid paper number")
                     continue
                     
-                paper_path = join(papers_dir, papers[paper_index - 1])
+                paper_path = paper_paths[paper_index - 1]
+                prefetched = prefetcher.claim(paper_path) or {}
+                if not prefetched.get("cached") and not confirm_large_job(paper_path):
+                    continue
                 print(f"\nAnalyzing paper {paper_path}...")
                 line_break(True)
-                result = explain_paper("file", paper_path=paper_path)
+                result = explain_paper("file", paper_path=paper_path, model=selected_model or prefetched.get("model"),
+                                       on_draft=print_draft)
                 if result:
                     print(result)
                 else:
                     print("Failed to analyze paper")
             except ValueError:
+                prefetcher.cancel()
                 print("Please enter a valid number")
                 
         elif choice == 2:
@@ -97,7 +159,7 @@ def explain_paper_chat():
                 
             print(f"\nAnalyzing paper from {url}...")
             line_break(True)
-            result = explain_paper("url", url=url)
+            result = explain_paper("url", url=url, model=selected_model)
             if result:
                 print(result)
             else:
@@ -143,6 +205,7 @@ def manage_profiles():
                     print("Output Style:")
                     for key, value in profile.get('outputStyle', {}).items():
                         print(f"  - {key}: {value}")
+                    print(f"Sections: {', '.join(profile.get('sections') or ['whole paper'])}")
                     print()
         
         elif choice == 2:
@@ -182,6 +245,8 @@ def manage_profiles():
             print("Include visual aids? (yes/no):")
             visual_aids = input().strip().lower() == 'yes'
             
+            sections = read_sections()
+            
             profile_data = {
                 "name": name,
                 "description": description,
@@ -193,6 +258,8 @@ def manage_profiles():
                     "visualAids": visual_aids
                 }
             }
+            if sections:
+                profile_data["sections"] = sections
             
             try:
                 profile_manager.create_profile(profile_data)
@@ -258,6 +325,14 @@ def manage_profiles():
                     print("Include visual aids? (yes/no):")
                     profile['outputStyle']['visualAids'] = input().strip().lower() == 'yes'
                 
+                print("Update sections to send? (yes/no):")
+                if input().strip().lower() == 'yes':
+                    sections = read_sections()
+                    if sections:
+                        profile['sections'] = sections
+                    else:
+                        profile.pop('sections', None)
+                
                 profile_manager.update_profile(profile['name'], profile)
                 print("Profile updated successfully!")
             except ValueError as e:
@@ -330,6 +405,7 @@ def main_menu():
             print(f"Active Profile: {active_profile['name']}")
         else:
             print("No active profile selected")
+        print(f"Model: {selected_model or 'auto (routed per request)'}")
             
         print("\n1. Chat with AI")
         print("2. Analyze scientific paper")
@@ -355,6 +431,386 @@ def main_menu():
         else:
             print("Invalid choice")
 
-def run_cli():
+def _print_cache_stats(stats):
+    print(f"Entries: {stats['entries']}")
+    print(f"Compressed entries: {stats['compressed_bytes']} bytes")
+    print(f"Cache file: {stats['file_bytes']} bytes")
+    print(f"Hits: {stats['hits']}, misses: {stats['misses']} (hit ratio {stats['hit_ratio']:.1%})")
+    print(f"Expired: {stats['expired']}, drafts: {stats['drafts']}")
+    print("Age distribution:")
+    for bucket, count in stats['ages'].items():
+        print(f"  {bucket}: {count}")
+
+def run_cache_command(action, path=None, documents=True):
+    if action in ("export", "import", "sync"):
+        if not path:
+            print(f"Error: '{action}' needs a {'directory' if action == 'sync' else 'file'} path")
+            return
+        from cache_transfer import export_cache, import_cache, sync_cache
+        documents = document_manager if documents else None
+        if action == "export":
+            stats = export_cache(path, summary_manager, documents)
+            print(f"Exported {stats['summaries']} summaries and {stats['documents']} documents to {path}")
+        elif action == "import":
+            try:
+                stats = import_cache(path, summary_manager, documents)
+            except (OSError, ValueError) as e:
+                print(f"Error: {str(e)}")
+                return
+            print(f"Imported {stats['summaries']} summaries and {stats['documents']} documents from {path}")
+        else:
+            try:
+                stats = sync_cache(path, summary_manager, documents)
+            except (OSError, ValueError) as e:
+                print(f"Error: {str(e)}")
+                return
+            print(f"Pushed {stats['pushed_summaries']} summaries and {stats['pushed_documents']} documents, "
+                  f"pulled {stats['pulled_summaries']} summaries and {stats['pulled_documents']} documents")
+            if stats['skipped_files']:
+                print(f"Skipped {stats['skipped_files']} unreadable shared files (see scisift.log)")
+        return
+
+    # Chat answers are kept like summaries and maintained with them
+    caches = [("Summaries", summary_manager), ("Chat answers", answer_cache)]
+    if action == "stats":
+        for i, (name, cache) in enumerate(caches):
+            if i:
+                print()
+            print(f"{name}:")
+            _print_cache_stats(cache.get_stats())
+    elif action == "gc":
+        profile_names = [p['name'] for p in profile_manager.get_all_profiles()]
+        for name, cache in caches:
+            print(f"{name}: removed {cache.collect_garbage(profile_names)} stale entries")
+    elif action == "expire":
+        for name, cache in caches:
+            print(f"{name}: removed {cache.expire()} expired entries")
+    elif action == "clear":
+        for _, cache in caches:
+            cache.clear()
+        print("Summary and answer caches cleared")
+
+def run_usage_command(by):
+    totals = usage_ledger.rollup(by)
+    if not totals:
+        print("No usage recorded yet")
+        return
+    print(f"{by.capitalize():<40} {'Requests':>8} {'Prompt':>10} {'Completion':>10} {'Cached':>10} {'Cost ($)':>10}")
+    for group, total in sorted(totals.items()):
+        print(f"{group[:40]:<40} {total['requests']:>8} {total['prompt_tokens']:>10} "
+              f"{total['completion_tokens']:>10} {total['cached_tokens']:>10} {total['cost']:>10.4f}")
+
+def run_rate_limit_command():
+    if not rate_limiter.enabled:
+        print("No rate limits configured (see the rateLimits section of settings.json)")
+        return
+    status = rate_limiter.get_status()
+    print(f"{'Limit':<40} {'Kind':<10} {'Available':>12} {'Per minute':>12}")
+    for bucket in status['buckets']:
+        print(f"{bucket['model'][:40]:<40} {bucket['kind']:<10} {bucket['level']:>12.0f} {bucket['capacity']:>12.0f}")
+    if status['waits']:
+        print(f"\n{'Priority':<12} {'Model':<40} {'Requests':>8} {'Delayed':>8} {'Wait (s)':>10} {'Max (s)':>8}")
+        for row in status['waits']:
+            print(f"{row['priority']:<12} {row['model'][:40]:<40} {row['requests']:>8} {row['delayed']:>8} "
+                  f"{row['seconds']:>10.1f} {row['max_seconds']:>8.1f}")
+
+def run_enqueue_command(store_file, paths, urls=False, profile=None, model=None):
+    if urls:
+        kind, papers = "url", paths
+    else:
+        kind, papers = "file", _expand_paper_paths(paths)
+
+    # Pin the profile now so workers do not depend on their own active profile
+    if not profile:
+        active_profile = profile_manager.get_active_profile()
+        profile = active_profile['name'] if active_profile else None
+
+    store = JobStore(store_file)
+    ids = store.enqueue(kind, papers, profile=profile, model=model)
+    store.close()
+    print(f"Enqueued {len(ids)} jobs in {store_file}")
+
+def run_jobs_command(store_file, action):
+    store = JobStore(store_file)
+    if action == "status":
+        counts = store.get_counts()
+        for status in ("queued", "leased", "done", "failed"):
+            print(f"{status}: {counts.get(status, 0)}")
+    elif action == "results":
+        # One JSON record per finished job
+        for job in store.iter_jobs("done"):
+            sys.stdout.write(json.dumps({
+                "id": job["id"], "paper": job["paper"], "profile": job["profile"],
+                "model": job["model"], "summary": job["summary"]
+            }) + "\n")
+    elif action == "failed":
+        for job in store.iter_jobs("failed"):
+            print(f"{job['id']}: {job['paper']} ({job['attempts']} attempts): {job['error']}")
+    elif action == "requeue-failed":
+        print(f"Re-queued {store.requeue_failed()} failed jobs")
+    store.close()
+
+def _parse_pipe_input(line, line_number):
+    """Parse one input line: a path, a URL, or a JSON object with id and path/url"""
+    if line.startswith('{'):
+        record = json.loads(line)
+        if "url" in record:
+            return record.get("id", line_number), "url", record["url"]
+        return record.get("id", line_number), "file", record["path"]
+    if line.startswith(('http://', 'https://')):
+        return line_number, "url", line
+    return line_number, "file", line
+
+def _analyze_one(input_id, kind, paper, profile, model, structured=False):
+    start = time.monotonic()
+    record = {"id": input_id, "input": paper}
+    keys = []
+    try:
+        if kind == "file":
+            result = explain_paper("file", paper_path=paper, model=model, profile_name=profile, structured=structured,
+                                   on_key=keys.append)
+        else:
+            result = explain_paper("url", url=paper, model=model, profile_name=profile, structured=structured,
+                                   on_key=keys.append)
+        if not result or result.startswith("Error:"):
+            record.update(status="error", error=result or "empty result")
+        else:
+            record.update(status="ok", summary=result)
+            if structured:
+                record["fields"] = structured_store.get(keys[-1]) if keys else None
+    except Exception as e:
+        record.update(status="error", error=str(e))
+    record["elapsed"] = round(time.monotonic() - start, 3)
+    return record
+
+def _analyze_packed(inputs, profile, model, structured, pack_tokens):
+    """Analyze (id, path) file inputs with packed requests; returns one record per input"""
+    start = time.monotonic()
+    keys = {}
+    try:
+        results = explain_papers_packed([paper for _, paper in inputs], pack_tokens, model=model,
+                                        profile_name=profile, structured=structured, on_key=keys.__setitem__)
+    except Exception as e:
+        results = {paper: f"Error: {str(e)}" for _, paper in inputs}
+    elapsed = round(time.monotonic() - start, 3)
+    records = []
+    for input_id, paper in inputs:
+        record = {"id": input_id, "input": paper}
+        result = results.get(paper)
+        if not result or result.startswith("Error:"):
+            record.update(status="error", error=result or "empty result")
+        else:
+            record.update(status="ok", summary=result)
+            if structured:
+                record["fields"] = structured_store.get(keys[paper]) if paper in keys else None
+        record["elapsed"] = elapsed
+        records.append(record)
+    return records
+
+def run_analyze_command(source, profile=None, model=None, concurrency=4, structured=False, pack_tokens=None):
+    """Analyze papers listed on stdin, writing one JSON record per result as it completes.
+
+    At most `concurrency` inputs are read ahead, so memory stays flat for any input size.
+    Records are written by the worker that finishes them, so a slow input stream
+    never holds back finished results. With `pack_tokens`, files are taken
+    PACK_BATCH_SIZE at a time and small ones share requests of up to that many tokens.
+    """
+    try:
+        stream = sys.stdin if source == '-' else open(source, 'r')
+    except OSError as e:
+        print(f"Error: {str(e)}")
+        return
+    rate_limiter.priority = BATCH
+    output_lock = threading.Lock()
+    pending = set()
+    batch = []
+
+    def write(records):
+        with output_lock:
+            for record in records:
+                sys.stdout.write(json.dumps(record) + "\n")
+            sys.stdout.flush()
+
+    def on_done(future):
+        result = future.result()
+        write(result if isinstance(result, list) else [result])
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        def submit(func, *args):
+            future = executor.submit(func, *args)
+            future.add_done_callback(on_done)
+            pending.add(future)
+
+        def submit_batch():
+            submit(_analyze_packed, list(batch), profile, model, structured, pack_tokens)
+            batch.clear()
+
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                input_id, kind, paper = _parse_pipe_input(line, line_number)
+            except (ValueError, KeyError) as e:
+                write([{"id": line_number, "input": line, "status": "error", "error": f"Invalid input: {e}"}])
+                continue
+            if pack_tokens and kind == "file":
+                batch.append((input_id, paper))
+                if len(batch) < PACK_BATCH_SIZE:
+                    continue
+                submit_batch()
+            else:
+                submit(_analyze_one, input_id, kind, paper, profile, model, structured)
+            if len(pending) >= concurrency:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                pending.difference_update(done)
+        if batch:
+            submit_batch()
+    if stream is not sys.stdin:
+        stream.close()
+
+def run_query_command(min_sample_size=None, max_sample_size=None, profile=None, list_field=None):
+    if list_field:
+        try:
+            items = structured_store.list_items(list_field, profile)
+        except ValueError as e:
+            print(f"Error: {str(e)}")
+            return
+        for item in items:
+            print(f"{item['paper']}: {item['item']}")
+        return
+
+    for row in structured_store.query(min_sample_size, max_sample_size, profile):
+        sample_size = row['sample_size'] if row['sample_size'] is not None else "n/a"
+        print(f"{row['paper']} (n={sample_size}, profile: {row['profile']}, model: {row['model']})")
+
+def _expand_paper_paths(paths):
+    """Expand directories into the files they contain"""
+    papers = []
+    for path in paths:
+        if isfile(path):
+            papers.append(path)
+        else:
+            papers.extend(join(path, f) for f in sorted(listdir(path)) if isfile(join(path, f)))
+    return papers
+
+def run_synthesize_command(paths, profile=None, model=None, group_size=5, concurrency=4):
+    rate_limiter.priority = BATCH
+    papers = _expand_paper_paths(paths)
+    print(f"Synthesizing {len(papers)} papers...", file=sys.stderr)
+    result = synthesize_papers(
+        papers, model=model, profile_name=profile, group_size=group_size, max_workers=concurrency,
+        on_progress=lambda message: print(message, file=sys.stderr)
+    )
+    print(result)
+
+def _print_works(works):
+    for work in works:
+        location = work['path'] or "not in corpus"
+        print(f"{work['citations']:>4}  {work['title']} ({location})")
+
+def run_citations_command(action, query=None, limit=10, paper_dir="papers"):
+    if action in ('citing', 'cocited') and not query:
+        print(f"Error: '{action}' needs a paper path, DOI or title")
+        return
+
+    if action == 'build':
+        papers = _expand_paper_paths([paper_dir])
+        for i, paper in enumerate(papers, 1):
+            error = index_paper_citations(paper)
+            if error:
+                print(f"{paper}: {error}", file=sys.stderr)
+            print(f"Indexed {i}/{len(papers)}", end="\r", file=sys.stderr)
+        removed = citation_graph.remove_missing(abspath(p) for p in papers)
+        print(file=sys.stderr)
+        if removed:
+            print(f"Removed {removed} papers no longer in {paper_dir}")
+        action = 'stats'
+
+    if action == 'stats':
+        stats = citation_graph.get_stats()
+        print(f"Papers: {stats['papers']}")
+        print(f"References: {stats['references']} ({stats['resolved']} to papers in the corpus)")
+    elif action == 'citing':
+        for paper in citation_graph.citing(query):
+            print(f"{paper['path']}: {paper['title'] or '(untitled)'}")
+    elif action == 'top':
+        _print_works(citation_graph.most_cited(limit))
+    elif action == 'external':
+        _print_works(citation_graph.most_cited(limit, external=True))
+    elif action == 'cocited':
+        _print_works(citation_graph.co_cited(query, limit))
+
+def run_revisions_command(paper=None, show=None, diff=None):
+    if paper is None and show is None and diff is None:
+        print("Error: 'revisions' needs a paper path, --show or --diff")
+        return
+    if show is not None or diff is not None:
+        revision = revision_store.get(show if show is not None else diff)
+        if revision is None:
+            print(f"Error: No revision {show if show is not None else diff}")
+        elif show is not None:
+            print(revision['summary'])
+        else:
+            previous = revision_store.previous(revision)
+            if previous is None:
+                print(f"Revision {revision['id']} is the first recorded version")
+                return
+            sys.stdout.writelines(difflib.unified_diff(
+                previous['summary'].splitlines(keepends=True), revision['summary'].splitlines(keepends=True),
+                fromfile=f"revision {previous['id']}", tofile=f"revision {revision['id']}"
+            ))
+        return
+
+    revisions = revision_store.history(abspath(paper))
+    if not revisions:
+        print(f"No revisions recorded for {paper}")
+        return
+    print(f"{'ID':>5}  {'Summarized':<16}  {'Profile':<24} {'Model':<36} Changes")
+    for revision in revisions:
+        changed = revision['changed']
+        if changed is None:
+            changes = "full summary"
+        else:
+            changes = f"updated from {', '.join(changed)}" if changed else "no relevant changes"
+        print(f"{revision['id']:>5}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(revision['created']))}  "
+              f"{(revision['profile'] or 'none')[:24]:<24} {(revision['model'] or '')[:36]:<36} {changes}")
+
+def run_clusters_command(paper_dir="papers", n_clusters=None, recluster=False, members=False,
+                         representatives=False):
+    # numpy and scipy are only needed here
+    from clustering import create_corpus_index
+    index = create_corpus_index(profile_manager.get_setting("clustering", {}))
+    papers = _expand_paper_paths([paper_dir])
+    stats = index.update(
+        papers, on_progress=lambda done, total: print(f"Indexed {done}/{total}", end="\r", file=sys.stderr)
+    )
+    print(f"\n{stats['added']} added, {stats['updated']} updated, {stats['removed']} removed, "
+          f"{stats['failed']} failed", file=sys.stderr)
+    if recluster or n_clusters:
+        index.cluster(n_clusters)
+
+    if representatives:
+        # One path per line, ready for `analyze -`
+        for path in index.representatives():
+            print(path)
+        return
+    for number, cluster in enumerate(index.clusters, 1):
+        duplicates = cluster['duplicates']
+        print(f"Cluster {number}: {len(cluster['members'])} papers, {len(duplicates)} duplicates - "
+              f"{', '.join(cluster['terms'])}")
+        print(f"  * {cluster['representative']}")
+        if members:
+            for path in cluster['members']:
+                if path == cluster['representative']:
+                    continue
+                note = f" (duplicate of {duplicates[path]})" if path in duplicates else ""
+                print(f"    {path}{note}")
+
+def run_cli(model=None):
+    global selected_model
     load_dotenv()
+    if model and model not in model_router.get_models():
+        print(f"Note: model '{model}' is not in the routing configuration")
+    selected_model = model
     main_menu() 
\ No newline at end of file
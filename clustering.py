@@ -0,0 +1,358 @@
+import os
+import re
+import json
+import math
+import zlib
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from scipy import sparse
+from document_manager import DocumentManager
+
+# Words are hashed into this many features, so no shared vocabulary is needed
+# and papers can be added at any time
+N_FEATURES = 1 << 16
+
+# Only the start of very long documents (e.g. proceedings) is used
+MAX_CHARS = 200_000
+
+# Rows multiplied against the centroids at once
+BATCH_ROWS = 4096
+
+# Pairwise similarities computed at once when looking for duplicates in a cluster
+MAX_SIMILARITY_CELLS = 4_000_000
+
+WORD_PATTERN = re.compile(r"[a-z]{3,25}")
+
+STOP_WORDS = frozenset("""
+about above after again against all also among and any are because been before being below between both but
+can could did does doing down during each either et al fig figure few for from further had has have having
+her here hers him his how however into its itself just may might more most must not now off once only other
+our out over own same she should since some such than that the their them then there these they this those
+through thus table under until upon use used using very was were what when where whether which while who
+whom why will with within without would yet you your
+""".split())
+
+# Extraction runs in worker processes, each with its own document manager
+_documents: Optional[DocumentManager] = None
+
+
+def _paper_terms(args: Tuple[str, int]) -> Tuple[str, Optional[List[Tuple[str, int]]], Optional[str]]:
+    """Most frequent words of a paper as (path, [(word, count)], error)"""
+    global _documents
+    path, max_terms = args
+    if _documents is None:
+        _documents = DocumentManager()
+    try:
+        document = _documents.load(path)
+        counts: Counter = Counter()
+        size = 0
+        for chunk in _documents.iter_text(document):
+            counts.update(w for w in WORD_PATTERN.findall(chunk.lower()) if w not in STOP_WORDS)
+            size += len(chunk)
+            if size >= MAX_CHARS:
+                break
+        return path, counts.most_common(max_terms), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def _feature(word: str) -> int:
+    return zlib.crc32(word.encode("utf-8")) & (N_FEATURES - 1)
+
+
+def _normalize_rows(matrix):
+    """Scale the rows of a sparse or dense matrix to unit length"""
+    if sparse.issparse(matrix):
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms).dot(matrix).tocsr()
+    norms = np.linalg.norm(matrix, axis=1)
+    norms[norms == 0] = 1
+    return matrix / norms[:, None]
+
+
+class CorpusIndex:
+    """Hashed TF-IDF vectors of a paper corpus, with topic clusters and near-duplicates.
+
+    Each paper keeps the counts of its `max_terms` most frequent words as one
+    row of a sparse matrix in `<index_dir>/counts.npz`; `update` extracts only
+    new or changed papers. `cluster` runs spherical k-means over the L2-normalized
+    TF-IDF rows, picks the paper closest to each centroid as its representative,
+    and marks papers within a cluster whose cosine similarity exceeds
+    `duplicate_threshold` as duplicates of one of them. Papers added later are
+    assigned to the nearest existing centroid until the corpus has grown by
+    `recluster_growth`, when the clusters are recomputed.
+    """
+
+    def __init__(self, index_dir: str = "corpus_index", max_terms: int = 300, duplicate_threshold: float = 0.95,
+                 recluster_growth: float = 0.2):
+        self.index_dir = index_dir
+        self.max_terms = max_terms
+        self.duplicate_threshold = duplicate_threshold
+        self.recluster_growth = recluster_growth
+        os.makedirs(index_dir, exist_ok=True)
+        state = self._read_json("papers.json", {})
+        # path -> {"row", "size", "mtime_ns"}
+        self.papers: Dict[str, Dict] = state.get("papers", {})
+        self.clustered_count = state.get("clustered_count", 0)
+        counts_path = os.path.join(index_dir, "counts.npz")
+        self.counts = (sparse.load_npz(counts_path).tocsr() if os.path.exists(counts_path)
+                       else sparse.csr_matrix((0, N_FEATURES), dtype=np.float32))
+        # Feature -> a word hashed to it, for labelling clusters
+        self.words: Dict[int, str] = {int(k): v for k, v in self._read_json("words.json", {}).items()}
+        self.clusters: List[Dict] = self._read_json("clusters.json", [])
+
+    def _read_json(self, name: str, default):
+        try:
+            with open(os.path.join(self.index_dir, name), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return default
+
+    def _write_json(self, name: str, data) -> None:
+        path = os.path.join(self.index_dir, name)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _save(self) -> None:
+        # Written first, so an interrupted save leaves the old rows referenced
+        sparse.save_npz(os.path.join(self.index_dir, "counts.tmp.npz"), self.counts)
+        os.replace(os.path.join(self.index_dir, "counts.tmp.npz"), os.path.join(self.index_dir, "counts.npz"))
+        self._write_json("words.json", self.words)
+        self._write_json("papers.json", {"papers": self.papers, "clustered_count": self.clustered_count})
+        self._write_json("clusters.json", self.clusters)
+
+    def _compact(self) -> None:
+        """Drop rows of removed or re-extracted papers"""
+        paths = sorted(self.papers, key=lambda p: self.papers[p]["row"])
+        self.counts = self.counts[[self.papers[p]["row"] for p in paths]]
+        for row, path in enumerate(paths):
+            self.papers[path]["row"] = row
+
+    def update(self, paths: Iterable[str], workers: Optional[int] = None,
+               on_progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+        """Index new and changed papers among `paths` and forget papers no longer listed"""
+        stats = {"added": 0, "updated": 0, "removed": 0, "failed": 0}
+        wanted = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            wanted[os.path.abspath(path)] = (stat.st_size, stat.st_mtime_ns)
+        for path in [p for p in self.papers if p not in wanted]:
+            del self.papers[path]
+            stats["removed"] += 1
+        todo = [p for p, (size, mtime_ns) in wanted.items()
+                if p not in self.papers or (self.papers[p]["size"], self.papers[p]["mtime_ns"]) != (size, mtime_ns)]
+
+        rows, cols, values, new_paths = [], [], [], []
+        features: Dict[str, int] = {}
+        # Spawned workers do not inherit the threads and open files of the GUI or CLI
+        with ProcessPoolExecutor(max_workers=workers if todo else 1,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            results = executor.map(_paper_terms, [(p, self.max_terms) for p in todo], chunksize=16)
+            for done, (path, terms, error) in enumerate(results, 1):
+                if on_progress:
+                    on_progress(done, len(todo))
+                if terms is None:
+                    stats["failed"] += 1
+                    continue
+                merged: Counter = Counter()
+                for word, count in terms:
+                    feature = features.get(word)
+                    if feature is None:
+                        feature = features[word] = _feature(word)
+                        self.words.setdefault(feature, word)
+                    merged[feature] += count
+                row = len(new_paths)
+                rows.extend([row] * len(merged))
+                cols.extend(merged.keys())
+                values.extend(merged.values())
+                stats["updated" if path in self.papers else "added"] += 1
+                new_paths.append(path)
+
+        if new_paths:
+            new_counts = sparse.csr_matrix((np.array(values, dtype=np.float32), (rows, cols)),
+                                           shape=(len(new_paths), N_FEATURES))
+            first_row = self.counts.shape[0]
+            self.counts = sparse.vstack([self.counts, new_counts], format="csr")
+            for i, path in enumerate(new_paths):
+                size, mtime_ns = wanted[path]
+                self.papers[path] = {"row": first_row + i, "size": size, "mtime_ns": mtime_ns}
+        if self.counts.shape[0] > 1.25 * len(self.papers) + 100:
+            self._compact()
+
+        if len(self.papers) > (1 + self.recluster_growth) * self.clustered_count or not self.clusters:
+            self.cluster()
+        elif stats["added"] or stats["updated"] or stats["removed"]:
+            self._assign(new_paths)
+        self._save()
+        return stats
+
+    def _vectors(self, paths: List[str], idf: np.ndarray):
+        """Normalized TF-IDF rows of papers, with sublinear term frequencies"""
+        counts = self.counts[[self.papers[p]["row"] for p in paths]]
+        counts.data = np.log1p(counts.data)
+        return _normalize_rows(counts.multiply(idf).tocsr())
+
+    def _idf(self, paths: List[str]) -> np.ndarray:
+        counts = self.counts[[self.papers[p]["row"] for p in paths]]
+        df = np.bincount(counts.indices, minlength=N_FEATURES)
+        return (np.log((1 + len(paths)) / (1 + df)) + 1).astype(np.float32)
+
+    @staticmethod
+    def _nearest(vectors, centroids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Nearest centroid and its cosine similarity for every row, in batches"""
+        labels = np.empty(vectors.shape[0], dtype=np.int64)
+        similarity = np.empty(vectors.shape[0], dtype=np.float32)
+        for start in range(0, vectors.shape[0], BATCH_ROWS):
+            scores = vectors[start:start + BATCH_ROWS] @ centroids.T
+            labels[start:start + BATCH_ROWS] = scores.argmax(axis=1)
+            similarity[start:start + BATCH_ROWS] = scores.max(axis=1)
+        return labels, similarity
+
+    def cluster(self, n_clusters: Optional[int] = None, iterations: int = 25, seed: int = 0) -> List[Dict]:
+        """Recompute topic clusters of the whole corpus with spherical k-means"""
+        paths = sorted(self.papers)
+        self.clustered_count = len(paths)
+        if not paths:
+            self.clusters = []
+            return self.clusters
+        idf = self._idf(paths)
+        vectors = self._vectors(paths, idf)
+        k = min(len(paths), n_clusters or max(1, round(math.sqrt(len(paths) / 2))))
+
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(len(paths), k, replace=False)].toarray()
+        labels = np.full(len(paths), -1)
+        for _ in range(iterations):
+            new_labels, similarity = self._nearest(vectors, centroids)
+            if np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+            membership = sparse.csr_matrix((np.ones(len(paths), dtype=np.float32), (labels, np.arange(len(paths)))),
+                                           shape=(k, len(paths)))
+            centroids = np.asarray((membership @ vectors).todense())
+            # An empty cluster restarts at the paper that fits its own cluster worst
+            empty = np.flatnonzero(np.bincount(labels, minlength=k) == 0)
+            if len(empty):
+                centroids[empty] = vectors[np.argsort(similarity)[:len(empty)]].toarray()
+            centroids = _normalize_rows(centroids)
+
+        np.save(os.path.join(self.index_dir, "centroids.npy"), centroids.astype(np.float32))
+        np.save(os.path.join(self.index_dir, "idf.npy"), idf)
+        self.clusters = []
+        for cluster_id in range(k):
+            members = np.flatnonzero(labels == cluster_id)
+            if not len(members):
+                continue
+            best = members[np.argmax(similarity[members])]
+            self.clusters.append({
+                "id": cluster_id,
+                "terms": self._top_terms(centroids[cluster_id]),
+                "representative": paths[best],
+                "members": [paths[i] for i in members],
+                "duplicates": self._duplicates([paths[i] for i in members], vectors[members], paths[best])
+            })
+        self.clusters.sort(key=lambda c: len(c["members"]), reverse=True)
+        self._save()
+        return self.clusters
+
+    def _assign(self, new_paths: List[str]) -> None:
+        """Put new papers into the nearest existing cluster and drop removed ones"""
+        centroids_path = os.path.join(self.index_dir, "centroids.npy")
+        if not os.path.exists(centroids_path):
+            self.cluster()
+            return
+        centroids = np.load(centroids_path)
+        idf = np.load(os.path.join(self.index_dir, "idf.npy"))
+        by_id = {c["id"]: c for c in self.clusters}
+        new = set(new_paths)
+        for cluster in self.clusters:
+            cluster["members"] = [p for p in cluster["members"] if p in self.papers and p not in new]
+        if new_paths:
+            labels, _ = self._nearest(self._vectors(new_paths, idf), centroids)
+            for path, label in zip(new_paths, labels):
+                cluster = by_id.get(int(label))
+                if cluster is None:
+                    cluster = by_id[int(label)] = {"id": int(label), "terms": self._top_terms(centroids[label]),
+                                                   "representative": path, "members": [], "duplicates": {}}
+                    self.clusters.append(cluster)
+                cluster["members"].append(path)
+        touched = {int(label) for label in labels} if new_paths else set()
+        for cluster in self.clusters:
+            if cluster["representative"] not in self.papers and cluster["members"]:
+                cluster["representative"] = cluster["members"][0]
+                touched.add(cluster["id"])
+            if cluster["id"] in touched or any(p not in self.papers for p in cluster["duplicates"]):
+                members = cluster["members"]
+                cluster["duplicates"] = self._duplicates(members, self._vectors(members, idf),
+                                                         cluster["representative"])
+        self.clusters = [c for c in self.clusters if c["members"]]
+        self.clusters.sort(key=lambda c: len(c["members"]), reverse=True)
+
+    def _top_terms(self, centroid: np.ndarray, count: int = 6) -> List[str]:
+        return [self.words.get(int(f), f"#{f}") for f in np.argsort(centroid)[::-1][:count] if centroid[f] > 0]
+
+    def _duplicates(self, paths: List[str], vectors, representative: str) -> Dict[str, str]:
+        """Map each near-duplicate paper to the paper it duplicates, preferring the representative"""
+        parent = list(range(len(paths)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        # Each batch is compared with itself and the rows after it, in blocks of bounded size,
+        # and only the pairs over the threshold are kept
+        batch_rows = max(1, MAX_SIMILARITY_CELLS // max(1, len(paths)))
+        for start in range(0, len(paths), batch_rows):
+            similarity = (vectors[start:start + batch_rows] @ vectors[start:].T).tocsr()
+            similarity.data[similarity.data < self.duplicate_threshold] = 0
+            similarity.eliminate_zeros()
+            close = similarity.tocoo()
+            for i, j in zip(close.row + start, close.col + start):
+                if i < j:
+                    parent[find(j)] = find(i)
+
+        groups: Dict[int, List[int]] = {}
+        for i in range(len(paths)):
+            groups.setdefault(find(i), []).append(i)
+        duplicates = {}
+        for group in groups.values():
+            if len(group) < 2:
+                continue
+            names = [paths[i] for i in group]
+            keep = representative if representative in names else min(names)
+            duplicates.update({name: keep for name in names if name != keep})
+        return duplicates
+
+    def representatives(self) -> List[str]:
+        """Representative papers, largest cluster first"""
+        return [c["representative"] for c in self.clusters]
+
+
+def load_clusters(index_dir: str = "corpus_index") -> List[Dict]:
+    """Clusters saved by the last update, without loading the term matrix"""
+    try:
+        with open(os.path.join(index_dir, "clusters.json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def create_corpus_index(settings: Optional[Dict] = None) -> CorpusIndex:
+    """Build a corpus index from the clustering section of settings.json"""
+    settings = settings or {}
+    return CorpusIndex(
+        index_dir=settings.get("indexDir", "corpus_index"),
+        max_terms=settings.get("maxTermsPerPaper", 300),
+        duplicate_threshold=settings.get("duplicateThreshold", 0.95),
+        recluster_growth=settings.get("reclusterGrowth", 0.2)
+    )
@@ -0,0 +1,360 @@
+import json
+import os
+import re
+import mmap
+import codecs
+import threading
+import hashlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import extractors
+from summary_manager import SummaryManager
+
+# Canonical section names a profile can select
+SECTION_NAMES = ["abstract", "introduction", "methods", "results", "discussion", "references"]
+
+# Heading variants mapped to their canonical section
+SECTION_HEADINGS = {
+    "abstract": r"abstract|summary",
+    "introduction": r"introduction|background",
+    "methods": r"methods?|methodology|materials and methods|experimental (?:setup|design)|study design",
+    "results": r"results?(?: and discussion)?|findings|experiments|evaluation",
+    "discussion": r"discussion|conclusions?|concluding remarks|general discussion",
+    "references": r"references|bibliography|works cited|literature cited",
+}
+
+# Optional numbering such as "2.", "3.1" or "IV." before the heading text
+_NUMBERING = r"(?:\d+(?:\.\d+)*\.?|[IVX]+\.)?\s*"
+
+# One alternation with a named group per section, so each line is matched once
+_HEADING_PATTERN = re.compile(
+    rf"^\s*{_NUMBERING}(?:{'|'.join(f'(?P<{name}>{pattern})' for name, pattern in SECTION_HEADINGS.items())})\s*[:.]?\s*$",
+    re.IGNORECASE
+)
+
+# Abstracts are often run-in: "Abstract—We propose ..."
+_INLINE_ABSTRACT = re.compile(r"^\s*abstract\s*[:.—–-]\s*(\S.*)$", re.IGNORECASE)
+
+# Version of the on-disk cache layout; entries in older layouts are re-extracted
+CACHE_FORMAT = 3
+
+# Imported documents are cached under their content hash instead of a path fingerprint
+SHARED_PREFIX = "content-"
+
+class ExtractionCancelled(Exception):
+    """Raised when an extraction is stopped through its cancel event"""
+
+
+# Bytes decoded at a time when streaming cached text
+READ_CHUNK_SIZE = 1 << 20
+
+
+def memory_usage_mb() -> float:
+    """Resident memory of this process in MB, or 0 if it cannot be measured"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    # Without /proc fall back to the peak, reported in bytes on macOS and KB elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if peak > 1 << 32 else peak / 1024
+
+
+def _match_heading(line: str) -> Optional[str]:
+    """Return the canonical section name if the line is a section heading"""
+    if len(line) > 60:
+        return None
+    match = _HEADING_PATTERN.match(line)
+    return match.lastgroup if match else None
+
+
+class _SectionDetector:
+    """Finds section boundaries page by page as byte offsets into the spilled text"""
+
+    def __init__(self):
+        self.sections: List[Dict] = []
+        self.current = {"name": "front_matter", "title": "", "start_page": 1, "end_page": 1, "start": 0}
+
+    def feed(self, page: str, page_number: int, offset: int) -> None:
+        for line in page.split("\n"):
+            line_bytes = len(line.encode('utf-8')) + 1
+            name = _match_heading(line)
+            title, body_start = line.strip(), offset + line_bytes
+            if not name:
+                match = _INLINE_ABSTRACT.match(line)
+                if match:
+                    name, title = "abstract", "Abstract"
+                    body_start = offset + len(line[:match.start(1)].encode('utf-8'))
+
+            # Only the first occurrence of a section opens it; repeated
+            # headings (e.g. "Results" in a figure caption) stay in place
+            if name and name not in {s["name"] for s in self.sections} and name != self.current["name"]:
+                self.current["end"] = offset
+                self.sections.append(self.current)
+                self.current = {
+                    "name": name,
+                    "title": title,
+                    "start_page": page_number,
+                    "end_page": page_number,
+                    "start": body_start,
+                }
+            else:
+                self.current["end_page"] = page_number
+            offset += line_bytes
+
+    def finish(self, end: int) -> List[Dict]:
+        self.current["end"] = end
+        self.sections.append(self.current)
+        return [s for s in self.sections if s["end"] > s["start"] or s["name"] != "front_matter"]
+
+
+class DocumentManager:
+    """Extracts documents page by page into cached text files with a section index.
+
+    Only one page is held in memory during extraction; the text is spilled to
+    `<fingerprint>.txt` and the index keeps byte offsets of pages and sections.
+    Readers memory-map the text file and decode just the slices they need.
+    """
+
+    def __init__(self, cache_dir: str = "document_cache", max_rss_mb: Optional[float] = None):
+        self.cache_dir = cache_dir
+        self.max_rss_mb = max_rss_mb
+        # Whether imported documents exist; looked up on the first cache miss
+        self._has_shared: Optional[bool] = None
+
+    def _fingerprint(self, file_path: str) -> str:
+        """Generate a cache key from the file path, size and modification time"""
+        stat = os.stat(file_path)
+        key_content = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        return hashlib.md5(key_content.encode()).hexdigest()
+
+    def _cache_path(self, fingerprint: str) -> str:
+        return os.path.join(self.cache_dir, f"{fingerprint}.json")
+
+    def _text_path(self, fingerprint: str) -> str:
+        return os.path.join(self.cache_dir, f"{fingerprint}.txt")
+
+    def check_memory(self, extra_mb: float = 0.0) -> None:
+        """Raise MemoryError if resident memory (plus an expected allocation) exceeds the cap"""
+        if not self.max_rss_mb:
+            return
+        usage = memory_usage_mb() + extra_mb
+        if usage > self.max_rss_mb:
+            raise MemoryError(f"Memory use of {usage:.0f} MB would exceed the {self.max_rss_mb} MB cap")
+
+    def _load_cached(self, fingerprint: str) -> Optional[Dict]:
+        """Load a document index from the cache"""
+        cache_path = self._cache_path(fingerprint)
+        if not os.path.exists(cache_path) or not os.path.exists(self._text_path(fingerprint)):
+            return None
+
+        try:
+            with open(cache_path, 'r') as f:
+                document = json.load(f)
+        except json.JSONDecodeError:
+            return None
+        return document if document.get("format") == CACHE_FORMAT else None
+
+    def iter_pages(self, file_path: str) -> Iterator[str]:
+        """Yield the text of each page with the cheapest extractor for the file's content"""
+        return extractors.iter_pages(file_path)
+
+    def _extract(self, file_path: str, fingerprint: str, cancel_event=None) -> Dict:
+        """Spill the pages of a file to the cache and build its index"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        text_path = self._text_path(fingerprint)
+        # Unique per thread, since a prefetch and an analysis may extract the same file
+        tmp_path = f"{text_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        extractor, source = extractors.select(file_path)
+        detector = _SectionDetector()
+        page_offsets = []
+        try:
+            with open(tmp_path, 'wb') as f:
+                for page_number, page in enumerate(extractor.iter_pages(source), 1):
+                    if cancel_event and cancel_event.is_set():
+                        raise ExtractionCancelled(f"Extraction of {file_path} cancelled")
+                    self.check_memory()
+                    start = f.tell()
+                    detector.feed(page, page_number, start)
+                    data = page.encode('utf-8')
+                    f.write(data)
+                    f.write(b"\n")
+                    page_offsets.append([start, start + len(data)])
+                end = f.tell()
+            os.replace(tmp_path, text_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        document = {
+            "format": CACHE_FORMAT,
+            "source": file_path,
+            "extractor": extractor.name,
+            "member": source.name if source.name != os.path.abspath(file_path) else None,
+            "fingerprint": fingerprint,
+            "content_hash": SummaryManager.hash_file(file_path),
+            "page_count": len(page_offsets),
+            "text_bytes": end,
+            "page_offsets": page_offsets,
+            "sections": detector.finish(end),
+        }
+        index_tmp_path = f"{self._cache_path(fingerprint)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(index_tmp_path, 'w') as f:
+            json.dump(document, f)
+        os.replace(index_tmp_path, self._cache_path(fingerprint))
+        return document
+
+    def _load_shared(self, file_path: str) -> Optional[Dict]:
+        """Look up an imported document with the same content as the file"""
+        if self._has_shared is None:
+            self._has_shared = os.path.isdir(self.cache_dir) and any(
+                name.startswith(SHARED_PREFIX) for name in os.listdir(self.cache_dir)
+            )
+        if not self._has_shared:
+            return None
+        return self._load_cached(SHARED_PREFIX + SummaryManager.hash_file(file_path))
+
+    def load(self, file_path: str, cancel_event=None) -> Dict:
+        """Return the document index for a file, extracting it if not cached"""
+        fingerprint = self._fingerprint(file_path)
+        return (self._load_cached(fingerprint) or self._load_shared(file_path)
+                or self._extract(file_path, fingerprint, cancel_event))
+
+    def iter_documents(self) -> Iterator[Tuple[str, Dict]]:
+        """Yield (content hash, index) of every cached document whose text is current"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in sorted(os.listdir(self.cache_dir)):
+            if not name.endswith(".json"):
+                continue
+            document = self._load_cached(name[:-len(".json")])
+            if document is None:
+                continue
+            content_hash = document.get("content_hash")
+            if not content_hash:
+                # Indexes written before content hashes were recorded; trust them only if the file is unchanged
+                source = document.get("source")
+                if not source or not os.path.exists(source) or self._fingerprint(source) != document["fingerprint"]:
+                    continue
+                content_hash = SummaryManager.hash_file(source)
+            yield content_hash, document
+
+    def has_document(self, content_hash: str) -> bool:
+        """Whether an imported document with this content hash is cached"""
+        return self._load_cached(SHARED_PREFIX + content_hash) is not None
+
+    def import_document(self, content_hash: str, document: Dict, chunks: Iterable[str]) -> bool:
+        """Store an exported document under its content hash, streaming its text from `chunks`.
+
+        Returns False, after consuming the chunks, if the index is of another cache format.
+        """
+        if document.get("format") != CACHE_FORMAT:
+            for _ in chunks:
+                pass
+            return False
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fingerprint = SHARED_PREFIX + content_hash
+        document = dict(document, fingerprint=fingerprint, content_hash=content_hash)
+        text_path = self._text_path(fingerprint)
+        tmp_path = f"{text_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk.encode('utf-8'))
+            os.replace(tmp_path, text_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        index_tmp_path = f"{self._cache_path(fingerprint)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(index_tmp_path, 'w') as f:
+            json.dump(document, f)
+        os.replace(index_tmp_path, self._cache_path(fingerprint))
+        self._has_shared = True
+        return True
+
+    def _spans(self, document: Dict, sections: Optional[List[str]] = None) -> List[Tuple[int, int, Optional[str]]]:
+        """Byte ranges of the requested text with the heading to print before each"""
+        if sections:
+            selected = [s for s in document["sections"] if s["name"] in sections]
+            if selected:
+                # Keep the front matter so the model still sees title and authors
+                front = [(s["start"], min(s["end"], s["start"] + 2000), "")
+                         for s in document["sections"] if s["name"] == "front_matter"]
+                return front + [(s["start"], s["end"], s["title"]) for s in selected]
+        return [(0, document["text_bytes"], None)]
+
+    def get_text_size(self, document: Dict, sections: Optional[List[str]] = None) -> int:
+        """Size in bytes of the text get_text would return, without reading it"""
+        return sum(end - start for start, end, _ in self._spans(document, sections))
+
+    def iter_text(self, document: Dict, sections: Optional[List[str]] = None) -> Iterator[str]:
+        """Stream the document text in chunks, limited to the given sections if any were detected"""
+        if not document["text_bytes"]:
+            return
+        with open(self._text_path(document["fingerprint"]), 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for i, (start, end, title) in enumerate(self._spans(document, sections)):
+                if title is not None and i > 0:
+                    yield "\n\n"
+                if title:
+                    yield title + "\n"
+                decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+                chunks = (decoder.decode(mapped[i:min(end, i + READ_CHUNK_SIZE)], final=i + READ_CHUNK_SIZE >= end)
+                          for i in range(start, end, READ_CHUNK_SIZE))
+                if title is None:
+                    yield from chunks
+                    continue
+                # Section text is trimmed like a stripped string, one chunk behind
+                previous = next(chunks, "").lstrip()
+                for chunk in chunks:
+                    yield previous
+                    previous = chunk
+                yield previous.rstrip()
+
+    def iter_page_texts(self, document: Dict) -> Iterator[str]:
+        """Stream the cached text of each page"""
+        with open(self._text_path(document["fingerprint"]), 'rb') as f:
+            for start, end in document["page_offsets"]:
+                f.seek(start)
+                yield f.read(end - start).decode('utf-8', errors='ignore')
+
+    def get_text(self, document: Dict, sections: Optional[List[str]] = None) -> str:
+        """Get the document text, limited to the given sections if any were detected"""
+        # A str takes up to four bytes per character, so check the cap before building it
+        self.check_memory(self.get_text_size(document, sections) * 4 / (1 << 20))
+        return "".join(self.iter_text(document, sections))
+
+    def get_section_text(self, document: Dict, name: str) -> str:
+        """Text of a single detected section, or an empty string"""
+        with open(self._text_path(document["fingerprint"]), 'rb') as f:
+            for section in document["sections"]:
+                if section["name"] == name:
+                    f.seek(section["start"])
+                    return f.read(section["end"] - section["start"]).decode('utf-8', errors='ignore').strip()
+        return ""
+
+    def get_section_hashes(self, document: Dict) -> List[Dict]:
+        """Name, title, size and content hash of each detected section, in document order.
+
+        Whitespace is collapsed before hashing so re-extraction noise does not count as a change.
+        """
+        hashes = []
+        with open(self._text_path(document["fingerprint"]), 'rb') as f:
+            for section in document["sections"]:
+                f.seek(section["start"])
+                text = f.read(section["end"] - section["start"]).decode('utf-8', errors='ignore')
+                hashes.append({
+                    "name": section["name"],
+                    "title": section["title"],
+                    "bytes": section["end"] - section["start"],
+                    "hash": hashlib.blake2b(" ".join(text.split()).encode('utf-8'), digest_size=16).hexdigest()
+                })
+        return hashes
+
+    def get_section_names(self, document: Dict) -> List[str]:
+        """Get the names of the sections detected in a document"""
+        return [s["name"] for s in document["sections"]]
@@ -0,0 +1,465 @@
+import io
+import os
+import re
+import gzip
+import tarfile
+import zipfile
+import posixpath
+from html.parser import HTMLParser
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+from PyPDF2 import PdfReader
+
+# Bytes read from the start of a file to identify its format
+HEADER_SIZE = 4096
+
+# How deep archives inside archives are searched
+MAX_ARCHIVE_DEPTH = 2
+
+# Archive members that accompany a paper but are not a representation of it
+AUXILIARY_MEMBER = re.compile(
+    r"^(?:00)?(?:readme|licen[cs]e|copying|notice|authors|changelog|changes|manifest)\b"
+    r"|\.(?:bbl|bib|bst|blg|aux|log|out|toc|cls|sty|clo|cfg|def)$",
+    re.IGNORECASE
+)
+
+# Archive members that no extractor reads: figures, fonts, media and binary data
+ASSET_MEMBER = re.compile(
+    r"\.(?:png|jpe?g|gif|bmp|tiff?|eps|ps|svg|ttf|otf|pfb|afm|mp3|mp4|wav|avi|mov"
+    r"|npy|npz|h5|hdf5|mat|pkl|pickle|pt|pth|ckpt|o|so|dll|exe|class|pyc)$",
+    re.IGNORECASE
+)
+
+
+class UnsupportedFormat(ValueError):
+    """Raised when no extractor recognizes a file"""
+
+
+class Source:
+    """A file or archive member that can be (re)opened as a binary stream"""
+
+    def __init__(self, name: str, opener: Callable[[], BinaryIO],
+                 resolve: Optional[Callable[[str], Optional["Source"]]] = None,
+                 size: Optional[int] = None, header: Optional[bytes] = None):
+        self.name = name
+        self.open = opener
+        # Finds files referenced by this one, e.g. LaTeX \input targets
+        self.resolve = resolve or (lambda name: None)
+        # Known up front for archive members, which are sniffed while the archive is listed
+        self.size = size
+        self._header = header
+
+    @classmethod
+    def from_file(cls, file_path: str) -> "Source":
+        file_path = os.path.abspath(file_path)
+        directory = os.path.dirname(file_path)
+
+        def resolve(name):
+            path = os.path.join(directory, name)
+            return cls.from_file(path) if os.path.isfile(path) else None
+
+        return cls(file_path, lambda: open(file_path, 'rb'), resolve)
+
+    @property
+    def header(self) -> bytes:
+        if self._header is None:
+            with self.open() as stream:
+                self._header = stream.read(HEADER_SIZE)
+        return self._header
+
+    def header_text(self) -> Optional[str]:
+        """The header decoded as UTF-8, or None if it is binary"""
+        header = self.header
+        if b"\x00" in header:
+            return None
+        try:
+            return header.decode('utf-8')
+        except UnicodeDecodeError as e:
+            # A multi-byte character cut off by the header size is fine
+            return header[:e.start].decode('utf-8') if e.start >= len(header) - 3 else None
+
+
+class _MemberStream(io.BufferedIOBase):
+    """The stream of an archive member that also closes the archive and file it was read from"""
+
+    def __init__(self, stream: BinaryIO, *owners):
+        self._stream = stream
+        self._owners = owners
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self._stream.seekable()
+
+    def read(self, size=-1):
+        return self._stream.read(size)
+
+    def read1(self, size=-1):
+        return self._stream.read1(size)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._stream.seek(offset, whence)
+
+    def tell(self):
+        return self._stream.tell()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._stream.close()
+            for owner in reversed(self._owners):
+                owner.close()
+        finally:
+            super().close()
+
+
+class Extractor:
+    """Base class of format extractors.
+
+    `cost` is the relative effort of extracting a page with this extractor.
+    `rank` orders the representations of one paper found in an archive (e.g.
+    an arXiv tarball with both LaTeX source and a PDF): the lowest rank is
+    used, and cost breaks ties.
+    """
+    name = ""
+    cost = 0
+    rank = 1
+
+    def sniff(self, source: Source) -> bool:
+        """Whether this extractor handles the source, judged from its content"""
+        raise NotImplementedError
+
+    def iter_pages(self, source: Source) -> Iterator[str]:
+        """Yield the text of each page"""
+        raise NotImplementedError
+
+
+class ContainerExtractor(Extractor):
+    """Base class of archives, which are searched for the preferred paper representation"""
+
+    def members(self, source: Source) -> List[Source]:
+        raise NotImplementedError
+
+    def iter_pages(self, source: Source) -> Iterator[str]:
+        # Containers are unpacked by select_extractor
+        raise NotImplementedError
+
+
+class PdfExtractor(Extractor):
+    name = "pdf"
+    cost = 10
+    rank = 1
+
+    def sniff(self, source):
+        return b"%PDF-" in source.header[:1024]
+
+    def iter_pages(self, source):
+        with source.open() as stream:
+            reader = PdfReader(stream)
+            for page in reader.pages:
+                yield page.extract_text() or ""
+
+
+class TextExtractor(Extractor):
+    name = "text"
+    cost = 2
+    rank = 3
+
+    def sniff(self, source):
+        return source.header_text() is not None
+
+    def iter_pages(self, source):
+        # Text files have no pages; honour form feeds if present
+        with io.TextIOWrapper(source.open(), encoding='utf-8') as f:
+            page = []
+            for line in f:
+                while "\f" in line:
+                    head, line = line.split("\f", 1)
+                    page.append(head)
+                    yield "".join(page)
+                    page = []
+                page.append(line)
+            yield "".join(page)
+
+
+class _HTMLTextParser(HTMLParser):
+    """Collects readable text, putting headings and blocks on their own lines"""
+    BLOCKS = {"p", "div", "br", "li", "tr", "section", "article", "h1", "h2", "h3", "h4", "h5", "h6",
+              "title", "blockquote", "pre", "figcaption", "dt", "dd"}
+    SKIPPED = {"script", "style", "noscript", "svg", "nav", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED:
+            self.skipping += 1
+        elif tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.parts.append(data)
+
+
+class HtmlExtractor(Extractor):
+    name = "html"
+    cost = 3
+    rank = 2
+
+    def sniff(self, source):
+        text = source.header_text()
+        return text is not None and re.search(r"<!doctype html|<html[\s>]", text[:1024], re.IGNORECASE) is not None
+
+    def iter_pages(self, source):
+        parser = _HTMLTextParser()
+        with io.TextIOWrapper(source.open(), encoding='utf-8', errors='replace') as f:
+            for chunk in iter(lambda: f.read(1 << 16), ""):
+                parser.feed(chunk)
+        parser.close()
+        text = "".join(parser.parts)
+        # Collapse runs of whitespace left by markup
+        text = re.sub(r"[ \t\r]+", " ", text)
+        yield re.sub(r"\n\s*\n+", "\n", text).strip() + "\n"
+
+
+class LatexExtractor(Extractor):
+    """Turns LaTeX source into plain text, following \\input and \\include"""
+    name = "latex"
+    cost = 1
+    # Only a main file (with \\documentclass) is sniffed as LaTeX
+    rank = 0
+
+    # Braced argument allowing one level of nesting, e.g. {Deep \emph{Nets}}
+    ARGUMENT = r"\{((?:[^{}]|\{[^{}]*\})*)\}"
+    SECTION = re.compile(r"\\(?:sub)*section\*?(?:\[[^\]]*\])?" + ARGUMENT)
+    INCLUDE = re.compile(r"\\(?:input|include)\{([^{}]+)\}")
+    DROPPED_ENVIRONMENTS = re.compile(
+        r"\\begin\{(figure|table|tikzpicture|algorithm)\*?\}.*?\\end\{\1\*?\}", re.DOTALL
+    )
+
+    def sniff(self, source):
+        text = source.header_text()
+        return text is not None and "\\documentclass" in text
+
+    def _expand(self, source: Source, depth: int = 0) -> str:
+        with io.TextIOWrapper(source.open(), encoding='utf-8', errors='replace') as f:
+            text = f.read()
+        # Drop comments but keep escaped percent signs
+        text = re.sub(r"(?<!\\)%.*", "", text)
+        if depth >= 5:
+            return text
+
+        def include(match):
+            name = match.group(1).strip()
+            base = posixpath.dirname(source.name) if "/" in source.name else ""
+            for candidate in (name, name + ".tex"):
+                included = source.resolve(posixpath.join(base, candidate) if base else candidate) \
+                    or source.resolve(candidate)
+                if included:
+                    return self._expand(included, depth + 1)
+            return ""
+
+        text = self.INCLUDE.sub(include, text)
+        if depth == 0 and "\\bibliography{" in text:
+            # arXiv sources ship the generated bibliography next to the main file
+            bbl = source.resolve(posixpath.splitext(source.name)[0] + ".bbl")
+            if bbl:
+                with io.TextIOWrapper(bbl.open(), encoding='utf-8', errors='replace') as f:
+                    text = re.sub(r"\\bibliography\{[^{}]*\}", lambda m: f.read(), text, count=1)
+        return text
+
+    def to_text(self, latex: str) -> str:
+        title = re.search(r"\\title(?:\[[^\]]*\])?" + self.ARGUMENT, latex)
+        body = re.search(r"\\begin\{document\}(.*?)(?:\\end\{document\}|$)", latex, re.DOTALL)
+        text = body.group(1) if body else latex
+
+        text = self.DROPPED_ENVIRONMENTS.sub("", text)
+        text = re.sub(r"\\maketitle", lambda m: (title.group(1) + "\n") if title else "", text)
+        text = re.sub(r"\\begin\{abstract\}", "\nAbstract\n", text)
+        text = re.sub(r"\\(?:bibliography|printbibliography)\b(?:\{[^{}]*\})?", "\nReferences\n", text)
+        text = re.sub(r"\\begin\{thebibliography\}(?:\{[^{}]*\})?", "\nReferences\n", text)
+        text = re.sub(r"\\bibitem(?:\[[^\]]*\])?\{([^{}]*)\}", r"\n[\1] ", text)
+        text = self.SECTION.sub(lambda m: f"\n{m.group(1)}\n", text)
+        text = re.sub(r"\\cite[a-zA-Z]*\*?(?:\[[^\]]*\])*\{([^{}]*)\}", r"[\1]", text)
+        text = re.sub(r"\\(?:label|ref|eqref|cref|Cref)\{[^{}]*\}", "", text)
+        text = re.sub(r"\\(?:newpage|clearpage)\b", "\f", text)
+        text = re.sub(r"\\(?:begin|end)\{[^{}]*\}(?:\[[^\]]*\])?", "\n", text)
+        text = text.replace("\\\\", "\n").replace("~", " ")
+        # Unwrap text-formatting commands, innermost first, then drop the rest
+        previous = None
+        while previous != text:
+            previous = text
+            text = re.sub(r"\\[a-zA-Z@]+\*?(?:\[[^\]]*\])?\{([^{}]*)\}", r"\1", text)
+        text = re.sub(r"\\([%&$#_{}])", r"\1", text)
+        text = re.sub(r"\\[a-zA-Z@]+\*?", "", text)
+        text = text.replace("{", "").replace("}", "")
+        text = re.sub(r"[ \t]+", " ", text)
+        # Page breaks (form feeds) must survive the blank-line cleanup
+        return re.sub(r"\n[ \t\r]*(?:\n[ \t\r]*)+", "\n", text).strip()
+
+    def iter_pages(self, source):
+        for page in self.to_text(self._expand(source)).split("\f"):
+            yield page.strip() + "\n"
+
+
+class GzipExtractor(ContainerExtractor):
+    """Gzip-compressed files; a compressed tar archive is handled as a tarball"""
+    name = "gzip"
+
+    def sniff(self, source):
+        return source.header[:2] == b"\x1f\x8b"
+
+    def members(self, source):
+        try:
+            with source.open() as stream, tarfile.open(fileobj=stream, mode="r:gz") as tar:
+                return _tar_members(source, tar, "r:gz")
+        except tarfile.ReadError:
+            name = source.name[:-3] if source.name.endswith(".gz") else source.name
+            return [Source(name, lambda: _open_gzip(source), source.resolve)]
+
+
+class TarExtractor(ContainerExtractor):
+    name = "tar"
+
+    def sniff(self, source):
+        return source.header[257:262] == b"ustar"
+
+    def members(self, source):
+        with source.open() as stream, tarfile.open(fileobj=stream, mode="r:") as tar:
+            return _tar_members(source, tar, "r:")
+
+
+class ZipExtractor(ContainerExtractor):
+    name = "zip"
+
+    def sniff(self, source):
+        return source.header[:4] == b"PK\x03\x04"
+
+    def members(self, source):
+        with source.open() as stream, zipfile.ZipFile(stream) as archive:
+            infos = []
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                header = None
+                if _is_candidate(info.filename, info.file_size):
+                    with archive.open(info) as member:
+                        header = member.read(HEADER_SIZE)
+                infos.append((info.filename, info.file_size, header))
+
+        def opener(name):
+            def open_member():
+                stream = source.open()
+                archive = zipfile.ZipFile(stream)
+                return _MemberStream(archive.open(name), archive, stream)
+            return open_member
+
+        members = {}
+        resolve = lambda name: members.get(posixpath.normpath(name))
+        for name, size, header in infos:
+            members[posixpath.normpath(name)] = Source(name, opener(name), resolve, size, header)
+        return list(members.values())
+
+
+def _open_gzip(source: Source) -> BinaryIO:
+    stream = source.open()
+    return _MemberStream(gzip.open(stream), stream)
+
+
+def _is_candidate(name: str, size: Optional[int]) -> bool:
+    """Whether an archive member may be the paper, judged by its name and size without reading it"""
+    name = posixpath.basename(name)
+    return size != 0 and not AUXILIARY_MEMBER.search(name) and not ASSET_MEMBER.search(name)
+
+
+def _tar_members(source: Source, tar: tarfile.TarFile, mode: str) -> List[Source]:
+    """Sources for the regular files of a tar archive, each able to resolve its siblings.
+
+    Candidate members are sniffed in one pass over the archive, which a
+    compressed tarball can only be read in order; only the member that is
+    extracted (and the files it includes) is opened again.
+    """
+
+    def opener(name):
+        # The archive is reopened per member so each stream stays independent
+        def open_member():
+            stream = source.open()
+            archive = tarfile.open(fileobj=stream, mode=mode)
+            return _MemberStream(archive.extractfile(name), archive, stream)
+        return open_member
+
+    members: Dict[str, Source] = {}
+    resolve = lambda name: members.get(posixpath.normpath(name))
+    for info in tar:
+        if not info.isfile():
+            continue
+        header = None
+        if _is_candidate(info.name, info.size):
+            with tar.extractfile(info) as member:
+                header = member.read(HEADER_SIZE)
+        members[posixpath.normpath(info.name)] = Source(info.name, opener(info.name), resolve, info.size, header)
+    return list(members.values())
+
+
+# Registered extractors; formats are tried by content, never by extension
+EXTRACTORS: List[Extractor] = [
+    GzipExtractor(), ZipExtractor(), TarExtractor(),
+    PdfExtractor(), LatexExtractor(), HtmlExtractor(), TextExtractor(),
+]
+
+
+def register_extractor(extractor: Extractor, first: bool = True) -> None:
+    """Add an extractor; by default it is sniffed before the built-in ones"""
+    if first:
+        EXTRACTORS.insert(0, extractor)
+    else:
+        EXTRACTORS.append(extractor)
+
+
+def _sniff(source: Source) -> Optional[Extractor]:
+    for extractor in EXTRACTORS:
+        if extractor.sniff(source):
+            return extractor
+    return None
+
+
+def select_extractor(source: Source, depth: int = 0) -> Optional[Tuple[Extractor, Source]]:
+    """Find the extractor for a source, choosing the preferred representation of the paper inside archives"""
+    extractor = _sniff(source)
+    if not isinstance(extractor, ContainerExtractor):
+        return (extractor, source) if extractor else None
+    if depth >= MAX_ARCHIVE_DEPTH:
+        return None
+
+    # READMEs, licences, LaTeX support files and figures are never the paper, but LaTeX can still include them
+    members = [m for m in extractor.members(source) if _is_candidate(m.name, m.size)]
+    candidates = [select_extractor(member, depth + 1) for member in members]
+    candidates = [c for c in candidates if c]
+    if not candidates:
+        return None
+    # Ties go to the shorter (usually top-level) member name
+    return min(candidates, key=lambda c: (c[0].rank, c[0].cost, c[1].name.count("/"), len(c[1].name)))
+
+
+def select(file_path: str) -> Tuple[Extractor, Source]:
+    """The extractor for a file and the source (file or archive member) it reads"""
+    selected = select_extractor(Source.from_file(file_path))
+    if not selected:
+        raise UnsupportedFormat(f"No extractor recognizes {os.path.basename(file_path)}")
+    return selected
+
+
+def iter_pages(file_path: str) -> Iterator[str]:
+    """Yield the pages of a file with the extractor for its format"""
+    extractor, source = select(file_path)
+    yield from extractor.iter_pages(source)
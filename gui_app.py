@@ -2,47 +2,256 @@ import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
 import ttkbootstrap as ttk
 from dotenv import load_dotenv
-from os.path import isfile, join
+from os.path import isfile, join, basename, dirname, abspath
 from os import listdir, makedirs
-from ai_service import chat_with_ai, explain_paper, profile_manager
-import threading
-from typing import List, Dict, Optional
+from ai_service import (
+    chat_with_ai, explain_paper, estimate_paper_cost, profile_manager, model_router, usage_ledger, rate_limiter
+)
+from rate_limiter import BATCH
+from document_manager import SECTION_NAMES
+from task_manager import TaskManager
+from prefetch import create_prefetcher
+from chat_session import ChatSessionStore
+import queue
 
 # Ensure papers directory exists
 papers_dir = "papers"
 makedirs(papers_dir, exist_ok=True)
 
-class LoaderDialog:
-    def __init__(self, parent, message="Processing..."):
-        self.top = tk.Toplevel(parent)
-        self.top.transient(parent)
-        self.top.grab_set()
-        
-        # Remove window decorations
-        self.top.overrideredirect(True)
-        
-        # Center the dialog
-        window_width = 200
-        window_height = 50
-        screen_width = parent.winfo_screenwidth()
-        screen_height = parent.winfo_screenheight()
-        x = (screen_width - window_width) // 2
-        y = (screen_height - window_height) // 2
-        self.top.geometry(f"{window_width}x{window_height}+{x}+{y}")
-        
-        # Add message and progress bar
-        ttk.Label(self.top, text=message).pack(pady=5)
-        self.progress = ttk.Progressbar(
-            self.top, mode='indeterminate', length=180
+class JobPanel:
+    """Non-modal list of background jobs with per-job progress and Cancel buttons"""
+
+    def __init__(self, parent, on_cancel, on_view, on_clear):
+        self.on_cancel = on_cancel
+        self.on_view = on_view
+        self.rows = {}
+        
+        self.frame = ttk.LabelFrame(parent, text="Jobs")
+        
+        header = ttk.Frame(self.frame)
+        header.pack(fill='x', padx=5, pady=(5, 0))
+        self.summary_label = ttk.Label(header, text="No jobs")
+        self.summary_label.pack(side='left')
+        ttk.Button(
+            header,
+            text="Clear Finished",
+            command=on_clear,
+            style='secondary.TButton'
+        ).pack(side='right')
+        
+        # Scrollable list of job rows
+        container = ttk.Frame(self.frame)
+        container.pack(fill='both', expand=True, padx=5, pady=5)
+        self.canvas = tk.Canvas(container, height=120, highlightthickness=0)
+        scrollbar = ttk.Scrollbar(container, orient="vertical", command=self.canvas.yview)
+        self.rows_frame = ttk.Frame(self.canvas)
+        self.rows_frame.bind(
+            "<Configure>",
+            lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
         )
-        self.progress.pack(pady=5)
-        self.progress.start()
+        self.canvas.create_window((0, 0), window=self.rows_frame, anchor="nw")
+        self.canvas.configure(yscrollcommand=scrollbar.set)
+        self.canvas.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+
+    def add(self, task):
+        row = ttk.Frame(self.rows_frame)
+        row.pack(fill='x', pady=2)
+        
+        ttk.Label(row, text=task.name, width=30).pack(side='left', padx=(0, 5))
+        progress = ttk.Progressbar(row, mode='determinate', length=150, maximum=1.0)
+        progress.pack(side='left', padx=5)
+        status = ttk.Label(row, text=task.message, width=35)
+        status.pack(side='left', padx=5)
+        cancel = ttk.Button(
+            row, text="Cancel",
+            command=lambda: self.on_cancel(task.id),
+            style='danger.TButton'
+        )
+        cancel.pack(side='right', padx=2)
+        view = ttk.Button(
+            row, text="View",
+            command=lambda: self.on_view(task.id),
+            style='secondary.TButton',
+            state='disabled'
+        )
+        view.pack(side='right', padx=2)
+        
+        self.rows[task.id] = {"frame": row, "progress": progress, "status": status, "cancel": cancel, "view": view}
+
+    def update(self, task):
+        row = self.rows.get(task.id)
+        if not row:
+            return
+        row["progress"].configure(value=task.progress)
+        row["status"].configure(text=task.message[:60])
+        if task.status not in ("queued", "running"):
+            row["cancel"].configure(state='disabled')
+        if task.status == "done":
+            row["view"].configure(state='normal')
+
+    def remove(self, task_id):
+        row = self.rows.pop(task_id, None)
+        if row:
+            row["frame"].destroy()
+
+    def set_summary(self, text):
+        self.summary_label.configure(text=text)
+
+# Characters inserted into a text widget per event-loop turn
+INSERT_CHUNK_SIZE = 4096
+
+def cancel_chunked_insert(widget):
+    """Stop inserting the remainder of an earlier insert_chunked call"""
+    pending = getattr(widget, "_chunked_insert", None)
+    if pending:
+        widget.after_cancel(pending)
+        widget._chunked_insert = None
+
+def insert_chunked(widget, text, tags=(), on_done=None, index=tk.END):
+    """Insert text a chunk per event-loop turn so large outputs never freeze the UI.
+
+    A new call on the same widget cancels the remainder of an earlier one.
+    """
+    cancel_chunked_insert(widget)
+    
+    def step(offset):
+        widget.insert(index, text[offset:offset + INSERT_CHUNK_SIZE], tags)
+        if offset + INSERT_CHUNK_SIZE < len(text):
+            widget._chunked_insert = widget.after(1, step, offset + INSERT_CHUNK_SIZE)
+        else:
+            widget._chunked_insert = None
+            if on_done:
+                on_done()
     
-    def destroy(self):
-        self.top.destroy()
+    step(0)
+
+class ChatView:
+    """Chat transcript that keeps only a window of a session's messages in the text widget.
+
+    Messages carry a tag per session index, so the oldest can be dropped as new
+    ones arrive and earlier pages can be loaded back from the session log.
+    """
+
+    def __init__(self, parent, session, window=200, page=50):
+        self.session = session
+        self.window = window
+        self.page = page
+        # Session indices of the rendered messages: first..last-1
+        self.first = self.last = 0
+        # Callback of a chunked insert still in progress
+        self._on_insert_done = None
+        
+        self.frame = ttk.Frame(parent)
+        header = ttk.Frame(self.frame)
+        header.pack(fill='x')
+        self.earlier_button = ttk.Button(
+            header,
+            text="Load Earlier",
+            command=self.load_earlier,
+            style='secondary.TButton'
+        )
+        self.earlier_button.pack(side='left')
+        self.latest_button = ttk.Button(
+            header,
+            text="Jump to Latest",
+            command=self.show_latest,
+            style='secondary.TButton'
+        )
+        self.latest_button.pack(side='right')
+        
+        self.text = scrolledtext.ScrolledText(
+            self.frame, wrap=tk.WORD, height=25,
+            font=('Segoe UI', 10)
+        )
+        self.text.pack(expand=True, fill='both', pady=(5, 0))
+        self.show_latest()
+
+    def _format(self, message):
+        if message["role"] == "user":
+            return f"You: {message['content']}\n"
+        return f"AI: {message['content']}\n\n"
+
+    def _update_buttons(self):
+        self.earlier_button.configure(state='normal' if self.first > 0 else 'disabled')
+        self.latest_button.configure(state='normal' if self.last < len(self.session) else 'disabled')
+
+    def _drop(self, index):
+        ranges = self.text.tag_ranges(f"msg{index}")
+        if ranges:
+            self.text.delete(ranges[0], ranges[-1])
+        self.text.tag_delete(f"msg{index}")
+
+    def show_session(self, session):
+        self.session = session
+        self.show_latest()
+
+    def show_latest(self):
+        """Render the last page of the session"""
+        cancel_chunked_insert(self.text)
+        on_done, self._on_insert_done = self._on_insert_done, None
+        for index in range(self.first, self.last):
+            self.text.tag_delete(f"msg{index}")
+        self.text.delete(1.0, tk.END)
+        self.last = len(self.session)
+        self.first = max(0, self.last - self.page)
+        for index, message in self.session.items(self.first, self.last):
+            self.text.insert(tk.END, self._format(message), (f"msg{index}",))
+        self.text.see(tk.END)
+        self._update_buttons()
+        if on_done:
+            on_done()
+
+    def load_earlier(self):
+        """Prepend the previous page, dropping the newest messages beyond the window"""
+        if getattr(self.text, "_chunked_insert", None):
+            # Wait for the message being inserted to finish
+            return
+        start = max(0, self.first - self.page)
+        for index, message in reversed(self.session.items(start, self.first)):
+            self.text.insert(1.0, self._format(message), (f"msg{index}",))
+        self.first = start
+        while self.last - self.first > self.window:
+            self.last -= 1
+            self._drop(self.last)
+        self.text.see(1.0)
+        self._update_buttons()
+
+    def append(self, index, message, on_done=None):
+        """Show a message just added to the session, inserting long ones in chunks"""
+        if self.last != index:
+            # The view was scrolled back through history; return to the end first
+            self.show_latest()
+            if on_done:
+                on_done()
+            return
+        self.last = index + 1
+        while self.last - self.first > self.window:
+            self._drop(self.first)
+            self.first += 1
+        self._update_buttons()
+        
+        def done():
+            self._on_insert_done = None
+            self.text.see(tk.END)
+            if on_done:
+                on_done()
+        
+        self._on_insert_done = on_done
+        insert_chunked(self.text, self._format(message), (f"msg{index}",), on_done=done)
+
+    def add_notice(self, text):
+        """Show a line that is not part of the session"""
+        self.text.insert(tk.END, text)
+        self.text.see(tk.END)
+
+AUTO_MODEL = "auto"
+
+# Shown above a draft summary until the full summary replaces it
+DRAFT_LABEL = "[Draft from the abstract and conclusion - refining with the full paper]"
 
 class SciSiftGUI:
-    def __init__(self, root):
+    def __init__(self, root, model=None):
         self.root = root
         self.root.title("SciSift")
         self.root.geometry("1000x700")
@@ -51,8 +260,26 @@ class SciSiftGUI:
         self.style = ttk.Style()
         self.style.theme_use('darkly')
         
-        # Chat conversation history
-        self.conversation_history: List[Dict] = []
+        # Model shared by chat and paper analysis; "auto" lets the router pick
+        self.model_var = tk.StringVar(value=model or AUTO_MODEL)
+        
+        # Chat sessions are persisted; resume the most recent one
+        self.chat_settings = profile_manager.get_setting("chat", {})
+        self.session_store = ChatSessionStore()
+        self.chat_session = self.session_store.latest() or self.session_store.create()
+        
+        # Shared worker pool for chat requests and paper analyses
+        self.task_manager = TaskManager(max_background=3)
+        
+        # Prepares the selected paper before Analyze is pressed
+        self.prefetcher = create_prefetcher()
+        
+        # Profile changes, including edits by other processes, arrive as events
+        # from any thread and are applied to the profile list on the Tk thread
+        self.profile_events = queue.Queue()
+        # Progressive drafts arrive from analysis threads and are shown by _poll_tasks
+        self.draft_events = queue.Queue()
+        self._unsubscribe_profiles = profile_manager.subscribe(self.profile_events.put)
         
         # Create main notebook for tabs
         self.notebook = ttk.Notebook(root)
@@ -62,18 +289,25 @@ class SciSiftGUI:
         self.chat_frame = ttk.Frame(self.notebook)
         self.paper_frame = ttk.Frame(self.notebook)
         self.profile_frame = ttk.Frame(self.notebook)
+        self.topic_frame = ttk.Frame(self.notebook)
         
         self.notebook.add(self.chat_frame, text='Chat')
         self.notebook.add(self.paper_frame, text='Papers')
         self.notebook.add(self.profile_frame, text='Profiles')
+        self.notebook.add(self.topic_frame, text='Topics')
         
         # Initialize all tabs
         self._init_chat_tab()
         self._init_paper_tab()
         self._init_profile_tab()
+        self._init_topic_tab()
         
         # Show active profile
         self._update_active_profile_label()
+        
+        # Drain task results on the Tk thread and stop workers on exit
+        self.root.after(100, self._poll_tasks)
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
 
     def _init_chat_tab(self):
         # Top control panel
@@ -89,6 +323,8 @@ class SciSiftGUI:
         )
         self.profile_toggle.pack(side='left', padx=5)
         
+        self._create_model_selector(control_frame)
+        
         # Reset conversation button
         self.reset_button = ttk.Button(
             control_frame,
@@ -98,12 +334,27 @@ class SciSiftGUI:
         )
         self.reset_button.pack(side='right', padx=5)
         
-        # Chat history
-        self.chat_history = scrolledtext.ScrolledText(
-            self.chat_frame, wrap=tk.WORD, height=25,
-            font=('Segoe UI', 10)
+        # Earlier sessions stay on disk and can be reopened
+        self.session_var = tk.StringVar(value=self.chat_session.id)
+        self.session_combo = ttk.Combobox(
+            control_frame,
+            textvariable=self.session_var,
+            values=self.session_store.list_sessions(),
+            state="readonly",
+            width=20
         )
-        self.chat_history.pack(expand=True, fill='both', padx=10, pady=5)
+        self.session_combo.pack(side='right', padx=5)
+        self.session_combo.bind('<<ComboboxSelected>>', lambda e: self._open_session())
+        ttk.Label(control_frame, text="Session:").pack(side='right')
+        
+        # Chat history, windowed over the session log
+        self.chat_view = ChatView(
+            self.chat_frame,
+            self.chat_session,
+            window=self.chat_settings.get("windowMessages", 200),
+            page=self.chat_settings.get("pageMessages", 50)
+        )
+        self.chat_view.frame.pack(expand=True, fill='both', padx=10, pady=5)
         
         # Message input area
         input_frame = ttk.Frame(self.chat_frame)
@@ -121,6 +372,9 @@ class SciSiftGUI:
         )
         self.send_button.pack(side='right')
         
+        self.chat_status = ttk.Label(self.chat_frame, text="")
+        self.chat_status.pack(fill='x', padx=10)
+        
         # Bind Enter key to send message
         self.message_input.bind('<Return>', lambda e: self._send_message())
 
@@ -141,6 +395,15 @@ class SciSiftGUI:
             variable=self.source_var, value="url"
         ).pack(side='left', padx=10)
         
+        self._create_model_selector(self.paper_source_frame)
+        
+        self.structured_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            self.paper_source_frame,
+            text="Structured",
+            variable=self.structured_var
+        ).pack(side='left', padx=10)
+        
         # File/URL input
         self.paper_input_frame = ttk.Frame(self.paper_frame)
         self.paper_input_frame.pack(fill='x', padx=10, pady=5)
@@ -155,6 +418,8 @@ class SciSiftGUI:
             font=('Segoe UI', 10)
         )
         
+        self.file_input.bind('<<ComboboxSelected>>', lambda e: self._prefetch_selected_paper())
+        
         # Initially show file input
         self.file_input.pack(side='left', expand=True, fill='x', padx=(0, 5))
         
@@ -178,6 +443,15 @@ class SciSiftGUI:
         )
         self.analyze_button.pack(side='left')
         
+        # Queued and running analyses
+        self.job_panel = JobPanel(
+            self.paper_frame,
+            on_cancel=self.task_manager.cancel,
+            on_view=self._view_job_result,
+            on_clear=self._clear_finished_jobs
+        )
+        self.job_panel.frame.pack(fill='x', padx=10, pady=5)
+        
         # Results frame with copy button
         results_frame = ttk.Frame(self.paper_frame)
         results_frame.pack(fill='both', expand=True, padx=10, pady=5)
@@ -277,71 +551,210 @@ class SciSiftGUI:
         # Bind selection event
         self.profile_listbox.bind('<<ListboxSelect>>', self._show_profile_details)
 
+    def _init_topic_tab(self):
+        control_frame = ttk.Frame(self.topic_frame)
+        control_frame.pack(fill='x', padx=10, pady=5)
+        
+        ttk.Button(
+            control_frame, text="Update Topics",
+            command=self._update_topics,
+            style='primary.TButton'
+        ).pack(side='left', padx=5)
+        
+        ttk.Button(
+            control_frame, text="Recluster",
+            command=lambda: self._update_topics(recluster=True),
+            style='secondary.TButton'
+        ).pack(side='left', padx=5)
+        
+        ttk.Label(
+            control_frame, text="Double-click a paper to open it in the Papers tab"
+        ).pack(side='left', padx=15)
+        
+        self.topic_tree = ttk.Treeview(self.topic_frame, columns=('papers', 'note'), show='tree headings')
+        self.topic_tree.heading('#0', text='Topic / paper')
+        self.topic_tree.heading('papers', text='Papers')
+        self.topic_tree.heading('note', text='Note')
+        self.topic_tree.column('papers', width=80, anchor='e', stretch=False)
+        self.topic_tree.pack(fill='both', expand=True, padx=10, pady=5)
+        self.topic_tree.bind('<<TreeviewOpen>>', self._expand_topic)
+        self.topic_tree.bind('<Double-1>', self._open_topic_paper)
+        
+        # Members are only inserted when a topic is opened; large corpora have many
+        self.topic_clusters = {}
+        try:
+            from clustering import load_clusters
+            self._show_topics(load_clusters(profile_manager.get_setting("clustering", {}).get("indexDir", "corpus_index")))
+        except ImportError:
+            pass
+
+    def _show_topics(self, clusters):
+        self.topic_tree.delete(*self.topic_tree.get_children())
+        self.topic_clusters = {}
+        for cluster in clusters:
+            item = self.topic_tree.insert(
+                '', tk.END, text=', '.join(cluster['terms']) or f"Topic {cluster['id']}",
+                values=(len(cluster['members']), f"{len(cluster['duplicates'])} duplicates")
+            )
+            self.topic_clusters[item] = cluster
+            # Placeholder so the topic can be expanded
+            self.topic_tree.insert(item, tk.END, text='...')
+
+    def _expand_topic(self, event=None):
+        item = self.topic_tree.focus()
+        cluster = self.topic_clusters.get(item)
+        if not cluster:
+            return
+        self.topic_tree.delete(*self.topic_tree.get_children(item))
+        duplicates = cluster['duplicates']
+        members = [cluster['representative']] + [p for p in cluster['members'] if p != cluster['representative']]
+        for path in members:
+            if path == cluster['representative']:
+                note = "representative - summarize first"
+            elif path in duplicates:
+                note = f"duplicate of {basename(duplicates[path])}"
+            else:
+                note = ""
+            self.topic_tree.insert(item, tk.END, text=basename(path), values=('', note), tags=(path,))
+
+    def _open_topic_paper(self, event=None):
+        tags = self.topic_tree.item(self.topic_tree.focus(), 'tags')
+        if not tags:
+            return
+        path = tags[0]
+        if abspath(dirname(path)) != abspath(papers_dir):
+            messagebox.showwarning("Warning", f"{path} is not in the papers directory")
+            return
+        self.source_var.set("file")
+        self._update_paper_source()
+        self.file_input.set(basename(path))
+        self._prefetch_selected_paper()
+        self.notebook.select(self.paper_frame)
+
+    def _update_topics(self, recluster=False):
+        try:
+            from clustering import create_corpus_index
+        except ImportError as e:
+            messagebox.showerror("Error", f"Topics need numpy and scipy: {str(e)}")
+            return
+        settings = profile_manager.get_setting("clustering", {})
+        
+        def build(task):
+            index = create_corpus_index(settings)
+            papers = [join(papers_dir, f) for f in listdir(papers_dir) if isfile(join(papers_dir, f))]
+            index.update(papers, on_progress=lambda done, total: task.report(
+                f"Indexed {done}/{total} papers", 0.9 * done / total
+            ))
+            if recluster:
+                task.report("Clustering", 0.9)
+                index.cluster()
+            return index.clusters
+        
+        task = self.task_manager.submit(
+            "Topics",
+            build,
+            on_done=lambda task, clusters: self._show_topics(clusters),
+            on_error=lambda task, e: messagebox.showerror("Error", f"Failed to update topics: {str(e)}")
+        )
+        self.job_panel.add(task)
+        self._update_job_summary()
+
+    def _create_model_selector(self, parent):
+        ttk.Label(parent, text="Model:").pack(side='left', padx=(15, 5))
+        ttk.Combobox(
+            parent,
+            textvariable=self.model_var,
+            values=[AUTO_MODEL] + model_router.get_models(),
+            width=35
+        ).pack(side='left', padx=5)
+
+    def _get_selected_model(self):
+        model = self.model_var.get().strip()
+        return None if not model or model == AUTO_MODEL else model
+
     def _reset_conversation(self):
         if messagebox.askyesno("Reset Conversation", "Are you sure you want to reset the conversation history?"):
-            self.conversation_history.clear()
-            self.chat_history.delete(1.0, tk.END)
-            self.chat_history.insert(tk.END, "Conversation reset.\n\n")
+            # The old session stays on disk; the conversation continues in a new one
+            self.chat_session = self.session_store.create()
+            self.session_combo['values'] = self.session_store.list_sessions()
+            self.session_var.set(self.chat_session.id)
+            self.chat_view.show_session(self.chat_session)
+            self.chat_view.add_notice("Conversation reset.\n\n")
+
+    def _open_session(self):
+        self.chat_session = self.session_store.open(self.session_var.get())
+        self.chat_view.show_session(self.chat_session)
 
     def _send_message(self):
         message = self.message_input.get().strip()
         if not message:
             return
         
-        self.chat_history.insert(tk.END, f"You: {message}\n")
         self.message_input.delete(0, tk.END)
-        self.chat_history.see(tk.END)
         
-        # Add user message to history
-        self.conversation_history.append({
-            "role": "user",
-            "content": message
-        })
+        # Add user message to the session log
+        session = self.chat_session
+        self.chat_view.append(len(session), session.append("user", message))
         
-        # Disable input while processing
+        # Disable sending while waiting; the rest of the UI stays usable
         self.message_input.configure(state='disabled')
         self.send_button.configure(state='disabled')
-        
-        # Show loader
-        loader = LoaderDialog(self.root, "Getting AI response...")
-        
-        def get_ai_response():
-            try:
-                response = chat_with_ai(
-                    message,
-                    use_profile=self.use_profile_var.get(),
-                    conversation_history=self.conversation_history
-                )
-                
-                # Add AI response to history
-                self.conversation_history.append({
-                    "role": "assistant",
-                    "content": response
-                })
-                
-                # Update UI in main thread
-                self.root.after(0, lambda: self._update_chat_with_response(response))
-            except Exception as e:
-                self.root.after(0, lambda: messagebox.showerror("Error", f"Failed to get AI response: {str(e)}"))
-            finally:
-                # Clean up in main thread
-                self.root.after(0, lambda: self._cleanup_after_response(loader))
-        
-        # Start AI request in background
-        threading.Thread(target=get_ai_response, daemon=True).start()
-
-    def _update_chat_with_response(self, response):
-        self.chat_history.insert(tk.END, f"AI: {response}\n\n")
-        self.chat_history.see(tk.END)
-
-    def _cleanup_after_response(self, loader):
+        self.chat_status.configure(text="Getting AI response...")
+        
+        model = self._get_selected_model()
+        use_profile = self.use_profile_var.get()
+        # Only the most recent turns are sent; the full log stays on disk
+        history = session.tail(self.chat_settings.get("historyMessages", 40))
+        
+        def get_ai_response(task):
+            return chat_with_ai(
+                message,
+                model=model,
+                use_profile=use_profile,
+                conversation_history=history,
+                cancel_event=task.cancel_event
+            )
+        
+        # Chat runs as an interactive job so queued analyses never delay it
+        self.task_manager.submit(
+            "Chat",
+            get_ai_response,
+            on_done=lambda task, response: self._update_chat_with_response(session, response),
+            on_error=lambda task, e: self._on_chat_error(e),
+            background=False
+        )
+
+    def _update_chat_with_response(self, session, response):
+        if not response:
+            response = "Error: The model returned an empty response"
+        if response.startswith("Error:"):
+            # Refusals such as a spent budget, and empty answers, are not part of the conversation
+            if session is self.chat_session:
+                self.chat_view.add_notice(f"{response}\n\n")
+            self._cleanup_after_response()
+            return
+        # Add AI response to the session it was asked in, even if another is shown now
+        index = len(session)
+        message = session.append("assistant", response)
+        if session is not self.chat_session:
+            self._cleanup_after_response()
+            return
+        # Long responses are inserted in chunks; sending resumes once they are shown
+        self.chat_view.append(index, message, on_done=self._cleanup_after_response)
+
+    def _on_chat_error(self, error):
+        messagebox.showerror("Error", f"Failed to get AI response: {str(error)}")
+        self._cleanup_after_response()
+
+    def _cleanup_after_response(self):
+        self.chat_status.configure(text="")
         self.message_input.configure(state='normal')
         self.send_button.configure(state='normal')
         self.message_input.focus()
-        loader.destroy()
 
     def _clear_paper_results(self):
         """Clear the paper analysis results"""
+        cancel_chunked_insert(self.paper_results)
         self.paper_results.delete(1.0, tk.END)
         if self.source_var.get() == "file":
             self.file_input.set("Select a paper file...")
@@ -367,54 +780,141 @@ class SciSiftGUI:
             messagebox.showwarning("Warning", "Please select a paper or enter a URL")
             return
         
-        # Disable inputs while processing
-        self.file_input.configure(state='disabled')
-        self.url_input.configure(state='disabled')
-        self.analyze_button.configure(state='disabled')
-        self.clear_button.configure(state='disabled')
-        self.copy_button.configure(state='disabled')
-        
-        # Show loader
-        loader = LoaderDialog(self.root, "Analyzing paper...")
-        
-        def analyze():
-            try:
-                if source == "file":
-                    paper_path = join(papers_dir, paper_input)
-                    result = explain_paper("file", paper_path=paper_path)
-                else:
-                    result = explain_paper("url", url=paper_input)
-                
-                if result is None:
-                    self.root.after(0, lambda: messagebox.showerror("Error", "Failed to get analysis result"))
-                    return
-                    
-                # Update UI in main thread
-                self.root.after(0, lambda: self._update_paper_results(result))
-            except Exception as e:
-                self.root.after(0, lambda: messagebox.showerror("Error", f"Failed to analyze paper: {str(e)}"))
-            finally:
-                # Clean up in main thread
-                self.root.after(0, lambda: self._cleanup_after_analysis(loader))
-        
-        # Start analysis in background
-        threading.Thread(target=analyze, daemon=True).start()
-
-    def _update_paper_results(self, result):
+        model = self._get_selected_model()
+        structured = self.structured_var.get()
+        
+        if source == "file":
+            # A cached summary found while prefetching needs no pre-flight estimate
+            prefetched = self.prefetcher.peek(join(papers_dir, paper_input), model, None, structured)
+            if not (prefetched and prefetched.get("cached")):
+                self._confirm_large_job(join(papers_dir, paper_input), model,
+                                        lambda: self._start_analysis(source, paper_input, model, structured))
+                return
+        self._start_analysis(source, paper_input, model, structured)
+
+    def _start_analysis(self, source, paper_input, model, structured):
+        def analyze(task):
+            # Queued analyses yield the shared rate limits to chat messages
+            with rate_limiter.thread_priority(BATCH):
+                return run_analysis(task)
+
+        def run_analysis(task):
+            if source == "file":
+                paper_path = join(papers_dir, paper_input)
+                # Reuse the prefetch in flight rather than extracting the paper twice
+                prefetched = self.prefetcher.claim(paper_path)
+                return explain_paper(
+                    "file", paper_path=paper_path, structured=structured,
+                    model=model or (prefetched or {}).get("model"),
+                    cancel_event=task.cancel_event, on_progress=task.report,
+                    on_draft=lambda draft: self.draft_events.put((task, draft))
+                )
+            return explain_paper(
+                "url", url=paper_input, model=model, structured=structured,
+                cancel_event=task.cancel_event, on_progress=task.report
+            )
+        
+        # Queue the analysis; several can run while the UI stays usable
+        task = self.task_manager.submit(
+            paper_input,
+            analyze,
+            on_done=self._on_analysis_done,
+            on_error=lambda task, e: messagebox.showerror("Error", f"Failed to analyze {task.name}: {str(e)}")
+        )
+        self.job_panel.add(task)
+        self._update_job_summary()
+
+    def _prefetch_selected_paper(self):
+        """Start extracting the selected paper and probing the summary cache in the background"""
+        paper_name = self.file_input.get()
+        if not paper_name or paper_name == "Select a paper file...":
+            return
+        self.prefetcher.prefetch(
+            [join(papers_dir, paper_name)], model=self._get_selected_model(), structured=self.structured_var.get()
+        )
+
+    def _confirm_large_job(self, paper_path, model, on_confirm):
+        """Estimate a paper off the Tk thread, then call on_confirm, asking first if the paper is large"""
+        def estimate(task):
+            # Wait for the prefetch in flight rather than extracting the paper twice
+            self.prefetcher.claim(paper_path)
+            return estimate_paper_cost(paper_path, model=model)
+
+        def confirm(task, estimate):
+            large = ("error" not in estimate and not estimate["cached"]
+                     and estimate["prompt_tokens"] >= (usage_ledger.budgets.get("preflightTokens") or 0))
+            if large and not messagebox.askyesno(
+                "Large Paper",
+                f"This paper is large: about {estimate['prompt_tokens']} input and "
+                f"{estimate['completion_tokens']} output tokens on {estimate['model']}, "
+                f"estimated cost ${estimate['cost']:.4f}.\n\nContinue?"
+            ):
+                return
+            on_confirm()
+
+        # A failed estimate does not block the analysis, which reports the error itself
+        self.task_manager.submit(
+            f"Estimate {basename(paper_path)}",
+            estimate,
+            on_done=confirm,
+            on_error=lambda task, e: on_confirm(),
+            background=False
+        )
+
+    def _on_analysis_done(self, task, result):
+        if result is None:
+            task.message = "Failed to get analysis result"
+            return
+        self._update_paper_results(task.name, result)
+
+    def _update_paper_results(self, name, result):
         """Update the paper results text area"""
         self.paper_results.delete(1.0, tk.END)
-        self.paper_results.insert(tk.END, str(result))
+        insert_chunked(self.paper_results, f"{name}\n\n{result}")
 
-    def _cleanup_after_analysis(self, loader):
-        """Clean up after paper analysis"""
-        if self.source_var.get() == "file":
-            self.file_input.configure(state='readonly')
-        else:
-            self.url_input.configure(state='normal')
-        self.analyze_button.configure(state='normal')
-        self.clear_button.configure(state='normal')
-        self.copy_button.configure(state='normal')
-        loader.destroy()
+    def _view_job_result(self, task_id):
+        task = self.task_manager.tasks.get(task_id)
+        if task and isinstance(task.result, list):
+            # Topic clusters
+            self._show_topics(task.result)
+            self.notebook.select(self.topic_frame)
+        elif task and task.result is not None:
+            self._update_paper_results(task.name, task.result)
+
+    def _clear_finished_jobs(self):
+        for task_id in self.task_manager.remove_finished():
+            self.job_panel.remove(task_id)
+        self._update_job_summary()
+
+    def _update_job_summary(self):
+        background = [t for t in self.task_manager.tasks.values() if t.background]
+        active = sum(1 for t in background if t.status in ("queued", "running"))
+        self.job_panel.set_summary(f"{active} active, {len(background) - active} finished" if background else "No jobs")
+
+    def _poll_tasks(self):
+        """Apply finished work from the task pool on the Tk thread"""
+        changed = self.task_manager.poll()
+        for task in changed:
+            self.job_panel.update(task)
+        if changed:
+            self._update_job_summary()
+        profile_manager.check_reload()
+        while not self.profile_events.empty():
+            self._apply_profile_event(self.profile_events.get_nowait())
+        while not self.draft_events.empty():
+            task, draft = self.draft_events.get_nowait()
+            # A draft that arrives after the full summary is dropped
+            if task.status in ("queued", "running"):
+                task.message = "Draft ready, refining"
+                self.job_panel.update(task)
+                self._update_paper_results(task.name, f"{DRAFT_LABEL}\n\n{draft}")
+        self.root.after(100, self._poll_tasks)
+
+    def _on_close(self):
+        self._unsubscribe_profiles()
+        self.prefetcher.shutdown()
+        self.task_manager.shutdown()
+        self.root.destroy()
 
     def _update_paper_source(self):
         if self.source_var.get() == "file":
@@ -427,6 +927,7 @@ class SciSiftGUI:
             self.file_input.set("Select a paper file...")
         else:
             # Switch to URL input
+            self.prefetcher.cancel()
             self.file_input.pack_forget()
             self.url_input.pack(side='left', expand=True, fill='x', padx=(0, 5))
             self.url_input.delete(0, tk.END)
@@ -449,6 +950,42 @@ class SciSiftGUI:
             if profile.get('selected', False):
                 self.profile_listbox.itemconfig(tk.END, {'bg': '#2ecc71'})
 
+    def _profile_row(self, name):
+        names = self.profile_listbox.get(0, tk.END)
+        return names.index(name) if name in names else None
+
+    def _apply_profile_event(self, event):
+        """Update only the profile list rows a change touches"""
+        kind, name = event['event'], event['name']
+        if kind == 'created':
+            names = profile_manager.get_profile_names()
+            if name in names and self._profile_row(name) is None:
+                self.profile_listbox.insert(names.index(name), name)
+        elif kind == 'deleted':
+            row = self._profile_row(name)
+            if row is not None:
+                if row in self.profile_listbox.curselection():
+                    self.profile_details.delete(1.0, tk.END)
+                self.profile_listbox.delete(row)
+        elif kind == 'updated':
+            row = self._profile_row(event['previous_name'] or name)
+            profile = profile_manager.get_profile_by_name(name)
+            if row is not None and profile:
+                shown = row in self.profile_listbox.curselection()
+                self.profile_listbox.delete(row)
+                self.profile_listbox.insert(row, name)
+                if profile.get('selected', False):
+                    self.profile_listbox.itemconfig(row, {'bg': '#2ecc71'})
+                if shown:
+                    self.profile_listbox.selection_set(row)
+                    self._show_profile_details()
+        elif kind == 'activated':
+            for profile_name, color in ((event['previous_name'], ''), (name, '#2ecc71')):
+                row = self._profile_row(profile_name)
+                if row is not None:
+                    self.profile_listbox.itemconfig(row, {'bg': color})
+        self._update_active_profile_label()
+
     def _show_profile_details(self, event=None):
         selection = self.profile_listbox.curselection()
         if not selection:
@@ -468,6 +1005,7 @@ class SciSiftGUI:
         details += "\nOutput Style:\n"
         for key, value in profile.get('outputStyle', {}).items():
             details += f"  • {key}: {value}\n"
+        details += f"\nSections: {', '.join(profile.get('sections') or ['whole paper'])}\n"
         
         self.profile_details.delete(1.0, tk.END)
         self.profile_details.insert(tk.END, details)
@@ -477,8 +1015,6 @@ class SciSiftGUI:
         if dialog.result:
             try:
                 profile_manager.create_profile(dialog.result)
-                self._update_profile_list()
-                self._update_active_profile_label()
             except ValueError as e:
                 messagebox.showerror("Error", str(e))
 
@@ -495,9 +1031,6 @@ class SciSiftGUI:
         if dialog.result:
             try:
                 profile_manager.update_profile(profile_name, dialog.result)
-                self._update_profile_list()
-                self._update_active_profile_label()
-                self._show_profile_details()
             except ValueError as e:
                 messagebox.showerror("Error", str(e))
 
@@ -509,8 +1042,6 @@ class SciSiftGUI:
         
         profile_name = self.profile_listbox.get(selection[0])
         profile_manager.set_active_profile(profile_name)
-        self._update_profile_list()
-        self._update_active_profile_label()
 
     def _delete_profile(self):
         selection = self.profile_listbox.curselection()
@@ -521,9 +1052,6 @@ class SciSiftGUI:
         profile_name = self.profile_listbox.get(selection[0])
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete profile '{profile_name}'?"):
             profile_manager.delete_profile(profile_name)
-            self._update_profile_list()
-            self._update_active_profile_label()
-            self.profile_details.delete(1.0, tk.END)
 
     def _update_active_profile_label(self):
         active_profile = profile_manager.get_active_profile()
@@ -646,6 +1174,23 @@ class ProfileDialog:
             variable=self.visual_aids_var
         ).pack(side='left')
         
+        # Sections Section
+        sections_frame = ttk.LabelFrame(self.scrollable_frame, text="Sections to Send")
+        sections_frame.pack(fill='x', pady=5)
+        
+        ttk.Label(sections_frame, text="Leave all unchecked to send the whole paper:").pack(padx=10, pady=(10, 0))
+        sections_container = ttk.Frame(sections_frame)
+        sections_container.pack(fill='x', padx=10, pady=5)
+        
+        self.section_vars = {}
+        for section in SECTION_NAMES:
+            self.section_vars[section] = tk.BooleanVar()
+            ttk.Checkbutton(
+                sections_container,
+                text=section.capitalize(),
+                variable=self.section_vars[section]
+            ).pack(side='left', padx=5)
+        
         # Buttons - Fixed at bottom
         button_frame = ttk.Frame(self.dialog)
         button_frame.pack(fill='x', padx=10, pady=10, side='bottom')
@@ -678,6 +1223,9 @@ class ProfileDialog:
             # Convert visualAids to boolean - treat "recommended" as True
             visual_aids = output_style.get('visualAids', False)
             self.visual_aids_var.set(True if visual_aids in [True, "recommended"] else False)
+            for section in profile.get('sections') or []:
+                if section in self.section_vars:
+                    self.section_vars[section].set(True)
         else:
             # Set defaults for new profile
             self.language_combo.set('English')
@@ -713,16 +1261,19 @@ class ProfileDialog:
                 "responseLanguage": self.language_combo.get()
             }
         }
+        sections = [name for name, var in self.section_vars.items() if var.get()]
+        if sections:
+            self.result["sections"] = sections
         self.dialog.destroy()
 
     def _cancel(self):
         self.result = None
         self.dialog.destroy()
 
-def run_gui():
+def run_gui(model=None):
     load_dotenv()
     root = ttk.Window()
-    app = SciSiftGUI(root)
+    app = SciSiftGUI(root, model=model)
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,150 @@
+import os
+import time
+import sqlite3
+from typing import Dict, Iterator, List, Optional
+
+# Default number of attempts before a job is marked failed
+MAX_ATTEMPTS = 3
+
+
+class JobStore:
+    """Paper analysis jobs in a SQLite file shared by any number of workers.
+
+    The file can live on a shared filesystem; every state change is a short
+    transaction, and leasing uses BEGIN IMMEDIATE so two workers can never
+    take the same job. A leased job whose lease expires (its worker died or
+    stopped heartbeating) is handed out again.
+    """
+
+    def __init__(self, db_file: str = "jobs.db", max_attempts: int = MAX_ATTEMPTS):
+        self.db_file = db_file
+        self.max_attempts = max_attempts
+        # Autocommit mode; transactions are opened explicitly where needed
+        self.conn = sqlite3.connect(db_file, timeout=60, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self._create_schema()
+
+    def _create_schema(self) -> None:
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                paper TEXT NOT NULL,
+                profile TEXT,
+                model TEXT,
+                status TEXT NOT NULL DEFAULT 'queued',
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                summary TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, lease_expires);
+        """)
+
+    def enqueue(self, kind: str, papers: List[str], profile: Optional[str] = None,
+                model: Optional[str] = None) -> List[int]:
+        """Add jobs for papers (file paths or URLs); returns their ids"""
+        now = time.time()
+        ids = []
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for paper in papers:
+                if kind == "file":
+                    # Workers on other hosts need a path they can resolve too
+                    paper = os.path.abspath(paper)
+                cursor = self.conn.execute(
+                    "INSERT INTO jobs (kind, paper, profile, model, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                    (kind, paper, profile, model, now, now)
+                )
+                ids.append(cursor.lastrowid)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return ids
+
+    def lease(self, worker: str, lease_seconds: float) -> Optional[Dict]:
+        """Take the oldest available job, re-queueing expired leases first"""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Expired leases that used up their attempts are given up on
+            self.conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'lease expired too many times', updated = ? "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts)
+            )
+            row = self.conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                self.conn.execute("COMMIT")
+                return None
+            self.conn.execute(
+                "UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, updated = ? "
+                "WHERE id = ?",
+                (worker, now + lease_seconds, now, row["id"])
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        job = dict(row)
+        job["attempts"] += 1
+        return job
+
+    def heartbeat(self, job_id: int, worker: str, lease_seconds: float) -> bool:
+        """Extend a lease; False means the worker no longer holds it"""
+        now = time.time()
+        cursor = self.conn.execute(
+            "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+            (now + lease_seconds, now, job_id, worker)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker: str, summary: str) -> bool:
+        """Store a job's summary; ignored if the lease was lost to another worker"""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'done', summary = ?, error = NULL, lease_expires = NULL, updated = ? "
+            "WHERE id = ? AND worker = ? AND status = 'leased'",
+            (summary, time.time(), job_id, worker)
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: int, worker: str, error: str) -> None:
+        """Record an error, re-queueing the job unless it is out of attempts"""
+        self.conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+            "error = ?, lease_expires = NULL, updated = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+            (self.max_attempts, error, time.time(), job_id, worker)
+        )
+
+    def requeue_failed(self) -> int:
+        """Give failed jobs a fresh set of attempts"""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'queued', attempts = 0, worker = NULL, updated = ? WHERE status = 'failed'",
+            (time.time(),)
+        )
+        return cursor.rowcount
+
+    def get_counts(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def iter_jobs(self, status: Optional[str] = None) -> Iterator[Dict]:
+        """Stream jobs, optionally only those with a given status"""
+        if status:
+            cursor = self.conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id", (status,))
+        else:
+            cursor = self.conn.execute("SELECT * FROM jobs ORDER BY id")
+        for row in cursor:
+            yield dict(row)
+
+    def close(self) -> None:
+        self.conn.close()
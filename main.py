@@ -1,16 +1,172 @@
 import argparse
-from cli_app import run_cli
-from gui_app import run_gui
+import logging
+
+def _int_at_least(minimum):
+    """An argparse type for integers of at least `minimum`"""
+    def parse(value):
+        try:
+            number = int(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid integer: '{value}'")
+        if number < minimum:
+            raise argparse.ArgumentTypeError(f"must be at least {minimum}, got {number}")
+        return number
+    return parse
 
 def main():
     parser = argparse.ArgumentParser(description='SciSift - Scientific Paper Analysis Tool')
     parser.add_argument('--gui', action='store_true', help='Run in GUI mode (default: CLI mode)')
+    parser.add_argument('--model', help='Model to use for every request (default: routed per request)')
+    parser.add_argument('--profile-cpu', action='store_true', help='Profile CPU time of the command with cProfile')
+    parser.add_argument('--profile-mem', action='store_true', help='Profile memory allocations of the command with tracemalloc')
+    parser.add_argument('--profile-dir', default='profiles', help='Directory for profiling artifacts (default: profiles)')
+    parser.add_argument('--profile-top', type=int, default=20, help='Entries listed per profiled region (default: 20)')
+    subparsers = parser.add_subparsers(dest='command')
+    
+    cache_parser = subparsers.add_parser('cache', help='Inspect and maintain the summary and chat answer caches')
+    cache_parser.add_argument('action', choices=['stats', 'gc', 'expire', 'clear', 'export', 'import', 'sync'])
+    cache_parser.add_argument('path', nargs='?', help='.jsonl.gz file for export and import, shared directory for sync')
+    cache_parser.add_argument('--no-documents', action='store_true',
+                              help='Leave extracted document text out of export, import and sync')
+    
+    usage_parser = subparsers.add_parser('usage', help='Show token usage and estimated cost')
+    usage_parser.add_argument('--by', choices=['profile', 'day', 'paper', 'model'], default='profile')
+    
+    subparsers.add_parser('ratelimit', help='Show shared rate limit buckets and time spent waiting')
+    
+    enqueue_parser = subparsers.add_parser('enqueue', help='Add papers to a shared job store')
+    enqueue_parser.add_argument('paths', nargs='+', help='Paper files, directories of papers, or URLs with --url')
+    enqueue_parser.add_argument('--store', default='jobs.db', help='Job store file (default: jobs.db)')
+    enqueue_parser.add_argument('--url', action='store_true', help='Treat the arguments as paper URLs')
+    enqueue_parser.add_argument('--profile', help='Profile to analyze with (default: the active profile)')
+    
+    worker_parser = subparsers.add_parser('worker', help='Process jobs from a shared job store')
+    worker_parser.add_argument('--store', default='jobs.db', help='Job store file (default: jobs.db)')
+    worker_parser.add_argument('--id', help='Worker id (default: host:pid)')
+    worker_parser.add_argument('--lease', type=float, default=300, help='Lease length in seconds')
+    worker_parser.add_argument('--exit-when-empty', action='store_true', help='Stop when no jobs are available')
+    
+    jobs_parser = subparsers.add_parser('jobs', help='Inspect a shared job store')
+    jobs_parser.add_argument('action', choices=['status', 'results', 'failed', 'requeue-failed'])
+    jobs_parser.add_argument('--store', default='jobs.db', help='Job store file (default: jobs.db)')
+    
+    analyze_parser = subparsers.add_parser('analyze', help='Analyze papers non-interactively, streaming JSONL results')
+    analyze_parser.add_argument('source', help="File listing paper paths or URLs, one per line, or '-' for stdin")
+    analyze_parser.add_argument('--profile', help='Profile to analyze with (default: the active profile)')
+    analyze_parser.add_argument('--model', default=argparse.SUPPRESS, help='Model to use (default: routed per request)')
+    analyze_parser.add_argument('--concurrency', type=_int_at_least(1), default=4, help='Papers analyzed at once (default: 4)')
+    analyze_parser.add_argument('--structured', action='store_true', help='Request structured JSON summaries and store their fields')
+    analyze_parser.add_argument('--pack-tokens', type=int, metavar='N',
+                                help='Bundle small papers into shared requests of up to N tokens')
+    
+    query_parser = subparsers.add_parser('query', help='Query fields of structured summaries')
+    query_parser.add_argument('--min-sample-size', type=int)
+    query_parser.add_argument('--max-sample-size', type=int)
+    query_parser.add_argument('--profile', help='Only summaries made with this profile')
+    query_parser.add_argument('--list', dest='list_field', choices=['findings', 'methods', 'limitations', 'future_work'],
+                              help='List every item of a field across papers')
+    
+    synthesize_parser = subparsers.add_parser('synthesize', help='Write a comparative review of several papers')
+    synthesize_parser.add_argument('paths', nargs='+', help='Paper files or directories of papers')
+    synthesize_parser.add_argument('--profile', help='Profile to shape the review (default: the active profile)')
+    synthesize_parser.add_argument('--model', default=argparse.SUPPRESS, help='Model to use (default: routed per request)')
+    synthesize_parser.add_argument('--group-size', type=_int_at_least(2), default=5, help='Summaries merged per reduction step (default: 5)')
+    synthesize_parser.add_argument('--concurrency', type=_int_at_least(1), default=4, help='Requests run at once (default: 4)')
+    
+    benchmark_parser = subparsers.add_parser('benchmark', help='Measure extraction time and peak memory')
+    benchmark_parser.add_argument('paths', nargs='+', help='Paper files to extract')
+    benchmark_parser.add_argument('--max-rss-mb', type=float, help='Memory cap to enforce (default: the extraction setting)')
+    
+    citations_parser = subparsers.add_parser('citations', help='Query the citation graph of the paper corpus')
+    citations_parser.add_argument('action', choices=['build', 'citing', 'top', 'external', 'cocited', 'stats'])
+    citations_parser.add_argument('query', nargs='?', help='Paper path, DOI or title for citing and cocited')
+    citations_parser.add_argument('--limit', type=int, default=10, help='Works listed (default: 10)')
+    citations_parser.add_argument('--dir', default='papers', help='Paper directory to index with build (default: papers)')
+    
+    revisions_parser = subparsers.add_parser('revisions', help='List or compare the summaries of earlier versions of a paper')
+    revisions_parser.add_argument('paper', nargs='?', help='Paper file whose revisions to list')
+    revisions_parser.add_argument('--show', type=int, metavar='ID', help='Print the summary of a revision')
+    revisions_parser.add_argument('--diff', type=int, metavar='ID', help='Diff a revision against the one before it')
+    
+    clusters_parser = subparsers.add_parser('clusters', help='Group papers into topics and find duplicates')
+    clusters_parser.add_argument('--dir', default='papers', help='Paper directory to index (default: papers)')
+    clusters_parser.add_argument('--clusters', type=int, help='Number of topics (default: about sqrt(papers / 2))')
+    clusters_parser.add_argument('--recluster', action='store_true', help='Recompute the topics of the whole corpus')
+    clusters_parser.add_argument('--members', action='store_true', help='List every paper of each topic')
+    clusters_parser.add_argument('--representatives', action='store_true',
+                                 help='Only print the representative paper of each topic, one path per line')
+    
     args = parser.parse_args()
     
-    if args.gui:
-        run_gui()
+    # Routing decisions and other diagnostics go to a log file
+    logging.basicConfig(
+        filename='scisift.log', level=logging.INFO,
+        format='%(asctime)s %(name)s %(levelname)s %(message)s'
+    )
+    
+    if args.profile_cpu or args.profile_mem:
+        from profiling import run_profiled
+        run_profiled(
+            args.command or ('gui' if args.gui else 'cli'), lambda: run_command(args),
+            cpu=args.profile_cpu, mem=args.profile_mem, output_dir=args.profile_dir, top=args.profile_top,
+            # Extraction benchmarks do not touch the model or summary cache
+            instrument=args.command != 'benchmark'
+        )
+    else:
+        run_command(args)
+
+def run_command(args):
+    # Import lazily so non-GUI commands do not need tkinter
+    if args.command == 'cache':
+        from cli_app import run_cache_command
+        run_cache_command(args.action, args.path, documents=not args.no_documents)
+    elif args.command == 'usage':
+        from cli_app import run_usage_command
+        run_usage_command(args.by)
+    elif args.command == 'ratelimit':
+        from cli_app import run_rate_limit_command
+        run_rate_limit_command()
+    elif args.command == 'analyze':
+        from cli_app import run_analyze_command
+        run_analyze_command(args.source, profile=args.profile, model=args.model,
+                            concurrency=args.concurrency, structured=args.structured, pack_tokens=args.pack_tokens)
+    elif args.command == 'query':
+        from cli_app import run_query_command
+        run_query_command(args.min_sample_size, args.max_sample_size, args.profile, args.list_field)
+    elif args.command == 'synthesize':
+        from cli_app import run_synthesize_command
+        run_synthesize_command(args.paths, profile=args.profile, model=args.model,
+                               group_size=args.group_size, concurrency=args.concurrency)
+    elif args.command == 'enqueue':
+        from cli_app import run_enqueue_command
+        run_enqueue_command(args.store, args.paths, urls=args.url, profile=args.profile, model=args.model)
+    elif args.command == 'worker':
+        from batch_worker import run_worker
+        run_worker(args.store, worker_id=args.id, lease_seconds=args.lease, exit_when_empty=args.exit_when_empty)
+    elif args.command == 'jobs':
+        from cli_app import run_jobs_command
+        run_jobs_command(args.store, args.action)
+    elif args.command == 'citations':
+        from cli_app import run_citations_command
+        run_citations_command(args.action, args.query, limit=args.limit, paper_dir=args.dir)
+    elif args.command == 'revisions':
+        from cli_app import run_revisions_command
+        run_revisions_command(args.paper, show=args.show, diff=args.diff)
+    elif args.command == 'clusters':
+        from cli_app import run_clusters_command
+        run_clusters_command(args.dir, n_clusters=args.clusters, recluster=args.recluster,
+                             members=args.members, representatives=args.representatives)
+    elif args.command == 'benchmark':
+        from benchmark import run_extraction_benchmark, print_benchmark
+        from profile_manager import ProfileManager
+        max_rss_mb = args.max_rss_mb or ProfileManager().get_setting("extraction", {}).get("maxRssMb")
+        print_benchmark(run_extraction_benchmark(args.paths, max_rss_mb))
+    elif args.gui:
+        from gui_app import run_gui
+        run_gui(model=args.model)
     else:
-        run_cli()
+        from cli_app import run_cli
+        run_cli(model=args.model)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
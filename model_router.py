@@ -0,0 +1,157 @@
+import json
+import os
+import time
+import atexit
+import logging
+import threading
+import contextlib
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "google/gemini-2.0-flash-001"
+
+# Weight of the newest observation in the moving averages
+SMOOTHING = 0.2
+
+# Seconds between writes of the observed statistics; the rest is written at exit
+FLUSH_INTERVAL = 30
+
+
+@contextlib.contextmanager
+def _file_lock(path: str):
+    """Hold an exclusive lock on a file across processes, where the platform has flock"""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class ModelRouter:
+    def __init__(self, config: Optional[Dict] = None, stats_file: str = "model_stats.json"):
+        self.config = config or {}
+        self.stats_file = stats_file
+        self.stats = self._load_stats()
+        # Requests are recorded from several threads at once
+        self._lock = threading.Lock()
+        # Observations not written yet; they are applied to the file's latest statistics,
+        # so several processes recording at once do not overwrite each other
+        self._pending: List[Tuple[str, float, bool]] = []
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush)
+
+    def _load_stats(self) -> Dict:
+        """Load observed per-model latency and error rates from file"""
+        if not os.path.exists(self.stats_file):
+            return {}
+
+        try:
+            with open(self.stats_file, 'r') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            return {}
+
+    def _save_stats(self) -> None:
+        """Save observed per-model statistics to file through a temporary file, so readers never see it torn"""
+        tmp_file = f"{self.stats_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.stats, f, indent=4)
+        os.replace(tmp_file, self.stats_file)
+
+    def flush(self) -> None:
+        """Apply recorded observations to the statistics on disk and write them back"""
+        with self._lock:
+            if not self._pending:
+                return
+            with _file_lock(self.stats_file + ".lock"):
+                stats = self._load_stats()
+                for model, latency, error in self._pending:
+                    self._apply(stats, model, latency, error)
+                self.stats = stats
+                self._save_stats()
+            self._pending = []
+            self._last_flush = time.monotonic()
+
+    @property
+    def default_model(self) -> str:
+        return self.config.get("defaultModel", DEFAULT_MODEL)
+
+    def get_models(self) -> List[str]:
+        """Get the names of all configured models, cheapest first"""
+        models = [m["name"] for m in self.config.get("models", [])]
+        if self.default_model not in models:
+            models.append(self.default_model)
+        return models
+
+    def max_input_tokens(self, model: str) -> Optional[int]:
+        """The configured input limit of a model, if it has one"""
+        for m in self.config.get("models", []):
+            if m["name"] == model:
+                return m.get("maxInputTokens")
+        return None
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Roughly estimate the number of tokens in a text"""
+        return len(text) // 4 + 1
+
+    def _is_healthy(self, model: str) -> bool:
+        """Check the observed error rate and latency against the configured limits"""
+        with self._lock:
+            stats = dict(self.stats.get(model) or {})
+        if not stats or stats["calls"] < self.config.get("minSamples", 5):
+            return True
+        if stats["errorRate"] > self.config.get("maxErrorRate", 0.5):
+            return False
+        max_latency = self.config.get("maxLatencySeconds")
+        return not (max_latency and stats["latency"] > max_latency)
+
+    def route(self, input_tokens: int, technical_level: Optional[str] = None) -> str:
+        """Pick the cheapest configured model that fits the request"""
+        candidates = [
+            m for m in self.config.get("models", [])
+            if input_tokens <= m.get("maxInputTokens", float("inf"))
+            and (not m.get("technicalLevels") or technical_level in m["technicalLevels"])
+        ]
+        healthy = [m for m in candidates if self._is_healthy(m["name"])]
+
+        if healthy:
+            model, reason = healthy[0]["name"], "cheapest fitting model"
+        elif candidates:
+            # Everything that fits is degraded; prefer the lowest error rate
+            with self._lock:
+                best = min(candidates, key=lambda m: self.stats.get(m["name"], {}).get("errorRate", 0))
+            model, reason = best["name"], "all fitting models degraded"
+        else:
+            model, reason = self.default_model, "no configured model fits"
+
+        logger.info(
+            "Routed request (%d tokens, level %s) to %s: %s",
+            input_tokens, technical_level or "none", model, reason
+        )
+        return model
+
+    @staticmethod
+    def _apply(stats: Dict, model: str, latency: float, error: bool) -> None:
+        """Update the moving averages of a model with one observation"""
+        model_stats = stats.setdefault(model, {"calls": 0, "errorRate": 0.0, "latency": latency})
+        model_stats["calls"] += 1
+        model_stats["errorRate"] += SMOOTHING * ((1.0 if error else 0.0) - model_stats["errorRate"])
+        if not error:
+            model_stats["latency"] += SMOOTHING * (latency - model_stats["latency"])
+
+    def record(self, model: str, latency: float, error: bool = False) -> None:
+        """Record the outcome of a request to a model; written to file at most every FLUSH_INTERVAL seconds"""
+        with self._lock:
+            self._apply(self.stats, model, latency, error)
+            self._pending.append((model, latency, error))
+            due = time.monotonic() - self._last_flush >= FLUSH_INTERVAL
+        if due:
+            self.flush()
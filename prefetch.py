@@ -0,0 +1,92 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, List, Optional, Tuple
+from ai_service import prefetch_paper, profile_manager
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """Speculatively prepares papers the user is likely to analyze next.
+
+    Work runs on a single background thread so it never competes with real
+    analyses for more than one core. Starting a new prefetch cancels the
+    previous one, at most `max_papers` papers are prepared per request, and
+    files larger than `max_file_bytes` are skipped.
+    """
+
+    def __init__(self, enabled: bool = True, max_file_bytes: Optional[int] = None, max_papers: int = 3):
+        self.enabled = enabled
+        self.max_file_bytes = max_file_bytes
+        self.max_papers = max_papers
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        # paper path -> (cancel event, future, request parameters)
+        self._pending: Dict[str, Tuple[threading.Event, Future, Tuple]] = {}
+
+    def _allowed(self, paper_path: str) -> bool:
+        try:
+            size = os.path.getsize(paper_path)
+        except OSError:
+            return False
+        return not self.max_file_bytes or size <= self.max_file_bytes
+
+    def _run(self, paper_path, params, cancel_event):
+        if cancel_event.is_set():
+            return {"cancelled": True}
+        result = prefetch_paper(paper_path, *params, cancel_event=cancel_event)
+        logger.info("Prefetched %s: %s", paper_path, result)
+        return result
+
+    def prefetch(self, paper_paths: List[str], model: Optional[str] = None, profile_name: Optional[str] = None,
+                 structured: bool = False) -> None:
+        """Cancel earlier speculative work and start preparing these papers in order"""
+        self.cancel()
+        if not self.enabled:
+            return
+        params = (model, profile_name, structured)
+        with self._lock:
+            for paper_path in [p for p in paper_paths if self._allowed(p)][:self.max_papers]:
+                cancel_event = threading.Event()
+                future = self._executor.submit(self._run, paper_path, params, cancel_event)
+                self._pending[paper_path] = (cancel_event, future, params)
+
+    def cancel(self, keep: Optional[str] = None) -> None:
+        """Stop speculative work, except for the paper `keep`"""
+        with self._lock:
+            for paper_path in list(self._pending):
+                if paper_path != keep:
+                    cancel_event, _, _ = self._pending.pop(paper_path)
+                    cancel_event.set()
+
+    def peek(self, paper_path: str, model: Optional[str] = None, profile_name: Optional[str] = None,
+             structured: bool = False) -> Optional[Dict]:
+        """The finished prefetch result for a paper if it matches these parameters, without waiting"""
+        with self._lock:
+            pending = self._pending.get(paper_path)
+        if not pending or not pending[1].done() or pending[2] != (model, profile_name, structured):
+            return None
+        return pending[1].result()
+
+    def claim(self, paper_path: str) -> Optional[Dict]:
+        """Cancel speculative work on other papers and wait for this one's, if any was started"""
+        self.cancel(keep=paper_path)
+        with self._lock:
+            pending = self._pending.pop(paper_path, None)
+        return pending[1].result() if pending else None
+
+    def shutdown(self) -> None:
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+
+def create_prefetcher() -> Prefetcher:
+    """Build a prefetcher from the prefetch section of settings.json"""
+    settings = profile_manager.get_setting("prefetch", {})
+    return Prefetcher(
+        enabled=settings.get("enabled", True),
+        max_file_bytes=settings.get("maxFileBytes"),
+        max_papers=settings.get("maxPapers", 3)
+    )
@@ -1,11 +1,40 @@
 import json
 import os
-from typing import Dict, List, Optional
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of settings.json for edits made by other processes
+RELOAD_CHECK_INTERVAL = 1.0
 
 class ProfileManager:
+    """Profiles and settings backed by settings.json.
+
+    Profiles are indexed by name. Every change gives the profile a new version
+    number (increasing across all profiles, so a deleted and re-created profile
+    never reuses one) and is announced to subscribers as an event dict:
+    {"event": "created" | "updated" | "deleted" | "activated" | "settings",
+    "name", "previous_name", "version"}. Edits made to settings.json by other
+    processes are picked up by comparing its modification time, at most once per
+    RELOAD_CHECK_INTERVAL, and announced the same way.
+    """
+
     def __init__(self, settings_file: str = "settings.json"):
         self.settings_file = settings_file
+        self._lock = threading.RLock()
+        self._subscribers: List[Callable[[Dict], None]] = []
+        self._index: Dict[str, Dict] = {}
+        self._versions: Dict[str, int] = {}
+        self._active: Optional[str] = None
+        # Increases with every change to any profile or setting
+        self.version = 0
+        self._signature: Optional[Tuple[int, int]] = None
+        self._last_check = time.monotonic()
         self.profiles = self._load_profiles()
+        self._rebuild_index()
 
     def _create_default_settings(self) -> Dict:
         """Create default settings with a basic profile"""
@@ -33,112 +62,245 @@ class ProfileManager:
             ]
         }
 
-    def _load_profiles(self) -> Dict:
-        """Load profiles from settings file or create default if not exists"""
-        if not os.path.exists(self.settings_file):
-            default_settings = self._create_default_settings()
-            self._save_profiles(default_settings)
-            return default_settings
-        
+    def _file_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.settings_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read_settings(self) -> Optional[Dict]:
+        """Parse settings.json with exactly one selected profile; None if it is missing or corrupted"""
         try:
             with open(self.settings_file, 'r') as f:
                 settings = json.load(f)
-                # Ensure at least one profile exists
-                if not settings.get("profiles"):
-                    settings = self._create_default_settings()
-                    self._save_profiles(settings)
-                # Ensure exactly one profile is selected
-                selected_found = False
-                for profile in settings["profiles"]:
-                    if profile.get("selected", False):
-                        if selected_found:
-                            profile["selected"] = False
-                        else:
-                            selected_found = True
-                if not selected_found and settings["profiles"]:
-                    settings["profiles"][0]["selected"] = True
-                return settings
-        except json.JSONDecodeError:
-            # If settings file is corrupted, create new default settings
+        except (OSError, json.JSONDecodeError):
+            return None
+        if not isinstance(settings, dict) or not settings.get("profiles"):
+            return None
+        # Ensure exactly one profile is selected
+        selected_found = False
+        for profile in settings["profiles"]:
+            if profile.get("selected", False):
+                if selected_found:
+                    profile["selected"] = False
+                else:
+                    selected_found = True
+        if not selected_found:
+            settings["profiles"][0]["selected"] = True
+        return settings
+
+    def _load_profiles(self) -> Dict:
+        """Load profiles from settings file or create default if not exists"""
+        signature = self._file_signature()
+        settings = self._read_settings()
+        if settings is None:
+            # Missing, corrupted or without profiles: start from the defaults,
+            # keeping the other settings when the file could still be read
             default_settings = self._create_default_settings()
+            try:
+                with open(self.settings_file, 'r') as f:
+                    existing = json.load(f)
+                if isinstance(existing, dict):
+                    default_settings = {**existing, **default_settings}
+            except (OSError, json.JSONDecodeError):
+                pass
             self._save_profiles(default_settings)
             return default_settings
+        self._signature = signature
+        return settings
 
     def _save_profiles(self, settings: Dict) -> None:
-        """Save profiles to settings file"""
-        with open(self.settings_file, 'w') as f:
+        """Save profiles to settings file atomically, so readers never see a partial file"""
+        temp_path = f"{self.settings_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w') as f:
             json.dump(settings, f, indent=4)
+        os.replace(temp_path, self.settings_file)
+        # Our own write is not an external edit
+        self._signature = self._file_signature()
+
+    def _rebuild_index(self) -> None:
+        self._index = {}
+        for profile in self.profiles.get("profiles", []):
+            self._index.setdefault(profile["name"], profile)
+        self._active = next((name for name, p in self._index.items() if p.get("selected", False)), None)
+
+    def _bump(self, name: Optional[str]) -> int:
+        self.version += 1
+        if name is not None:
+            self._versions[name] = self.version
+        return self.version
+
+    def _event(self, event: str, name: Optional[str], previous_name: Optional[str] = None) -> Dict:
+        return {"event": event, "name": name, "previous_name": previous_name, "version": self._bump(name)}
+
+    def _publish(self, events: List[Dict]) -> None:
+        """Call subscribers outside the lock, so they may use the manager"""
+        for event in events:
+            for callback in list(self._subscribers):
+                try:
+                    callback(event)
+                except Exception:
+                    logger.exception("Profile subscriber failed on %s", event)
+
+    def subscribe(self, callback: Callable[[Dict], None]) -> Callable[[], None]:
+        """Call `callback(event)` after every change; returns a function that unsubscribes.
+
+        Callbacks run on the thread that made or noticed the change.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def get_version(self, name: str) -> int:
+        """Version of a profile, which changes whenever it does; 0 if it never changed"""
+        self.check_reload()
+        return self._versions.get(name, 0)
+
+    def check_reload(self) -> bool:
+        """Reload if settings.json changed and the last check is older than RELOAD_CHECK_INTERVAL"""
+        if time.monotonic() - self._last_check < RELOAD_CHECK_INTERVAL:
+            return False
+        return self.reload_if_changed()
+
+    def reload_if_changed(self) -> bool:
+        """Reload settings.json if another process edited it, announcing what changed"""
+        with self._lock:
+            self._last_check = time.monotonic()
+            signature = self._file_signature()
+            if signature is None or signature == self._signature:
+                return False
+            settings = self._read_settings()
+            if settings is None:
+                # Probably mid-edit by hand; keep the current profiles and retry later
+                return False
+            self._signature = signature
+
+            old_index, old_active = self._index, self._active
+            old_settings = {k: v for k, v in self.profiles.items() if k != "profiles"}
+            self.profiles = settings
+            self._rebuild_index()
+
+            events = []
+            for name, profile in self._index.items():
+                if name not in old_index:
+                    events.append(self._event("created", name))
+                elif _content(profile) != _content(old_index[name]):
+                    events.append(self._event("updated", name, name))
+            for name in old_index:
+                if name not in self._index:
+                    events.append(self._event("deleted", name))
+            if self._active != old_active:
+                events.append(self._event("activated", self._active, old_active))
+            if {k: v for k, v in settings.items() if k != "profiles"} != old_settings:
+                events.append(self._event("settings", None))
+        if events:
+            logger.info("Reloaded %s: %s", self.settings_file, ", ".join(e["event"] for e in events))
+        self._publish(events)
+        return True
 
     def get_all_profiles(self) -> List[Dict]:
         """Get all available profiles"""
+        self.check_reload()
         return self.profiles.get("profiles", [])
 
+    def get_profile_names(self) -> List[str]:
+        """Names of all profiles in their stored order"""
+        self.check_reload()
+        return list(self._index)
+
+    def get_setting(self, key: str, default=None):
+        """Get a top-level setting other than the profiles"""
+        return self.profiles.get(key, default)
+
     def get_profile_by_name(self, name: str) -> Optional[Dict]:
         """Get a specific profile by name"""
-        for profile in self.profiles.get("profiles", []):
-            if profile["name"] == name:
-                return profile
-        return None
+        self.check_reload()
+        return self._index.get(name)
 
     def get_active_profile(self) -> Optional[Dict]:
         """Get the currently selected profile"""
-        for profile in self.profiles.get("profiles", []):
-            if profile.get("selected", False):
-                return profile
-        return None
+        self.check_reload()
+        return self._index.get(self._active) if self._active is not None else None
 
     def create_profile(self, profile: Dict) -> None:
         """Create a new profile"""
-        if self.get_profile_by_name(profile["name"]):
-            raise ValueError(f"Profile '{profile['name']}' already exists")
-        
-        self.profiles["profiles"].append(profile)
-        self._save_profiles(self.profiles)
+        with self._lock:
+            # Apply edits from other processes first so they are not overwritten
+            self.reload_if_changed()
+            if profile["name"] in self._index:
+                raise ValueError(f"Profile '{profile['name']}' already exists")
+
+            profile["selected"] = False
+            self.profiles["profiles"].append(profile)
+            self._index[profile["name"]] = profile
+            self._save_profiles(self.profiles)
+            event = self._event("created", profile["name"])
+        self._publish([event])
 
     def update_profile(self, old_name: str, new_profile: Dict) -> None:
         """Update an existing profile"""
-        profiles = self.profiles["profiles"]
-        for i, profile in enumerate(profiles):
-            if profile["name"] == old_name:
-                was_selected = profile.get("selected", False)
-                profiles[i] = new_profile
-                profiles[i]["selected"] = was_selected
-                self._save_profiles(self.profiles)
-                return
-        raise ValueError(f"Profile '{old_name}' not found")
+        with self._lock:
+            self.reload_if_changed()
+            old_profile = self._index.get(old_name)
+            if old_profile is None:
+                raise ValueError(f"Profile '{old_name}' not found")
+            new_name = new_profile["name"]
+            if new_name != old_name and new_name in self._index:
+                raise ValueError(f"Profile '{new_name}' already exists")
+
+            was_selected = old_profile.get("selected", False)
+            new_profile["selected"] = was_selected
+            profiles = self.profiles["profiles"]
+            profiles[profiles.index(old_profile)] = new_profile
+            self._rebuild_index()
+            self._save_profiles(self.profiles)
+            event = self._event("updated", new_name, old_name)
+        self._publish([event])
 
     def delete_profile(self, name: str) -> None:
         """Delete a profile"""
-        profiles = self.profiles["profiles"]
-        was_selected = False
-        for i, profile in enumerate(profiles):
-            if profile["name"] == name:
-                was_selected = profile.get("selected", False)
-                del profiles[i]
-                break
-        else:
-            raise ValueError(f"Profile '{name}' not found")
-        
-        # If we deleted the selected profile, select the first remaining profile
-        if was_selected and profiles:
-            profiles[0]["selected"] = True
-        
-        self._save_profiles(self.profiles)
+        with self._lock:
+            self.reload_if_changed()
+            profile = self._index.pop(name, None)
+            if profile is None:
+                raise ValueError(f"Profile '{name}' not found")
+            profiles = self.profiles["profiles"]
+            profiles.remove(profile)
+            events = [self._event("deleted", name)]
+
+            # If we deleted the selected profile, select the first remaining profile
+            if profile.get("selected", False):
+                self._active = None
+                if profiles:
+                    profiles[0]["selected"] = True
+                    self._active = profiles[0]["name"]
+                    events.append(self._event("activated", self._active, name))
+
+            self._save_profiles(self.profiles)
+        self._publish(events)
 
     def set_active_profile(self, name: str) -> None:
         """Set a profile as active"""
-        found = False
-        for profile in self.profiles["profiles"]:
-            if profile["name"] == name:
-                profile["selected"] = True
-                found = True
-            else:
-                profile["selected"] = False
-        
-        if not found:
-            raise ValueError(f"Profile '{name}' not found")
-        
-        self._save_profiles(self.profiles)
+        with self._lock:
+            self.reload_if_changed()
+            if name not in self._index:
+                raise ValueError(f"Profile '{name}' not found")
+            if name == self._active:
+                return
+
+            previous = self._active
+            if previous is not None:
+                self._index[previous]["selected"] = False
+            self._index[name]["selected"] = True
+            self._active = name
+            self._save_profiles(self.profiles)
+            event = self._event("activated", name, previous)
+        self._publish([event])
 
     def get_profile_constraints(self, name: Optional[str] = None) -> List[str]:
         """Get constraints for a profile"""
@@ -147,7 +309,11 @@ class ProfileManager:
             profile = self.get_profile_by_name(name)
         else:
             profile = self.get_active_profile()
-        
+
         if profile:
             return profile.get("constraints", [])
-        return [] 
\ No newline at end of file
+        return []
+
+def _content(profile: Dict) -> Dict:
+    """A profile without its selection flag, for detecting edits"""
+    return {k: v for k, v in profile.items() if k != "selected"}
@@ -0,0 +1,249 @@
+import os
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import functools
+import threading
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Functions profiled as their own regions: (region, module, attribute)
+REGIONS = [
+    ("read_file_content", "ai_service", "_read_file_content"),
+    ("request", "ai_service", "_create_completion"),
+    ("summary_get", "summary_manager", "SummaryManager.get_summary"),
+    ("summary_save", "summary_manager", "SummaryManager.save_summary"),
+    ("summary_flush", "summary_manager", "SummaryManager.flush"),
+]
+
+
+# Allocations made by the profiling machinery itself
+_IGNORED_FRAMES = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, cProfile.__file__),
+    tracemalloc.Filter(False, pstats.__file__),
+    tracemalloc.Filter(False, __file__),
+]
+
+
+class _Region:
+    """Calls, wall time, merged cProfile stats and the largest allocation snapshot of one region"""
+
+    def __init__(self, name: str, code_key=None):
+        self.name = name
+        # pstats key of the wrapped function, to find it in the command profile
+        self.code_key = code_key
+        self.calls = 0
+        self.seconds = 0.0
+        self.stats: Optional[pstats.Stats] = None
+        self.unprofiled = 0
+        self.in_command = 0
+        self.peak_bytes = 0
+        # Snapshots before and after the call that used the most memory
+        self.snapshot: Optional[Tuple[Optional[tracemalloc.Snapshot], tracemalloc.Snapshot]] = None
+
+
+class Profiler:
+    """CPU (cProfile) and memory (tracemalloc) profiling of one command.
+
+    Nothing is wrapped or traced unless a Profiler is started, so the hooks
+    cost nothing when profiling is off. `instrument` wraps the functions in
+    REGIONS so each gets its own statistics, whichever thread calls them; the
+    whole command is profiled as the "command" region on the starting thread.
+    A thread runs one cProfile profiler at a time, so region calls on that
+    thread appear in the command profile, and their summary lists what the
+    region function called there. Memory figures are approximate when regions
+    run concurrently, as tracemalloc tracks the whole process.
+    """
+
+    def __init__(self, command: str, cpu: bool = False, mem: bool = False, output_dir: str = "profiles",
+                 top: int = 20):
+        self.command = command
+        self.cpu = cpu
+        self.mem = mem
+        self.top = top
+        self.output_dir = os.path.join(output_dir, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{command}")
+        self._regions: Dict[str, _Region] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._restore = []
+        self._command_profile: Optional[cProfile.Profile] = None
+        self._command_thread: Optional[int] = None
+        self._start = 0.0
+
+    def _region(self, name: str) -> _Region:
+        with self._lock:
+            return self._regions.setdefault(name, _Region(name))
+
+    def _wrap(self, name: str, function):
+        code = function.__code__
+        self._regions[name] = _Region(name, (code.co_filename, code.co_firstlineno, code.co_name))
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            # Regions nested on one thread are counted inside the outer one
+            if getattr(self._local, "active", False):
+                return function(*args, **kwargs)
+            self._local.active = True
+            try:
+                return self._measure(name, function, args, kwargs)
+            finally:
+                self._local.active = False
+        return wrapper
+
+    def _measure(self, name, function, args, kwargs):
+        region = self._region(name)
+        on_command_thread = self._command_profile is not None and threading.get_ident() == self._command_thread
+        profile = cProfile.Profile() if self.cpu and not on_command_thread else None
+        if profile:
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12+ allows one active profiler per process; time this call only
+                profile = None
+        if self.mem:
+            before = tracemalloc.get_traced_memory()[0]
+            before_snapshot = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            if profile:
+                profile.disable()
+            peak = tracemalloc.get_traced_memory()[1] - before if self.mem else 0
+            # Keep the allocations of the call that used the most memory
+            snapshot = tracemalloc.take_snapshot() if self.mem and peak > region.peak_bytes else None
+            with self._lock:
+                region.calls += 1
+                region.seconds += elapsed
+                if profile:
+                    if region.stats is None:
+                        region.stats = pstats.Stats(profile)
+                    else:
+                        region.stats.add(profile)
+                elif on_command_thread:
+                    region.in_command += 1
+                elif self.cpu:
+                    region.unprofiled += 1
+                if snapshot and peak > region.peak_bytes:
+                    region.peak_bytes, region.snapshot = peak, (before_snapshot, snapshot)
+
+    def instrument(self) -> None:
+        """Wrap the REGIONS functions; imports their modules"""
+        for name, module_name, attribute in REGIONS:
+            owner = __import__(module_name)
+            *path, function_name = attribute.split(".")
+            try:
+                for part in path:
+                    owner = getattr(owner, part)
+                original = getattr(owner, function_name)
+            except AttributeError:
+                logger.warning("Not profiling region %s: %s.%s does not exist", name, module_name, attribute)
+                continue
+            setattr(owner, function_name, self._wrap(name, original))
+            self._restore.append((owner, function_name, original))
+
+    def start(self) -> None:
+        if self.mem:
+            tracemalloc.start(25)
+        self._start = time.perf_counter()
+        if self.cpu:
+            self._command_thread = threading.get_ident()
+            self._command_profile = cProfile.Profile()
+            try:
+                self._command_profile.enable()
+            except ValueError:
+                self._command_profile = None
+
+    def stop(self) -> str:
+        """Stop profiling, restore wrapped functions, write artifacts and return the summary"""
+        if self._command_profile:
+            self._command_profile.disable()
+        command = self._region("command")
+        command_profile, self._command_profile = self._command_profile, None
+        command.calls, command.seconds = 1, time.perf_counter() - self._start
+        if command_profile:
+            command.stats = pstats.Stats(command_profile)
+        if self.mem:
+            command.peak_bytes = tracemalloc.get_traced_memory()[1]
+            command.snapshot = (None, tracemalloc.take_snapshot())
+            tracemalloc.stop()
+        for owner, function_name, original in reversed(self._restore):
+            setattr(owner, function_name, original)
+        self._restore = []
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        lines = [f"Profile of '{self.command}' ({self.output_dir})"]
+        for region in sorted(self._regions.values(), key=lambda r: r.name != "command"):
+            if region.calls:
+                lines += self._write_region(region, command.stats)
+        summary = "\n".join(lines)
+        with open(os.path.join(self.output_dir, "summary.txt"), "w") as f:
+            f.write(summary + "\n")
+        return summary
+
+    def _format_functions(self, rows) -> List[str]:
+        lines = []
+        for (file_name, line, function), (_, calls, own, cumulative) in rows[:self.top]:
+            location = f"{os.path.basename(file_name)}:{line}" if line else file_name
+            lines.append(f"   {cumulative:9.3f}s {own:9.3f}s {calls:>8}  {function} ({location})")
+        return lines
+
+    def _write_region(self, region: _Region, command_stats: Optional[pstats.Stats]) -> List[str]:
+        lines = ["", f"== {region.name}: {region.calls} calls, {region.seconds:.3f}s"]
+        if region.unprofiled:
+            lines.append(f"   ({region.unprofiled} concurrent calls timed but not profiled)")
+        if region.stats:
+            path = os.path.join(self.output_dir, f"{region.name}.prof")
+            region.stats.dump_stats(path)
+            lines.append(f"   Top {self.top} by cumulative time, total/own/calls (pstats: {path}):")
+            rows = sorted(((key, value[:4]) for key, value in region.stats.stats.items()),
+                          key=lambda item: item[1][3], reverse=True)
+            lines += self._format_functions(rows)
+        if region.in_command and command_stats:
+            command_stats.calc_callees()
+            callees = command_stats.all_callees.get(region.code_key, {})
+            lines.append(f"   {region.in_command} calls profiled in command.prof; top callees, total/own/calls:")
+            rows = sorted(((key, value[:4]) for key, value in callees.items()),
+                          key=lambda item: item[1][3], reverse=True)
+            lines += self._format_functions(rows)
+        if region.snapshot:
+            path = os.path.join(self.output_dir, f"{region.name}.snapshot")
+            before, after = region.snapshot
+            after = after.filter_traces(_IGNORED_FRAMES)
+            after.dump(path)
+            # Allocations made during the largest call and still alive at its end, its result included
+            statistics = (after.compare_to(before.filter_traces(_IGNORED_FRAMES), "lineno") if before
+                          else after.statistics("lineno"))
+            lines.append(f"   Peak traced memory {region.peak_bytes / 2**20:.1f} MiB; "
+                         f"top {self.top} live allocation sites (tracemalloc: {path}):")
+            for stat in statistics[:self.top]:
+                size = getattr(stat, "size_diff", stat.size)
+                if size <= 0:
+                    break
+                frame = stat.traceback[0]
+                lines.append(f"   {size / 2**20:9.2f} MiB {stat.count:>8}  "
+                             f"{os.path.basename(frame.filename)}:{frame.lineno}")
+        return lines
+
+
+def run_profiled(command: str, run, cpu: bool = False, mem: bool = False, output_dir: str = "profiles",
+                 top: int = 20, instrument: bool = True):
+    """Run `run()` and, when cpu or mem is set, profile it and print a summary to stderr"""
+    if not (cpu or mem):
+        return run()
+    profiler = Profiler(command, cpu=cpu, mem=mem, output_dir=output_dir, top=top)
+    if instrument:
+        profiler.instrument()
+    profiler.start()
+    try:
+        return run()
+    finally:
+        print(profiler.stop(), file=sys.stderr)
@@ -0,0 +1,255 @@
+import time
+import uuid
+import sqlite3
+import hashlib
+import logging
+import threading
+import contextlib
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+
+class RateLimiter:
+    """Token buckets for requests/min and tokens/min, shared by every process using the same SQLite file.
+
+    `limits` apply to all requests made with one API key, `models` add
+    per-model limits on top ({model: {"requestsPerMinute", "tokensPerMinute"}}).
+    Buckets hold up to one minute of capacity and refill continuously.
+
+    Interactive requests may use a bucket down to empty. Batch requests must
+    leave `interactive_reserve` of each bucket's capacity, and hold back
+    entirely while an interactive request in any process is waiting, so a user
+    at the GUI or CLI is served first. Time spent waiting is recorded per
+    priority and model.
+    """
+
+    def __init__(self, db_file: str = "rate_limits.db", limits: Optional[Dict] = None,
+                 models: Optional[Dict[str, Dict]] = None, api_key: Optional[str] = None,
+                 interactive_reserve: float = 0.2, poll_interval: float = 0.25):
+        self.db_file = db_file
+        self.limits = limits or {}
+        self.models = models or {}
+        # Buckets are named after a hash of the key, never the key itself
+        self.key_id = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+        self.interactive_reserve = interactive_reserve
+        self.poll_interval = poll_interval
+        # Requests made by this process; batch commands lower it, and threads can override it
+        self.priority = INTERACTIVE
+        self._thread = threading.local()
+        self._lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The shared database, opened on first use so processes without limits never create it"""
+        if self._conn is None:
+            with self._connect_lock:
+                if self._conn is None:
+                    # Autocommit mode; transactions are opened explicitly so bucket updates are atomic across processes
+                    conn = sqlite3.connect(self.db_file, timeout=60, isolation_level=None, check_same_thread=False)
+                    conn.row_factory = sqlite3.Row
+                    self._create_schema(conn)
+                    self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection) -> None:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                level REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS waiters (
+                id TEXT PRIMARY KEY,
+                expires REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS waits (
+                priority TEXT NOT NULL,
+                model TEXT NOT NULL,
+                requests INTEGER NOT NULL DEFAULT 0,
+                delayed INTEGER NOT NULL DEFAULT 0,
+                seconds REAL NOT NULL DEFAULT 0,
+                max_seconds REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (priority, model)
+            );
+        """)
+
+    @contextlib.contextmanager
+    def thread_priority(self, priority: str):
+        """Send this thread's requests at a priority, e.g. a GUI job queued next to interactive chat"""
+        previous = getattr(self._thread, "priority", None)
+        self._thread.priority = priority
+        try:
+            yield
+        finally:
+            self._thread.priority = previous
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.limits or self.models)
+
+    def _buckets(self, model: str) -> List[Tuple[str, float, str]]:
+        """(bucket name, capacity per minute, "requests" or "tokens") of the limits that apply to a model"""
+        scopes = [(self.key_id, self.limits)]
+        if model in self.models:
+            scopes.append((f"{self.key_id}:{model}", self.models[model]))
+        buckets = []
+        for scope, config in scopes:
+            for kind, setting in (("requests", "requestsPerMinute"), ("tokens", "tokensPerMinute")):
+                if config.get(setting):
+                    buckets.append((f"{scope}:{kind}", float(config[setting]), kind))
+        return buckets
+
+    def _level(self, name: str, capacity: float, now: float) -> float:
+        row = self.conn.execute("SELECT level, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return capacity
+        return min(capacity, row["level"] + (now - row["updated"]) * capacity / 60)
+
+    def _try_acquire(self, buckets, tokens: int, priority: str) -> float:
+        """Take from every bucket at once; returns 0 on success, else the seconds to wait"""
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if priority == BATCH and self.conn.execute(
+                    "SELECT 1 FROM waiters WHERE expires > ?", (now,)
+                ).fetchone():
+                    self.conn.execute("COMMIT")
+                    return self.poll_interval
+
+                wait, levels = 0.0, []
+                for name, capacity, kind in buckets:
+                    floor = capacity * self.interactive_reserve if priority == BATCH else 0.0
+                    # A request larger than the bucket waits for a full bucket instead of forever
+                    cost = min(1 if kind == "requests" else tokens, capacity - floor)
+                    level = self._level(name, capacity, now)
+                    if level - cost < floor:
+                        wait = max(wait, (cost + floor - level) * 60 / capacity)
+                    levels.append((name, level - cost))
+                if wait == 0:
+                    self.conn.executemany(
+                        "INSERT INTO buckets (name, level, updated) VALUES (?, ?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET level = excluded.level, updated = excluded.updated",
+                        [(name, level, now) for name, level in levels]
+                    )
+                self.conn.execute("COMMIT")
+                return wait
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _set_waiter(self, waiter_id: str, expires: Optional[float]) -> None:
+        with self._lock:
+            if expires is None:
+                self.conn.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+            else:
+                self.conn.execute(
+                    "INSERT INTO waiters (id, expires) VALUES (?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET expires = excluded.expires", (waiter_id, expires)
+                )
+
+    def _record_wait(self, priority: str, model: str, seconds: float, delayed: bool) -> None:
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO waits (priority, model, requests, delayed, seconds, max_seconds) VALUES (?, ?, 1, ?, ?, ?) "
+                "ON CONFLICT(priority, model) DO UPDATE SET requests = requests + 1, delayed = delayed + excluded.delayed, "
+                "seconds = seconds + excluded.seconds, max_seconds = MAX(max_seconds, excluded.max_seconds)",
+                (priority, model, int(delayed), seconds, seconds)
+            )
+
+    def acquire(self, model: str, tokens: int, priority: Optional[str] = None,
+                cancel_event: Optional[threading.Event] = None) -> Optional[float]:
+        """Wait until a request of about `tokens` tokens may be sent to `model`.
+
+        Returns the seconds waited, or None if the cancel event was set first.
+        """
+        buckets = self._buckets(model)
+        if not buckets:
+            return 0.0
+        priority = priority or getattr(self._thread, "priority", None) or self.priority
+        waiter_id = None
+        delayed = False
+        start = time.monotonic()
+        try:
+            while True:
+                wait = self._try_acquire(buckets, tokens, priority)
+                if wait == 0:
+                    break
+                delayed = True
+                if priority == INTERACTIVE:
+                    # Tell batch work in every process to hold back until this request is through
+                    waiter_id = waiter_id or uuid.uuid4().hex
+                    self._set_waiter(waiter_id, time.time() + wait + 5)
+                if cancel_event is not None:
+                    if cancel_event.wait(min(wait, 1.0)):
+                        return None
+                else:
+                    time.sleep(min(wait, 1.0))
+        finally:
+            if waiter_id:
+                self._set_waiter(waiter_id, None)
+        waited = time.monotonic() - start if delayed else 0.0
+        self._record_wait(priority, model, waited, delayed)
+        if delayed:
+            logger.info("Rate limit held a %s request to %s for %.2fs", priority, model, waited)
+        return waited
+
+    def settle(self, model: str, estimated_tokens: int, actual_tokens: int) -> None:
+        """Correct the token buckets once a request's real size is known"""
+        difference = actual_tokens - estimated_tokens
+        if not difference:
+            return
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for name, capacity, kind in self._buckets(model):
+                    if kind == "tokens":
+                        # May go negative: an underestimate is paid back before the next request
+                        level = self._level(name, capacity, now) - difference
+                        self.conn.execute(
+                            "INSERT INTO buckets (name, level, updated) VALUES (?, ?, ?) "
+                            "ON CONFLICT(name) DO UPDATE SET level = excluded.level, updated = excluded.updated",
+                            (name, min(capacity, level), now)
+                        )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def drain(self, model: str) -> None:
+        """Empty a model's request buckets after the API answered 429, so every process backs off"""
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT INTO buckets (name, level, updated) VALUES (?, 0, ?) "
+                "ON CONFLICT(name) DO UPDATE SET level = MIN(level, 0), updated = excluded.updated",
+                [(name, now) for name, _, kind in self._buckets(model) if kind == "requests"]
+            )
+
+    def get_status(self) -> Dict:
+        """Current bucket levels and accumulated waiting time per priority and model"""
+        now = time.time()
+        buckets = []
+        with self._lock:
+            for model in [None] + list(self.models):
+                for name, capacity, kind in self._buckets(model):
+                    if model is not None and not name.startswith(f"{self.key_id}:{model}:"):
+                        continue
+                    buckets.append({"model": model or "(all models)", "kind": kind,
+                                    "level": self._level(name, capacity, now), "capacity": capacity})
+            waits = [dict(row) for row in self.conn.execute(
+                "SELECT * FROM waits ORDER BY priority, seconds DESC"
+            )]
+        return {"buckets": buckets, "waits": waits}
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
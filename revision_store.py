@@ -0,0 +1,121 @@
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+
+def diff_sections(old: List[Dict], new: List[Dict], names: Optional[List[str]] = None) -> Dict:
+    """Compare the section hashes of two versions of a paper.
+
+    Sections are matched by name; `names` limits the comparison to the sections
+    a profile sends (front matter is always compared). Returns the changed,
+    added and removed sections of the new version and the share of its text
+    they hold.
+    """
+    def relevant(section):
+        return not names or section["name"] in names or section["name"] == "front_matter"
+
+    previous = {s["name"]: s for s in old if relevant(s)}
+    current = [s for s in new if relevant(s)]
+    changed = [s for s in current if s["name"] in previous and previous[s["name"]]["hash"] != s["hash"]]
+    added = [s for s in current if s["name"] not in previous]
+    removed = [s for name, s in previous.items() if name not in {c["name"] for c in current}]
+    total = sum(s["bytes"] for s in current)
+    return {
+        "changed": changed,
+        "added": added,
+        "removed": removed,
+        "changed_fraction": sum(s["bytes"] for s in changed + added) / total if total else 1.0
+    }
+
+
+class RevisionStore:
+    """Summaries of each version of a paper file with the section hashes they were made from.
+
+    Revisions are grouped by paper path and context (model, profile and prompt
+    template), so a replaced file can be diffed against the version summarized
+    before it, and older summaries remain available for comparison.
+    """
+
+    def __init__(self, db_file: str = "revisions.db", max_revisions: Optional[int] = 10):
+        self.db_file = db_file
+        self.max_revisions = max_revisions
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._create_schema()
+
+    def _create_schema(self) -> None:
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS revisions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    paper TEXT NOT NULL,
+                    context TEXT NOT NULL,
+                    document_hash TEXT NOT NULL,
+                    summary_key TEXT NOT NULL,
+                    profile TEXT,
+                    model TEXT,
+                    sections TEXT NOT NULL,
+                    changed TEXT,
+                    summary TEXT NOT NULL,
+                    created REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS revisions_paper ON revisions(paper, context, id);
+            """)
+
+    @staticmethod
+    def _row(row: Optional[sqlite3.Row]) -> Optional[Dict]:
+        if row is None:
+            return None
+        revision = dict(row)
+        revision["sections"] = json.loads(revision["sections"])
+        revision["changed"] = json.loads(revision["changed"]) if revision["changed"] is not None else None
+        return revision
+
+    def latest(self, paper: str, context: str) -> Optional[Dict]:
+        """Most recent revision of a paper in a context"""
+        with self._lock:
+            return self._row(self.conn.execute(
+                "SELECT * FROM revisions WHERE paper = ? AND context = ? ORDER BY id DESC LIMIT 1",
+                (paper, context)
+            ).fetchone())
+
+    def add(self, paper: str, context: str, document_hash: str, summary_key: str, sections: List[Dict],
+            summary: str, changed: Optional[List[str]] = None, profile: Optional[str] = None,
+            model: Optional[str] = None) -> int:
+        """Record a summarized version; `changed` lists the sections it was updated from, None if summarized in full"""
+        with self._lock, self.conn:
+            revision_id = self.conn.execute(
+                "INSERT INTO revisions (paper, context, document_hash, summary_key, profile, model, sections, "
+                "changed, summary, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (paper, context, document_hash, summary_key, profile, model, json.dumps(sections),
+                 json.dumps(changed) if changed is not None else None, summary, time.time())
+            ).lastrowid
+            if self.max_revisions:
+                self.conn.execute(
+                    "DELETE FROM revisions WHERE paper = ? AND context = ? AND id NOT IN "
+                    "(SELECT id FROM revisions WHERE paper = ? AND context = ? ORDER BY id DESC LIMIT ?)",
+                    (paper, context, paper, context, self.max_revisions)
+                )
+        return revision_id
+
+    def get(self, revision_id: int) -> Optional[Dict]:
+        with self._lock:
+            return self._row(self.conn.execute("SELECT * FROM revisions WHERE id = ?", (revision_id,)).fetchone())
+
+    def previous(self, revision: Dict) -> Optional[Dict]:
+        """The revision recorded before this one in the same context"""
+        with self._lock:
+            return self._row(self.conn.execute(
+                "SELECT * FROM revisions WHERE paper = ? AND context = ? AND id < ? ORDER BY id DESC LIMIT 1",
+                (revision["paper"], revision["context"], revision["id"])
+            ).fetchone())
+
+    def history(self, paper: str) -> List[Dict]:
+        """Every revision of a paper, newest first"""
+        with self._lock:
+            return [self._row(row) for row in self.conn.execute(
+                "SELECT * FROM revisions WHERE paper = ? ORDER BY id DESC", (paper,)
+            )]
@@ -0,0 +1,109 @@
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+# List fields of a structured summary, stored one row per item for querying
+LIST_FIELDS = ["findings", "methods", "limitations", "future_work"]
+
+
+class StructuredSummaryStore:
+    """Structured summary fields in SQLite so corpus-wide questions run locally"""
+
+    def __init__(self, db_file: str = "structured_summaries.db"):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._create_schema()
+
+    def _create_schema(self) -> None:
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS summaries (
+                    key TEXT PRIMARY KEY,
+                    paper TEXT,
+                    profile TEXT,
+                    model TEXT,
+                    sample_size INTEGER,
+                    summary TEXT,
+                    data TEXT NOT NULL,
+                    created REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS summaries_sample_size ON summaries(sample_size);
+                CREATE INDEX IF NOT EXISTS summaries_paper ON summaries(paper);
+                CREATE INDEX IF NOT EXISTS summaries_profile ON summaries(profile);
+                CREATE TABLE IF NOT EXISTS summary_items (
+                    key TEXT NOT NULL,
+                    field TEXT NOT NULL,
+                    item TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS summary_items_field ON summary_items(field, key);
+                CREATE INDEX IF NOT EXISTS summary_items_key ON summary_items(key);
+            """)
+
+    def save(self, key: str, data: Dict, paper: Optional[str] = None, profile: Optional[str] = None,
+             model: Optional[str] = None) -> None:
+        """Store the fields of a structured summary, replacing any previous version"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM summary_items WHERE key = ?", (key,))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, paper, profile, model, sample_size, summary, data, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, paper, profile, model, data.get("sample_size"), data.get("summary"), json.dumps(data), time.time())
+            )
+            self.conn.executemany(
+                "INSERT INTO summary_items (key, field, item) VALUES (?, ?, ?)",
+                [(key, field, item) for field in LIST_FIELDS for item in data.get(field, [])]
+            )
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Get the structured fields stored under a key"""
+        with self._lock:
+            row = self.conn.execute("SELECT data FROM summaries WHERE key = ?", (key,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def get_latest(self, paper: str, profile: Optional[str] = None) -> Optional[Dict]:
+        """Get the most recent structured fields stored for a paper"""
+        sql, params = "SELECT data FROM summaries WHERE paper = ?", [paper]
+        if profile:
+            sql += " AND profile = ?"
+            params.append(profile)
+        with self._lock:
+            row = self.conn.execute(sql + " ORDER BY created DESC LIMIT 1", params).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def query(self, min_sample_size: Optional[int] = None, max_sample_size: Optional[int] = None,
+              profile: Optional[str] = None) -> List[Dict]:
+        """Find summaries by sample size and profile"""
+        conditions, params = [], []
+        if min_sample_size is not None:
+            conditions.append("sample_size >= ?")
+            params.append(min_sample_size)
+        if max_sample_size is not None:
+            conditions.append("sample_size <= ?")
+            params.append(max_sample_size)
+        if profile:
+            conditions.append("profile = ?")
+            params.append(profile)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT key, paper, profile, model, sample_size FROM summaries {where} ORDER BY paper", params
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_items(self, field: str, profile: Optional[str] = None) -> List[Dict]:
+        """List every item of a field (e.g. all limitations) with its paper"""
+        if field not in LIST_FIELDS:
+            raise ValueError(f"Unknown field '{field}'")
+        sql = ("SELECT s.paper, s.profile, i.item FROM summary_items i JOIN summaries s ON s.key = i.key "
+               "WHERE i.field = ?")
+        params = [field]
+        if profile:
+            sql += " AND s.profile = ?"
+            params.append(profile)
+        with self._lock:
+            rows = self.conn.execute(sql + " ORDER BY s.paper", params).fetchall()
+        return [dict(row) for row in rows]
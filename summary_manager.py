@@ -1,43 +1,415 @@
 import json
 import os
+import time
+import zlib
+import base64
+import atexit
+import sqlite3
 import hashlib
-from typing import Optional, Dict
+import logging
+import functools
+import threading
+import contextlib
+from typing import Callable, Optional, Dict, Iterable, Iterator, List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (in days) of the age buckets reported by get_stats
+AGE_BUCKETS = [1, 7, 30, 365]
+
+# Prefix of structured keys; anything else is a legacy MD5 key
+KEY_VERSION = "v2"
+
+# Chunk size used when hashing paper files
+HASH_CHUNK_SIZE = 1 << 20
+
+# Entries read at a time by iter_entries
+ITER_PAGE_SIZE = 500
+
+@functools.lru_cache(maxsize=1024)
+def _hash_file_contents(file_path: str, size: int, mtime_ns: int) -> str:
+    """Hash a file without loading it into memory; size and mtime key the memo"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 
 class SummaryManager:
-    def __init__(self, summaries_file: str = "paper_summaries.json"):
-        self.summaries_file = summaries_file
-        self.summaries = self._load_summaries()
-
-    def _load_summaries(self) -> Dict:
-        """Load summaries from file"""
-        if not os.path.exists(self.summaries_file):
-            return {}
-        
+    """Compressed summaries in a SQLite file shared by every SciSift process.
+
+    Each change is a short transaction, so GUI, CLI and batch worker processes
+    can write to one store at once without losing each other's entries. Access
+    times and hit counters are kept in memory and written with the next change
+    or at exit.
+    """
+
+    def __init__(self, db_file: str = "paper_summaries.db", ttl: Optional[float] = None,
+                 max_bytes: Optional[int] = None, legacy_file: Optional[str] = "paper_summaries.json"):
+        self.db_file = db_file
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        # Autocommit mode; transactions are opened explicitly so changes are atomic across processes
+        self.conn = sqlite3.connect(db_file, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._create_schema()
+        self._legacy_remaining: Optional[bool] = None
+        self._accessed: Dict[str, float] = {}
+        self._counts = {"hits": 0, "misses": 0}
+        if legacy_file:
+            self._import_json(legacy_file)
+        atexit.register(self.flush)
+
+    def _create_schema(self) -> None:
+        with self._lock:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    profile TEXT,
+                    model TEXT,
+                    source TEXT,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL,
+                    ttl REAL,
+                    draft INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed);
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO counters (name, value) VALUES ('hits', 0), ('misses', 0);
+            """)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _import_json(self, json_file: str) -> None:
+        """Move the entries of the JSON file used before this store (either of its formats) into it"""
+        if not os.path.exists(json_file):
+            return
         try:
-            with open(self.summaries_file, 'r') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            return {}
-
-    def _save_summaries(self) -> None:
-        """Save summaries to file"""
-        with open(self.summaries_file, 'w') as f:
-            json.dump(self.summaries, f, indent=4)
-
-    def _generate_key(self, content: str, profile_name: Optional[str] = None) -> str:
-        """Generate a unique key for the paper content and profile"""
-        key_content = content
-        if profile_name:
-            key_content += profile_name
-        return hashlib.md5(key_content.encode()).hexdigest()
-
-    def get_summary(self, content: str, profile_name: Optional[str] = None) -> Optional[str]:
-        """Get existing summary for paper content and profile"""
-        key = self._generate_key(content, profile_name)
-        return self.summaries.get(key)
-
-    def save_summary(self, content: str, summary: str, profile_name: Optional[str] = None) -> None:
-        """Save summary for paper content and profile"""
-        key = self._generate_key(content, profile_name)
-        self.summaries[key] = summary
-        self._save_summaries() 
\ No newline at end of file
+            with open(json_file, 'r') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+
+        if data.get("version") == 2:
+            entries, stats = data["entries"], data["stats"]
+        else:
+            # Old format: {key: summary}
+            created = os.path.getmtime(json_file)
+            entries = {key: self._make_entry(summary, created=created) for key, summary in data.items()}
+            stats = {}
+        with self._transaction():
+            # Another process may have moved it while this one was reading
+            if not os.path.exists(json_file):
+                return
+            for key, entry in entries.items():
+                self._put(key, entry, replace=False)
+            for name, value in stats.items():
+                self.conn.execute("UPDATE counters SET value = value + ? WHERE name = ?", (value, name))
+            os.replace(json_file, json_file + ".migrated")
+        logger.info("Moved %d cached entries from %s to %s", len(entries), json_file, self.db_file)
+
+    def _put(self, key: str, entry: Dict, replace: bool = True) -> None:
+        self.conn.execute(
+            f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO entries "
+            "(key, summary, size, profile, model, source, created, accessed, ttl, draft) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, entry["summary"], entry["size"], entry.get("profile"), entry.get("model"), entry.get("source"),
+             entry["created"], entry.get("accessed", entry["created"]), entry.get("ttl"),
+             int(bool(entry.get("draft"))))
+        )
+
+    @staticmethod
+    def _entry(row: sqlite3.Row) -> Dict:
+        entry = dict(row)
+        entry.pop("key", None)
+        entry["draft"] = bool(entry["draft"])
+        return entry
+
+    def _get(self, key: str) -> Optional[Dict]:
+        row = self.conn.execute("SELECT * FROM entries WHERE key = ?", (key,)).fetchone()
+        return self._entry(row) if row else None
+
+    def _write_pending(self) -> None:
+        """Write buffered access times and counters; called inside a transaction"""
+        self.conn.executemany(
+            "UPDATE entries SET accessed = MAX(accessed, ?) WHERE key = ?",
+            [(accessed, key) for key, accessed in self._accessed.items()]
+        )
+        for name, value in self._counts.items():
+            if value:
+                self.conn.execute("UPDATE counters SET value = value + ? WHERE name = ?", (value, name))
+        self._accessed.clear()
+        self._counts = {"hits": 0, "misses": 0}
+
+    def flush(self) -> None:
+        """Write pending access times and statistics to disk"""
+        with self._lock:
+            if self._accessed or any(self._counts.values()):
+                with self._transaction():
+                    self._write_pending()
+
+    @staticmethod
+    def _compress(summary: str) -> str:
+        return base64.b64encode(zlib.compress(summary.encode('utf-8'), 9)).decode('ascii')
+
+    @staticmethod
+    def _decompress(data: str) -> str:
+        return zlib.decompress(base64.b64decode(data)).decode('utf-8')
+
+    def _make_entry(self, summary: str, profile_name: Optional[str] = None, model: Optional[str] = None,
+                    source: Optional[str] = None, ttl: Optional[float] = None,
+                    created: Optional[float] = None, draft: bool = False) -> Dict:
+        compressed = self._compress(summary)
+        created = created or time.time()
+        return {
+            "summary": compressed,
+            "size": len(compressed),
+            "profile": profile_name,
+            "model": model,
+            "source": source,
+            "created": created,
+            "accessed": created,
+            "ttl": ttl,
+            # Drafts are quick previews that a final summary replaces; entries without the flag are final
+            "draft": draft,
+        }
+
+    def _is_expired(self, entry: Dict, now: float) -> bool:
+        ttl = entry.get("ttl") or self.ttl
+        return bool(ttl) and now - entry["created"] > ttl
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the store fits max_bytes; called inside a transaction"""
+        if not self.max_bytes:
+            return
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for row in self.conn.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (row["key"],))
+            total -= row["size"]
+
+    @staticmethod
+    def hash_file(file_path: str) -> str:
+        """Hash the raw bytes of a file; an unchanged file is only read once per process"""
+        stat = os.stat(file_path)
+        return _hash_file_contents(os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        """Hash a short string such as a URL"""
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+    @staticmethod
+    def hash_profile(profile: Optional[Dict], template_version: Union[int, str]) -> str:
+        """Hash the profile content that shapes a summary, plus the prompt template version"""
+        content = {k: v for k, v in (profile or {}).items() if k != "selected"}
+        key_content = json.dumps([template_version, content], sort_keys=True)
+        return hashlib.blake2b(key_content.encode('utf-8'), digest_size=16).hexdigest()
+
+    def generate_key(self, document_hash: str, model: Optional[str], profile_hash: str) -> str:
+        """Generate a structured key for the document, model and profile"""
+        return f"{KEY_VERSION}:{document_hash}:{model or ''}:{profile_hash}"
+
+    @staticmethod
+    def legacy_keys(content: str, profile_name: Optional[str] = None, model: Optional[str] = None) -> List[str]:
+        """Keys used before structured keys, with and without the model"""
+        base = content + (profile_name or "")
+        keys = [hashlib.md5(base.encode()).hexdigest()]
+        if model:
+            keys.insert(0, hashlib.md5((base + model).encode()).hexdigest())
+        return keys
+
+    def _has_legacy_entries(self) -> bool:
+        if self._legacy_remaining is None:
+            prefix = KEY_VERSION + ":"
+            self._legacy_remaining = self.conn.execute(
+                "SELECT 1 FROM entries WHERE substr(key, 1, ?) != ? LIMIT 1", (len(prefix), prefix)
+            ).fetchone() is not None
+        return self._legacy_remaining
+
+    def _migrate(self, key: str, legacy_keys: Callable[[], List[str]]) -> Optional[Dict]:
+        """Move a legacy entry matching this lookup to its structured key"""
+        if not self._has_legacy_entries():
+            return None
+        for legacy_key in legacy_keys():
+            if self.conn.execute("UPDATE OR IGNORE entries SET key = ? WHERE key = ?", (key, legacy_key)).rowcount:
+                self._legacy_remaining = None
+                return self._get(key)
+        return None
+
+    def has_summary(self, key: str) -> bool:
+        """Whether a live final summary exists, without counting a hit or miss"""
+        with self._lock:
+            entry = self._get(key)
+        return entry is not None and not entry["draft"] and not self._is_expired(entry, time.time())
+
+    def get_draft(self, key: str) -> Optional[str]:
+        """The live draft stored under a key, if the final summary is not there yet"""
+        with self._lock:
+            entry = self._get(key)
+        if entry is None or not entry["draft"] or self._is_expired(entry, time.time()):
+            return None
+        return self._decompress(entry["summary"])
+
+    def get_summary(self, key: str, legacy_keys: Optional[Callable[[], List[str]]] = None) -> Optional[str]:
+        """Get existing summary for a key.
+
+        legacy_keys is only called when the key misses and old entries remain,
+        so large contents are hashed at most once per paper during migration.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._get(key)
+            if not entry and legacy_keys:
+                entry = self._migrate(key, legacy_keys)
+            if entry and self._is_expired(entry, now):
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                entry = None
+            # A draft does not answer a request for the summary
+            if entry and entry["draft"]:
+                entry = None
+            if not entry:
+                self._counts["misses"] += 1
+                return None
+            self._counts["hits"] += 1
+            self._accessed[key] = now
+        return self._decompress(entry["summary"])
+
+    def save_summary(self, key: str, summary: str, profile_name: Optional[str] = None, model: Optional[str] = None,
+                     source: Optional[str] = None, ttl: Optional[float] = None, draft: bool = False) -> None:
+        """Save summary under a key; a draft never replaces a final summary"""
+        entry = self._make_entry(summary, profile_name, model, source, ttl, draft=draft)
+        with self._transaction():
+            if draft and self.has_summary(key):
+                return
+            self._put(key, entry)
+            self._write_pending()
+            self._evict()
+
+    def iter_entries(self) -> Iterator[Tuple[str, Dict]]:
+        """Yield (key, entry) for every live final summary, e.g. to export them; drafts stay local"""
+        now = time.time()
+        last = 0
+        while True:
+            # Read a page at a time by rowid, so the store is neither loaded whole nor locked while consumers work
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT rowid, * FROM entries WHERE draft = 0 AND rowid > ? ORDER BY rowid LIMIT ?",
+                    (last, ITER_PAGE_SIZE)
+                ).fetchall()
+            if not rows:
+                return
+            last = rows[-1]["rowid"]
+            for row in rows:
+                entry = self._entry(row)
+                entry.pop("rowid", None)
+                if not self._is_expired(entry, now):
+                    yield row["key"], entry
+
+    def has_entry(self, key: str) -> bool:
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is not None
+
+    def merge_entries(self, entries: Iterable[Tuple[str, Dict]]) -> int:
+        """Add entries exported from another store, keeping the newer of two entries with one key.
+
+        Expired entries are skipped; returns how many entries were added or replaced.
+        """
+        now = time.time()
+        merged = 0
+        with self._transaction():
+            for key, entry in entries:
+                if self._is_expired(entry, now):
+                    continue
+                existing = self._get(key)
+                # A final summary wins over a draft, then the newer entry
+                if existing and (not existing["draft"], existing["created"]) >= \
+                        (not entry.get("draft"), entry["created"]):
+                    continue
+                self._put(key, dict(entry, accessed=now))
+                merged += 1
+            if merged:
+                self._legacy_remaining = None
+                self._evict()
+        return merged
+
+    def get_stats(self) -> Dict:
+        """Get entry count, size, hit ratio and age distribution of the cache"""
+        now = time.time()
+        with self._lock:
+            entries = [dict(row) for row in self.conn.execute("SELECT size, created, ttl, draft FROM entries")]
+            counters = {row["name"]: row["value"] for row in self.conn.execute("SELECT name, value FROM counters")}
+            hits = counters.get("hits", 0) + self._counts["hits"]
+            misses = counters.get("misses", 0) + self._counts["misses"]
+
+        ages = {f"<{days}d": 0 for days in AGE_BUCKETS}
+        ages[f">={AGE_BUCKETS[-1]}d"] = 0
+        for entry in entries:
+            age_days = (now - entry["created"]) / 86400
+            bucket = next((f"<{d}d" for d in AGE_BUCKETS if age_days < d), f">={AGE_BUCKETS[-1]}d")
+            ages[bucket] += 1
+
+        return {
+            "entries": len(entries),
+            "compressed_bytes": sum(e["size"] for e in entries),
+            "file_bytes": os.path.getsize(self.db_file) if os.path.exists(self.db_file) else 0,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            "expired": sum(1 for e in entries if self._is_expired(e, now)),
+            "drafts": sum(1 for e in entries if e["draft"]),
+            "ages": ages,
+        }
+
+    def _delete_where(self, is_stale: Callable[[Dict], bool]) -> int:
+        with self._transaction():
+            stale = [(row["key"],) for row in self.conn.execute(
+                "SELECT key, profile, source, created, ttl FROM entries"
+            ).fetchall() if is_stale(dict(row))]
+            self.conn.executemany("DELETE FROM entries WHERE key = ?", stale)
+        return len(stale)
+
+    def expire(self) -> int:
+        """Remove expired entries; returns how many were removed"""
+        now = time.time()
+        return self._delete_where(lambda entry: self._is_expired(entry, now))
+
+    def collect_garbage(self, profile_names: List[str]) -> int:
+        """Remove expired entries and those for deleted profiles or missing local papers"""
+        now = time.time()
+
+        def is_stale(entry):
+            profile = entry.get("profile")
+            source = entry.get("source")
+            return (self._is_expired(entry, now)
+                    or bool(profile and profile not in profile_names)
+                    or bool(source and "://" not in source and not os.path.exists(source)))
+
+        return self._delete_where(is_stale)
+
+    def clear(self) -> None:
+        """Remove every entry and reset statistics"""
+        with self._transaction():
+            self.conn.execute("DELETE FROM entries")
+            self.conn.execute("UPDATE counters SET value = 0")
+            self._accessed.clear()
+            self._counts = {"hits": 0, "misses": 0}
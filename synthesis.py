@@ -0,0 +1,139 @@
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from ai_service import (
+    chat_with_ai, explain_paper, summary_manager, PROMPT_TEMPLATE_VERSION, get_profile, route_model
+)
+
+# Bump when the reduction prompts change
+SYNTHESIS_TEMPLATE_VERSION = f"{PROMPT_TEMPLATE_VERSION}-synthesis-1"
+
+GROUP_PROMPT = """Below are summaries of {count} scientific papers. Merge them into one comparative digest: \
+group related findings, note agreements and contradictions, compare methods and sample sizes, \
+and keep each claim attributed to its paper by name.
+
+{summaries}"""
+
+REVIEW_PROMPT = """Below are summaries and comparative digests covering {count} scientific papers. \
+Write a comparative literature review of all of them: the common themes, how the methods and results \
+compare, where the papers agree or disagree, open questions, and how they fit together. \
+Attribute claims to papers by name.
+
+{summaries}"""
+
+
+def _node_hash(child_hashes):
+    """Hash of a reduction node from its children, independent of their order"""
+    return hashlib.blake2b("|".join(sorted(child_hashes)).encode(), digest_size=16).hexdigest()
+
+
+def _group(nodes, group_size):
+    """Split nodes into groups at content-defined boundaries.
+
+    Nodes are ordered by hash and a group closes after any node whose hash
+    falls on a boundary, so adding one paper only changes the group it lands
+    in rather than shifting every later group.
+    """
+    groups, current = [], []
+    for node in sorted(nodes, key=lambda n: n["hash"]):
+        current.append(node)
+        if int(node["hash"][:8], 16) % group_size == 0 or len(current) >= 2 * group_size:
+            groups.append(current)
+            current = []
+    if current:
+        groups.append(current)
+
+    # Without any multi-node group the level would never shrink; fall back to fixed chunks
+    if len(groups) == len(nodes):
+        ordered = sorted(nodes, key=lambda n: n["hash"])
+        groups = [ordered[i:i + group_size] for i in range(0, len(ordered), group_size)]
+    return groups
+
+
+def _reduce(nodes, prompt, model, profile, final):
+    """Reduce a group of nodes with one (cached) model call"""
+    node_hash = _node_hash(n["hash"] for n in nodes)
+    papers = [paper for n in nodes for paper in n["papers"]]
+    summaries = "\n\n".join(f"### {', '.join(n['papers'])}\n{n['summary']}" for n in nodes)
+    message = prompt.format(count=len(papers), summaries=summaries)
+    model = model or route_model(message, profile)
+    template_version = f"{SYNTHESIS_TEMPLATE_VERSION}-{'final' if final else 'group'}"
+    key = summary_manager.generate_key(
+        node_hash, model, summary_manager.hash_profile(profile, template_version)
+    )
+    summary = summary_manager.get_summary(key)
+    if not summary:
+        summary = chat_with_ai(
+            message, model=model, use_profile=True, profile_name=profile['name'] if profile else None,
+            cache=False
+        )
+        if summary.startswith("Error:"):
+            raise RuntimeError(summary[len("Error: "):])
+        summary_manager.save_summary(key, summary, profile['name'] if profile else None, model)
+    return {"hash": node_hash, "papers": papers, "summary": summary}
+
+
+def synthesize_papers(paper_paths, model=None, profile_name=None, group_size=5, max_workers=4, on_progress=None):
+    """Write a comparative review of several papers by reducing their summaries hierarchically.
+
+    Per-paper summaries come from the summary cache when available and are
+    generated concurrently otherwise. Every intermediate reduction is cached,
+    so adding a paper only recomputes the branch it falls into.
+    """
+    # Groups of one paper would never shrink a level
+    if group_size < 2:
+        return "Error: The group size must be at least 2"
+    profile = get_profile(profile_name)
+    if profile_name and not profile:
+        return f"Error: Profile '{profile_name}' not found"
+    profile_name = profile['name'] if profile else None
+    if not paper_paths:
+        return "Error: No papers to synthesize"
+
+    def summarize(paper_path):
+        try:
+            return explain_paper("file", paper_path=paper_path, model=model, profile_name=profile_name)
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        summaries = list(executor.map(summarize, paper_paths))
+
+    nodes, failed = [], []
+    for paper_path, summary in zip(paper_paths, summaries):
+        if not summary or summary.startswith("Error:"):
+            failed.append(f"{paper_path}: {summary}")
+            continue
+        name = os.path.basename(paper_path)
+        nodes.append({
+            # The text sent up the tree, so a summary made with another model or profile,
+            # or with new graph readings, gives new digests rather than stale ones
+            "hash": summary_manager.hash_text(f"{name}\n{summary}"),
+            "papers": [name],
+            "summary": summary,
+        })
+    if not nodes:
+        return "Error: No paper could be summarized\n" + "\n".join(failed)
+    if on_progress:
+        on_progress(f"Summarized {len(nodes)} papers ({len(failed)} failed)")
+
+    # Reduce level by level until one group is small enough for the final review
+    try:
+        level = 1
+        while len(nodes) > group_size:
+            groups = _group(nodes, group_size)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                nodes = list(executor.map(
+                    lambda group: group[0] if len(group) == 1 else _reduce(group, GROUP_PROMPT, model, profile, False),
+                    groups
+                ))
+            if on_progress:
+                on_progress(f"Level {level}: reduced to {len(nodes)} digests")
+            level += 1
+
+        review = _reduce(nodes, REVIEW_PROMPT, model, profile, True)["summary"]
+    except Exception as e:
+        return f"Error: Synthesis failed: {str(e)}"
+    if failed:
+        review += "\n\nPapers left out because they could not be summarized:\n" + "\n".join(f"- {f}" for f in failed)
+    return review
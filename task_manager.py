@@ -0,0 +1,161 @@
+import queue
+import threading
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class TaskCancelled(Exception):
+    """Raised inside a task when it notices it has been cancelled"""
+
+
+class Task:
+    def __init__(self, task_id: int, name: str, events: "queue.Queue", background: bool = True):
+        self.id = task_id
+        self.name = name
+        self.background = background
+        self.status = "queued"
+        self.progress = 0.0
+        self.message = "Queued"
+        self.result = None
+        self.cancel_event = threading.Event()
+        self._events = events
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def report(self, message: str, progress: Optional[float] = None) -> None:
+        """Report progress from the worker thread; raises if the task was cancelled"""
+        if self.cancelled:
+            raise TaskCancelled()
+        self._events.put(("progress", self, message, progress))
+
+
+class TaskManager:
+    """Runs jobs on a bounded worker pool and hands results back through a queue.
+
+    Workers never touch the UI. The owner drains events with poll(), e.g. from
+    Tk's root.after loop, so all callbacks run on the caller's thread.
+    Background jobs are limited to max_background at a time; the remaining
+    workers are kept free for interactive jobs such as chat messages.
+    """
+
+    def __init__(self, max_background: int = 3, interactive_workers: int = 1):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_background + interactive_workers,
+            thread_name_prefix="scisift-task"
+        )
+        self.max_background = max_background
+        self.events: "queue.Queue" = queue.Queue()
+        self.tasks: Dict[int, Task] = {}
+        self._callbacks: Dict[int, Tuple[Optional[Callable], Optional[Callable]]] = {}
+        self._pending: deque = deque()
+        self._running_background = 0
+        self._dispatched = set()
+        self._ids = itertools.count(1)
+
+    def submit(self, name: str, func: Callable[[Task], object],
+               on_done: Optional[Callable] = None, on_error: Optional[Callable] = None,
+               background: bool = True) -> Task:
+        """Queue func(task) to run on the pool"""
+        task = Task(next(self._ids), name, self.events, background)
+        self.tasks[task.id] = task
+        self._callbacks[task.id] = (on_done, on_error)
+        if background:
+            self._pending.append((task, func))
+            self._dispatch()
+        else:
+            self.executor.submit(self._run, task, func)
+        return task
+
+    def _dispatch(self) -> None:
+        """Start pending background jobs while there is capacity"""
+        while self._pending and self._running_background < self.max_background:
+            task, func = self._pending.popleft()
+            self._running_background += 1
+            self._dispatched.add(task.id)
+            self.executor.submit(self._run, task, func)
+
+    def _run(self, task: Task, func: Callable[[Task], object]) -> None:
+        if task.cancelled:
+            self.events.put(("cancelled", task, None, None))
+            return
+        self.events.put(("started", task, "Running", None))
+        try:
+            result = func(task)
+        except TaskCancelled:
+            self.events.put(("cancelled", task, None, None))
+        except Exception as e:
+            if task.cancelled:
+                self.events.put(("cancelled", task, None, None))
+            else:
+                self.events.put(("error", task, e, None))
+        else:
+            self.events.put(("done", task, result, None))
+
+    def cancel(self, task_id: int) -> None:
+        """Ask a task to stop; queued tasks never start and running ones abort at the next check"""
+        task = self.tasks.get(task_id)
+        if not task or task.status not in ("queued", "running"):
+            return
+        task.cancel_event.set()
+        for entry in self._pending:
+            if entry[0] is task:
+                self._pending.remove(entry)
+                self.events.put(("cancelled", task, None, None))
+                break
+
+    def active_count(self) -> int:
+        """Number of queued or running tasks"""
+        return sum(1 for t in self.tasks.values() if t.status in ("queued", "running"))
+
+    def poll(self) -> List[Task]:
+        """Apply pending events and run callbacks; returns the tasks that changed"""
+        changed = []
+        while True:
+            try:
+                kind, task, value, progress = self.events.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == "started":
+                task.status, task.message = "running", value
+            elif kind == "progress":
+                task.message = value
+                if progress is not None:
+                    task.progress = progress
+            else:
+                on_done, on_error = self._callbacks.pop(task.id, (None, None))
+                if kind == "done":
+                    task.status, task.message, task.progress, task.result = "done", "Done", 1.0, value
+                    if on_done:
+                        on_done(task, value)
+                elif kind == "error":
+                    task.status, task.message = "error", f"Failed: {value}"
+                    if on_error:
+                        on_error(task, value)
+                else:
+                    task.status, task.message = "cancelled", "Cancelled"
+                # Free the slot of a finished background job for the next one
+                if task.id in self._dispatched:
+                    self._dispatched.discard(task.id)
+                    self._running_background -= 1
+                    self._dispatch()
+            if task not in changed:
+                changed.append(task)
+        return changed
+
+    def remove_finished(self) -> List[int]:
+        """Forget tasks that are no longer queued or running"""
+        finished = [t.id for t in self.tasks.values() if t.status not in ("queued", "running")]
+        for task_id in finished:
+            del self.tasks[task_id]
+        return finished
+
+    def shutdown(self) -> None:
+        """Cancel everything and stop the pool without waiting for running requests"""
+        for task in self.tasks.values():
+            task.cancel_event.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,18 @@
+import os
+import sys
+import shutil
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules live at the top of the repository
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """A working directory with a copy of settings.json, so the stores ai_service opens stay out of the tree"""
+    shutil.copy(os.path.join(ROOT, "settings.json"), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
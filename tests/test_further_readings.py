@@ -0,0 +1,58 @@
+"""Further readings from the citation graph instead of the model"""
+from types import SimpleNamespace
+
+import pytest
+
+PROFILE = "Undergraduate Student"
+
+WITH_REFERENCES = """A Study of Things
+
+Abstract
+We study things in depth and report results.
+
+Introduction
+Things matter a great deal to many people.
+
+References
+[1] Smith, J. A Survey of Related Things. Journal of Things, 2019.
+[2] Doe, A. Methods for Measuring Things. Proceedings of Things, 2020.
+"""
+
+WITHOUT_REFERENCES = """A Note on Stuff
+
+We discuss stuff without citing anyone.
+Stuff is interesting.
+"""
+
+
+@pytest.fixture
+def prompts(workdir, monkeypatch):
+    import ai_service
+    sent = []
+
+    def create_completion(model, messages, cancel_event, on_progress):
+        sent.append("".join(part["text"] for part in messages[-1]["content"]))
+        return "Summary.", SimpleNamespace(prompt_tokens=10, completion_tokens=5, prompt_tokens_details=None)
+
+    monkeypatch.setattr(ai_service, "_create_completion", create_completion)
+    # Model statistics are written at exit, after the working directory is restored
+    monkeypatch.setattr(ai_service.model_router, "record", lambda *args, **kwargs: None)
+    return sent
+
+
+def _explain(workdir, name, text):
+    from ai_service import explain_paper
+    path = workdir / name
+    path.write_text(text)
+    return explain_paper("file", paper_path=str(path), model="model", profile_name=PROFILE)
+
+
+def test_paper_without_references_keeps_the_model_readings(workdir, prompts):
+    assert _explain(workdir, "plain.txt", WITHOUT_REFERENCES) == "Summary."
+    assert "further readings" in prompts[-1].lower()
+
+
+def test_paper_with_references_gets_graph_readings(workdir, prompts):
+    summary = _explain(workdir, "cited.txt", WITH_REFERENCES)
+    assert "further readings" not in prompts[-1].lower()
+    assert "A Survey of Related Things" in summary
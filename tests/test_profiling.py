@@ -0,0 +1,12 @@
+"""Profiling hooks of `--profile-cpu` and `--profile-mem`"""
+from profiling import Profiler, REGIONS
+
+
+def test_every_region_is_instrumented(workdir):
+    profiler = Profiler("test", cpu=True, output_dir=str(workdir / "profiles"))
+    profiler.instrument()
+    try:
+        # A region whose function was renamed or removed is skipped, which would show here
+        assert len(profiler._restore) == len(REGIONS)
+    finally:
+        profiler.stop()
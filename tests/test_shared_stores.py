@@ -0,0 +1,150 @@
+"""Stores written by several SciSift processes at once (GUI, CLI and batch workers)"""
+import json
+import time
+import multiprocessing
+
+import pytest
+
+from summary_manager import SummaryManager
+from model_router import ModelRouter
+from usage_ledger import UsageLedger, BudgetExceeded
+from job_store import JobStore
+
+PROCESSES = 4
+ENTRIES_PER_PROCESS = 50
+
+
+def _write_summaries(db_file, worker):
+    store = SummaryManager(db_file, legacy_file=None)
+    for i in range(ENTRIES_PER_PROCESS):
+        key = f"v2:{worker}-{i}:model:profile"
+        store.save_summary(key, f"summary {worker} {i}", source=f"paper-{worker}-{i}.pdf")
+        assert store.get_summary(key) == f"summary {worker} {i}"
+    store.flush()
+
+
+def _record_requests(stats_file, calls):
+    router = ModelRouter(stats_file=stats_file)
+    for _ in range(calls):
+        router.record("model", 1.0)
+    router.flush()
+
+
+def _lease_all(db_file, worker, results_file):
+    """Lease and complete jobs until none are left, recording the ids this worker took"""
+    store = JobStore(db_file)
+    leased = []
+    while True:
+        job = store.lease(worker, lease_seconds=60)
+        if job is None:
+            break
+        leased.append(job["id"])
+        assert store.complete(job["id"], worker, f"summary by {worker}")
+    with open(results_file, "w") as f:
+        json.dump(leased, f)
+
+
+def _lease_and_die(db_file, worker):
+    """Take a job with a short lease and exit without finishing it, like a crashed worker"""
+    assert JobStore(db_file).lease(worker, lease_seconds=0.1) is not None
+
+
+def _run(target, args_list):
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=target, args=args) for args in args_list]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+
+def test_concurrent_writers_keep_every_summary(tmp_path):
+    db_file = str(tmp_path / "summaries.db")
+    _run(_write_summaries, [(db_file, worker) for worker in range(PROCESSES)])
+
+    store = SummaryManager(db_file, legacy_file=None)
+    keys = {key for key, _ in store.iter_entries()}
+    assert len(keys) == PROCESSES * ENTRIES_PER_PROCESS
+    stats = store.get_stats()
+    assert stats["hits"] == PROCESSES * ENTRIES_PER_PROCESS
+    assert store.get_summary(f"v2:{PROCESSES - 1}-0:model:profile") == f"summary {PROCESSES - 1} 0"
+
+
+def test_concurrent_writers_keep_every_model_observation(tmp_path):
+    stats_file = str(tmp_path / "model_stats.json")
+    _run(_record_requests, [(stats_file, 25) for _ in range(PROCESSES)])
+
+    with open(stats_file) as f:
+        assert json.load(f)["model"]["calls"] == PROCESSES * 25
+
+
+def test_json_store_is_moved_into_sqlite(tmp_path):
+    json_file = tmp_path / "paper_summaries.json"
+    entry = SummaryManager(str(tmp_path / "old.db"), legacy_file=None)._make_entry("old summary")
+    json_file.write_text(json.dumps({"version": 2, "stats": {"hits": 3, "misses": 1},
+                                     "entries": {"v2:doc:model:profile": entry}}))
+
+    store = SummaryManager(str(tmp_path / "paper_summaries.db"), legacy_file=str(json_file))
+    assert store.get_summary("v2:doc:model:profile") == "old summary"
+    assert store.get_stats()["hits"] == 4
+    assert not json_file.exists()
+
+
+def test_budget_counts_spend_of_other_processes(tmp_path):
+    ledger_file = str(tmp_path / "usage_ledger.jsonl")
+    pricing = {"model": {"prompt": 1_000_000, "completion": 0}}
+    budgets = {"dailyCost": 10.0}
+    # Each ledger stands for a separate process appending to the same file
+    gui = UsageLedger(ledger_file, pricing, budgets)
+    worker = UsageLedger(ledger_file, pricing, budgets)
+
+    worker.record("model", 6, 0)
+    gui.check_budget()
+    worker.record("model", 6, 0)
+    with pytest.raises(BudgetExceeded):
+        gui.check_budget()
+
+
+def test_concurrent_workers_never_lease_a_job_twice(tmp_path):
+    db_file = str(tmp_path / "jobs.db")
+    ids = JobStore(db_file).enqueue("file", [f"paper-{i}.pdf" for i in range(100)])
+    results = [str(tmp_path / f"worker-{worker}.json") for worker in range(PROCESSES)]
+    _run(_lease_all, [(db_file, f"worker-{worker}", results[worker]) for worker in range(PROCESSES)])
+
+    leased = [job_id for path in results for job_id in json.load(open(path))]
+    assert sorted(leased) == ids
+    assert JobStore(db_file).get_counts() == {"done": 100}
+
+
+def test_expired_lease_is_taken_by_another_worker(tmp_path):
+    db_file = str(tmp_path / "jobs.db")
+    [job_id] = JobStore(db_file).enqueue("file", ["paper.pdf"])
+    _run(_lease_and_die, [(db_file, "crashed")])
+    time.sleep(0.2)
+
+    results = str(tmp_path / "rescuer.json")
+    _run(_lease_all, [(db_file, "rescuer", results)])
+    assert json.load(open(results)) == [job_id]
+    [job] = JobStore(db_file).iter_jobs()
+    assert (job["status"], job["worker"], job["attempts"]) == ("done", "rescuer", 2)
+
+
+def test_job_fails_after_the_maximum_attempts(tmp_path):
+    db_file = str(tmp_path / "jobs.db")
+    store = JobStore(db_file, max_attempts=2)
+    # Every worker that takes this job dies before finishing it
+    [crashing] = store.enqueue("file", ["crashing.pdf"])
+    for attempt in range(2):
+        _run(_lease_and_die, [(db_file, f"crashed-{attempt}")])
+        time.sleep(0.2)
+    # This one keeps failing in the worker
+    [failing] = store.enqueue("file", ["failing.pdf"])
+    for _ in range(2):
+        job = store.lease("worker", lease_seconds=60)
+        assert job["id"] == failing
+        store.fail(job["id"], "worker", "extraction failed")
+
+    assert store.lease("worker", lease_seconds=60) is None
+    failed = {job["id"]: job["error"] for job in store.iter_jobs("failed")}
+    assert failed == {crashing: "lease expired too many times", failing: "extraction failed"}
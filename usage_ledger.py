@@ -0,0 +1,140 @@
+import json
+import os
+import time
+import threading
+from datetime import date, datetime
+from typing import Dict, Iterator, Optional
+
+# Rough completion size used for estimates when a profile sets no word limit
+DEFAULT_COMPLETION_TOKENS = 1500
+
+
+class BudgetExceeded(Exception):
+    """Raised when a configured budget refuses further requests"""
+
+
+class UsageLedger:
+    def __init__(self, ledger_file: str = "usage_ledger.jsonl", pricing: Optional[Dict] = None,
+                 budgets: Optional[Dict] = None):
+        self.ledger_file = ledger_file
+        self.pricing = pricing or {}
+        self.budgets = budgets or {}
+        self._lock = threading.Lock()
+        # Today's spend per profile ("" for requests without one), for budget checks. Every
+        # process appends to the same ledger, so the spend is read back from it, not counted here
+        self._today = date.today().isoformat()
+        self._today_costs: Dict[str, float] = {}
+        self._offset = 0
+        with self._lock:
+            self._refresh_today_costs()
+
+    def _iter_records(self) -> Iterator[Dict]:
+        """Stream ledger records from file"""
+        if not os.path.exists(self.ledger_file):
+            return
+        with open(self.ledger_file, 'r') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def _refresh_today_costs(self) -> None:
+        """Add today's records appended to the ledger since the last call, by any process"""
+        today = date.today().isoformat()
+        if today != self._today:
+            self._today, self._today_costs = today, {}
+        if not os.path.exists(self.ledger_file):
+            return
+        if os.path.getsize(self.ledger_file) < self._offset:
+            # The ledger was truncated or replaced; count it again
+            self._offset, self._today_costs = 0, {}
+        with open(self.ledger_file, 'rb') as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Still being written by another process
+                    break
+                self._offset += len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("day") == self._today:
+                    profile = record.get("profile") or ""
+                    self._today_costs[profile] = self._today_costs.get(profile, 0.0) + record["cost"]
+
+    def estimate_cost(self, model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+        """Estimate the cost in dollars from per-million-token prices"""
+        prices = self.pricing.get(model, {})
+        prompt_price = prices.get("prompt", 0.0)
+        cached_price = prices.get("cached", prompt_price)
+        return (
+            (prompt_tokens - cached_tokens) * prompt_price
+            + cached_tokens * cached_price
+            + completion_tokens * prices.get("completion", 0.0)
+        ) / 1_000_000
+
+    def record(self, model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0,
+               latency: float = 0.0, profile: Optional[str] = None, paper: Optional[str] = None) -> Dict:
+        """Append one request to the ledger"""
+        cost = self.estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+        now = datetime.now()
+        record = {
+            "time": now.isoformat(timespec="seconds"),
+            "day": now.date().isoformat(),
+            "model": model,
+            "profile": profile,
+            "paper": paper,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "latency": round(latency, 3),
+            "cost": cost,
+        }
+        with self._lock:
+            with open(self.ledger_file, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+        return record
+
+    def rollup(self, by: str = "profile") -> Dict[str, Dict]:
+        """Total tokens and cost grouped by profile, day, paper or model"""
+        totals: Dict[str, Dict] = {}
+        for record in self._iter_records():
+            group = totals.setdefault(str(record.get(by) or "-"), {
+                "requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "cost": 0.0
+            })
+            group["requests"] += 1
+            for field in ("prompt_tokens", "completion_tokens", "cached_tokens", "cost"):
+                group[field] += record.get(field, 0)
+        return totals
+
+    def _remaining(self, profile: Optional[str]) -> Optional[float]:
+        """Dollars left today under the tightest applicable budget, or None if unlimited"""
+        limits = []
+        if self.budgets.get("dailyCost") is not None:
+            limits.append(self.budgets["dailyCost"] - sum(self._today_costs.values()))
+        profile_budget = self.budgets.get("profiles", {}).get(profile or "", {})
+        if profile_budget.get("dailyCost") is not None:
+            limits.append(profile_budget["dailyCost"] - self._today_costs.get(profile or "", 0.0))
+        return min(limits) if limits else None
+
+    def check_budget(self, profile: Optional[str] = None, cancel_event: Optional[threading.Event] = None) -> bool:
+        """Refuse or queue a request once today's budget is spent.
+
+        Throttled requests wait, re-checking every `throttleSeconds`, until the
+        budget has room again. Returns False if cancel_event is set while waiting.
+        """
+        while True:
+            with self._lock:
+                self._refresh_today_costs()
+                remaining = self._remaining(profile)
+            if remaining is None or remaining > 0:
+                return True
+            if self.budgets.get("action", "refuse") != "throttle":
+                raise BudgetExceeded(f"Daily budget exceeded for {profile or 'all requests'}")
+            delay = self.budgets.get("throttleSeconds", 30)
+            if cancel_event is None:
+                time.sleep(delay)
+            elif cancel_event.wait(delay):
+                return False